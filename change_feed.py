@@ -0,0 +1,144 @@
+"""
+Cross-worker change feed over Postgres LISTEN/NOTIFY.
+
+Repository write methods call publish() after committing. The event is
+dispatched to this worker's subscribers at once and NOTIFYed on one channel
+as a compact JSON payload (table, op, id, plus optional data); every other
+worker's listener task (started in main.lifespan) dispatches it to its own
+subscribers. In-process caches subscribe per table instead of running their
+own LISTEN connections.
+
+NOTIFYs sent while a listener is disconnected are lost, so subscribers also
+register a resync callback that runs after every (re)subscribe.
+
+A session marked with defer() holds its local events back instead: the
+caller owns an outer transaction (see routes/batch) and dispatches them
+itself once that commits, so a rolled-back write is never announced.
+"""
+import asyncio
+import inspect
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import database
+import metrics
+
+CHANGE_FEED_ENABLED = os.getenv("CHANGE_FEED_ENABLED", "true").lower() == "true"
+CHANGE_FEED_CHANNEL = "pawnshop_changes"
+# Marks this process's own NOTIFYs; PIDs repeat across containers and hosts
+ORIGIN = uuid.uuid4().hex
+
+@dataclass(slots=True)
+class ChangeEvent:
+    table: str
+    op: str
+    id: int
+    data: dict = field(default_factory=dict)
+
+_subscribers: Dict[str, List[Callable[[ChangeEvent], None]]] = {}
+_resync_callbacks: List[Callable] = []
+_published = metrics.counter("change_feed_events_total", "Change events by origin", {"origin": "local"})
+_received = metrics.counter("change_feed_events_total", "Change events by origin", {"origin": "remote"})
+
+def subscribe(table: str, handler: Callable[[ChangeEvent], None]):
+    _subscribers.setdefault(table, []).append(handler)
+
+def on_resync(callback: Callable):
+    """callback() (sync or returning an awaitable) runs whenever the listener (re)subscribes."""
+    _resync_callbacks.append(callback)
+
+def dispatch(event: ChangeEvent):
+    for handler in _subscribers.get(event.table, ()):
+        try:
+            handler(event)
+        except Exception as e:
+            print(f"Change feed handler for {event.table} failed: {e}")
+
+def defer(db: Session) -> List[ChangeEvent]:
+    """Buffer this session's local dispatch; the caller dispatches the returned list after its commit."""
+    return db.info.setdefault("deferred_events", [])
+
+def _dispatch_or_defer(db: Session, event: ChangeEvent):
+    deferred = db.info.get("deferred_events")
+    if deferred is not None:
+        deferred.append(event)
+    else:
+        dispatch(event)
+
+def _notify(db: Session, table: str, op: str, row_id: int, data: Optional[dict]):
+    payload = {"origin": ORIGIN, "table": table, "op": op, "id": row_id}
+    if data:
+        payload["data"] = data
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANGE_FEED_CHANNEL, "payload": json.dumps(payload, default=str)})
+
+def publish(db: Session, table: str, op: str, row_id: int, data: Optional[dict] = None):
+    """Announce a committed insert/update/delete; call after the commit."""
+    _dispatch_or_defer(db, ChangeEvent(table, op, row_id, data or {}))
+    _published.inc()
+    if not CHANGE_FEED_ENABLED:
+        return
+    try:
+        _notify(db, table, op, row_id, data)
+        db.commit()
+    except Exception as e:
+        # Other workers catch up on their next resync / cache TTL
+        db.rollback()
+        print(f"Change feed notify failed: {e}")
+
+def publish_many(db: Session, table: str, op: str, changes: List[tuple]):
+    """publish() for a batch of (row_id, data) changes: one transaction for all the NOTIFYs."""
+    if not changes:
+        return
+    for row_id, data in changes:
+        _dispatch_or_defer(db, ChangeEvent(table, op, row_id, data or {}))
+        _published.inc()
+    if not CHANGE_FEED_ENABLED:
+        return
+    try:
+        for row_id, data in changes:
+            _notify(db, table, op, row_id, data)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Change feed notify failed: {e}")
+
+def _on_notify(channel: str, payload: str):
+    message = json.loads(payload)
+    if message.get("origin") == ORIGIN:
+        # Already dispatched locally by publish()
+        return
+    _received.inc()
+    dispatch(ChangeEvent(message["table"], message["op"], message["id"], message.get("data") or {}))
+
+async def _resync():
+    failures = []
+    for callback in _resync_callbacks:
+        try:
+            result = callback()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            failures.append(str(e))
+    if failures:
+        # Makes listen_forever reconnect and try again
+        raise RuntimeError(f"change feed resync failed: {'; '.join(failures)}")
+
+async def listen(retry_delay: float = 5.0):
+    """Long-running task: LISTEN on the change channel and fan events out to subscribers."""
+    if CHANGE_FEED_ENABLED:
+        await database.listen_forever([CHANGE_FEED_CHANNEL], _on_notify, on_connect=_resync, retry_delay=retry_delay)
+        return
+    # Without NOTIFY only the initial load runs; other workers' writes show up after cache TTLs
+    while True:
+        try:
+            await _resync()
+            return
+        except Exception as e:
+            print(f"{e}. Retrying in {retry_delay:.0f} seconds...")
+            await asyncio.sleep(retry_delay)
@@ -0,0 +1,249 @@
+"""
+Response compression.
+
+CompressionMiddleware negotiates zstd, br or gzip from Accept-Encoding
+(honouring q-values, in the server's order of preference) and compresses
+JSON/text bodies of at least COMPRESSION_MIN_SIZE bytes. Streamed bodies
+are compressed chunk by chunk without buffering; text/event-stream is left
+alone, since an SSE frame must reach the browser as soon as it is written.
+zstd and br are offered only when `zstandard` / `brotli` are installed.
+
+A body that carries a strong ETag (see etags.py) is the same bytes for as
+long as the tag is unchanged, so its compressed form is kept in a per-worker
+LRU keyed by (URL, tag, encoding): a repeat request costs a dictionary lookup
+and a copy instead of another compression pass.
+"""
+import gzip
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_CACHE_BYTES = int(os.getenv("COMPRESSION_CACHE_MB", "32")) * 1024 * 1024
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+SKIPPED_TYPES = ("text/event-stream",)
+
+""" Codecs """
+class _GzipStream:
+    def __init__(self):
+        # wbits 16+: gzip container, same output as gzip.compress
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class _BrotliStream:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class _ZstdStream:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+def _available_codecs() -> dict:
+    # Server preference order: best ratio/speed first
+    codecs = {}
+    if zstandard is not None:
+        codecs["zstd"] = (lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), _ZstdStream)
+    if brotli is not None:
+        codecs["br"] = (lambda body: brotli.compress(body, quality=BROTLI_QUALITY), _BrotliStream)
+    codecs["gzip"] = (lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0), _GzipStream)
+    return codecs
+
+CODECS = _available_codecs()
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The preferred available encoding the client accepts (q > 0), or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    candidates = [(accepted.get(name, wildcard), name) for name in CODECS]
+    best_quality = max((quality for quality, _ in candidates), default=0.0)
+    if best_quality <= 0:
+        return None
+    # Highest q wins; ties go to the server's order
+    return next(name for quality, name in candidates if quality == best_quality)
+
+""" Pre-compressed cache """
+class CompressedCache:
+    """LRU of compressed bodies keyed by (path, query, strong ETag, encoding), bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body: bytes):
+        if len(body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+cache = CompressedCache(COMPRESSION_CACHE_BYTES)
+
+_cache_hits = metrics.counter("compression_cache_hits_total", "Responses served from the pre-compressed cache")
+_compressed = metrics.counter("compressed_responses_total", "Responses compressed by the middleware")
+
+""" Middleware """
+def _compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith(SKIPPED_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        # Only GET bodies are cached: a tag identifies a representation, not the result of a write
+        url = (scope["path"], scope["query_string"]) if scope["method"] == "GET" else None
+        await self.app(scope, receive, _Responder(send, encoding, self.minimum_size, url))
+
+class _Responder:
+    """Wraps `send`: holds back the response start until the first body chunk shows how to encode it."""
+
+    def __init__(self, send, encoding: str, minimum_size: int, url: Optional[tuple]):
+        self._send = send
+        self.url = url
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start = None
+        self._stream = None
+        self._passthrough = False
+
+    async def __call__(self, message):
+        kind = message["type"]
+        if kind == "http.response.start":
+            self._start = message
+            headers = Headers(raw=message["headers"])
+            self._passthrough = message["status"] in (204, 304) or not _compressible(headers)
+            if self._passthrough:
+                await self._send(message)
+            return
+        if kind != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._stream is not None:
+            chunk = self._stream.compress(body)
+            if not more_body:
+                chunk += self._stream.finish()
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        headers = MutableHeaders(raw=self._start["headers"])
+        if not more_body:
+            # Whole body in one message
+            if len(body) < self.minimum_size:
+                await self._send(self._start)
+                await self._send(message)
+                return
+            compressed = self._compress_whole(headers.get("etag"), body)
+            self._set_encoding(headers, len(compressed))
+            await self._send(self._start)
+            await self._send({"type": "http.response.body", "body": compressed})
+            return
+
+        # Streaming: compress as the chunks arrive
+        self._stream = CODECS[self.encoding][1]()
+        self._set_encoding(headers, None)
+        await self._send(self._start)
+        await self._send({"type": "http.response.body", "body": self._stream.compress(body), "more_body": True})
+
+    def _compress_whole(self, etag: Optional[str], body: bytes) -> bytes:
+        # Tags are per URL: /product?page=1 and ?page=2 share one
+        key = (*self.url, etag, self.encoding) if self.url and etag and not etag.startswith("W/") else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                _cache_hits.inc()
+                return cached
+        compressed = CODECS[self.encoding][0](body)
+        _compressed.inc()
+        if key is not None:
+            cache.put(key, compressed)
+        return compressed
+
+    def _set_encoding(self, headers: MutableHeaders, length: Optional[int]):
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            if "content-length" in headers:
+                del headers["content-length"]
+        else:
+            headers["Content-Length"] = str(length)
@@ -1,63 +1,381 @@
+import asyncio
+import inspect
 import os
+import random
+import threading
 import time
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv() # This tries to load from .env if it's present IN THE CONTAINER
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional streaming replica for heavy read endpoints (listings, prints, search)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
 
 # --- CRUCIAL DEBUGGING LINE ---
 print(f"DEBUG: Value of DATABASE_URL before engine creation: '{DATABASE_URL}'")
 # --- END CRITICAL DEBUGGING ---
 
+# Connection budget: every uvicorn worker has its own pool, so the per-worker
+# pool is derived from the server's max_connections split across workers.
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# PgBouncer (transaction pooling) multiplexes client connections itself
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# Compiled SQL kept per engine; the hot statements in statements.py live here
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1000"))
+# psycopg 3 only: executions of the same SQL on a connection before it is prepared server-side
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "2"))
+
+def pool_settings() -> dict:
+    """Pool arguments for create_engine, sized per worker unless DB_POOL_SIZE/DB_MAX_OVERFLOW are set."""
+    if DB_PGBOUNCER:
+        # Client connections to PgBouncer are cheap; keep a steady pool and let
+        # PgBouncer enforce the server limit. Server-side health is its job too.
+        pool_size = int(os.getenv("DB_POOL_SIZE", "10"))
+        max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "0"))
+        return {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": False,
+        }
+
+    per_worker = max(1, (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) // WORKERS)
+    pool_size = int(os.getenv("DB_POOL_SIZE", max(1, per_worker * 2 // 3)))
+    max_overflow = int(os.getenv("DB_MAX_OVERFLOW", max(0, per_worker - pool_size)))
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+def connect_args(url: str) -> dict:
+    if not url.startswith("postgresql+psycopg://"):
+        # psycopg2 has no server-side prepared statements
+        return {}
+    # psycopg 3 prepares statements server-side, which breaks behind PgBouncer transaction pooling
+    if DB_PGBOUNCER:
+        return {"prepare_threshold": None}
+    return {"prepare_threshold": DB_PREPARE_THRESHOLD}
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkout wait time and pool timeouts."""
+    _metrics = None
+
+    def _do_get(self):
+        if self._metrics is None:
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self._metrics["timeouts"].inc()
+            raise
+        finally:
+            self._metrics["checkout_wait"].observe(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._metrics = self._metrics
+        return pool
+
+def instrument_pool(db_engine, name: str = "primary"):
+    """Export checkout latency, checkouts, overflow and timeouts for an engine's pool."""
+    labels = {"engine": name}
+    pool_metrics = {
+        "checkout_wait": metrics.histogram("db_pool_checkout_seconds", "Time spent waiting for a pooled connection", labels),
+        "timeouts": metrics.counter("db_pool_timeouts_total", "Checkouts that gave up after pool_timeout", labels),
+        "checkouts": metrics.counter("db_pool_checkouts_total", "Connections checked out of the pool", labels),
+        "connects": metrics.counter("db_pool_connects_total", "New DBAPI connections opened", labels),
+    }
+    # Read the pool lazily: engine.dispose() swaps in a recreated pool
+    metrics.gauge("db_pool_size", "Configured pool size", labels, fn=lambda: db_engine.pool.size())
+    metrics.gauge("db_pool_checked_out", "Connections currently checked out", labels, fn=lambda: db_engine.pool.checkedout())
+    metrics.gauge("db_pool_overflow", "Connections open beyond pool_size", labels, fn=lambda: max(0, db_engine.pool.overflow()))
+    metrics.gauge("db_pool_idle", "Idle connections in the pool", labels, fn=lambda: db_engine.pool.checkedin())
+    if isinstance(db_engine.pool, InstrumentedQueuePool):
+        db_engine.pool._metrics = pool_metrics
+
+    @event.listens_for(db_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics["checkouts"].inc()
+
+    @event.listens_for(db_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        pool_metrics["connects"].inc()
+
+# Values of ExecutionContext.cache_hit (sqlalchemy.engine.default.CacheStats)
+CACHE_OUTCOMES = ("cache_hit", "cache_miss", "caching_disabled", "no_cache_key", "no_dialect_support")
+
+def instrument_statement_cache(db_engine, name: str = "primary"):
+    """Count compiled-cache hits and misses per engine (db_compiled_cache_total)."""
+    outcomes = {
+        outcome: metrics.counter(
+            "db_compiled_cache_total", "Statement executions by compiled cache outcome",
+            {"engine": name, "outcome": outcome},
+        )
+        for outcome in CACHE_OUTCOMES
+    }
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is None or context.compiled is None:
+            return
+        outcome = outcomes.get(getattr(context.cache_hit, "name", str(context.cache_hit)).lower())
+        if outcome is not None:
+            outcome.inc()
+
+def pool_status(db_engine) -> dict:
+    if db_engine is None:
+        return {}
+    pool = db_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+    }
+
 def create_database_engine():
-    """Create database engine with retry logic"""
+    """Create the primary engine. No connection is opened here; see connect_in_background."""
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL environment variable is not set")
-    
-    max_retries = 5
-    retry_delay = 2
-    
-    for attempt in range(max_retries):
+
+    engine = create_engine(
+        DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        connect_args=connect_args(DATABASE_URL),
+        query_cache_size=DB_QUERY_CACHE_SIZE,
+        **pool_settings()
+    )
+    instrument_pool(engine)
+    instrument_statement_cache(engine)
+    return engine
+
+class DatabaseState:
+    """Per-worker readiness: set once the database answered and bootstrap work is done."""
+
+    def __init__(self):
+        self.ready = False
+        self.connected = False
+        self.attempts = 0
+        self.last_error = None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "connected": self.connected,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+        }
+
+db_state = DatabaseState()
+
+# Arbitrary, app-wide keys for Postgres advisory locks, one per job that must not overlap
+BOOTSTRAP_LOCK_KEY = 7251_2024    # schema bootstrap, one worker (run_once_across_workers)
+ARCHIVE_LOCK_KEY = 7251_2040      # archiving, one worker at a time (lifecycle.py)
+REVALUATION_LOCK_KEY = 7251_2042  # collateral revaluation (routes/valuation/engine.py)
+
+def check_connection():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def run_once_across_workers(bootstrap, is_done):
+    """
+    Run `bootstrap` in exactly one worker, coordinated with a Postgres advisory lock.
+    Workers that lose the race wait for the winner and only redo the work if
+    `is_done` shows the winner failed.
+    """
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": BOOTSTRAP_LOCK_KEY}).scalar():
+            try:
+                bootstrap()
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
+                conn.commit()
+            return True
+
+        # Another worker is bootstrapping: block until it releases the lock
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
         try:
-            engine = create_engine(
-                DATABASE_URL,
-                pool_size=50,
-                max_overflow=60,
-                pool_timeout=70,
-                pool_recycle=1800,
-                pool_pre_ping=True
-            )
-            # Test the connection
-            with engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
-            print(f"Database connection established successfully on attempt {attempt + 1}")
-            return engine
-        except OperationalError as e:
-            if attempt < max_retries - 1:
-                print(f"Database connection failed on attempt {attempt + 1}. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                print(f"Failed to connect to database after {max_retries} attempts")
-                raise e
+            if not is_done(conn):
+                bootstrap()
+                return True
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
+            conn.commit()
+    return False
+
+async def connect_in_background(bootstrap, is_done, initial_delay: float = 1.0, max_delay: float = 30.0):
+    """Keep trying to reach the database without blocking startup, then bootstrap once."""
+    delay = initial_delay
+    while not db_state.ready:
+        db_state.attempts += 1
+        try:
+            await asyncio.to_thread(check_connection)
+            db_state.connected = True
+            await asyncio.to_thread(run_once_across_workers, bootstrap, is_done)
+            db_state.ready = True
+            db_state.last_error = None
+            print(f"Database ready after {db_state.attempts} attempt(s)")
         except Exception as e:
-            print(f"Unexpected error during database connection: {e}")
-            raise e
+            db_state.last_error = str(e)
+            print(f"Database not ready (attempt {db_state.attempts}): {e}. Retrying in {delay:.0f} seconds...")
+            await asyncio.sleep(delay + random.uniform(0, delay / 4))
+            delay = min(delay * 2, max_delay)
+
+async def listen_forever(channels, on_notify, on_connect=None, retry_delay: float = 5.0):
+    """
+    LISTEN on `channels` over a dedicated psycopg2 connection kept out of the pool,
+    calling on_notify(channel, payload) on the event loop. Reconnects after errors;
+    on_connect (sync or awaitable) runs after every (re)subscribe, since
+    notifications sent while disconnected are lost.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        connection = None
+        try:
+            proxied = await asyncio.to_thread(engine.raw_connection)
+            proxied.detach()
+            connection = proxied.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                for channel in channels:
+                    cursor.execute(f"LISTEN {channel}")
+            if on_connect is not None:
+                result = on_connect()
+                if inspect.isawaitable(result):
+                    await result
+
+            readable = asyncio.Event()
+            loop.add_reader(connection.fileno(), readable.set)
+            try:
+                while True:
+                    await readable.wait()
+                    readable.clear()
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            on_notify(notify.channel, notify.payload)
+                        except Exception as e:
+                            print(f"Error handling notification on {notify.channel}: {e}")
+            finally:
+                loop.remove_reader(connection.fileno())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"LISTEN {', '.join(channels)} failed: {e}. Reconnecting in {retry_delay:.0f} seconds...")
+            await asyncio.sleep(retry_delay)
+        finally:
+            if connection is not None:
+                connection.close()
+
+def create_read_engine():
+    """Replica engine; created without a test query so a down replica never blocks startup."""
+    if not DATABASE_READ_URL:
+        return None
+    read_engine = create_engine(
+        DATABASE_READ_URL,
+        poolclass=InstrumentedQueuePool,
+        connect_args=connect_args(DATABASE_READ_URL),
+        query_cache_size=DB_QUERY_CACHE_SIZE,
+        **pool_settings()
+    )
+    instrument_pool(read_engine, "replica")
+    instrument_statement_cache(read_engine, "replica")
+    return read_engine
+
+class ReplicaMonitor:
+    """Caches replica health and replay lag so routing costs one query per interval per worker."""
+
+    LAG_QUERY = text(
+        "SELECT CASE "
+        "WHEN NOT pg_is_in_recovery() THEN 0 "
+        "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+
+    def __init__(self, read_engine, max_lag: float, interval: float):
+        self.read_engine = read_engine
+        self.max_lag = max_lag
+        self.interval = interval
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = float("-inf")
+        self._lock = threading.Lock()
+        metrics.gauge("db_replica_lag_seconds", "Last measured replica replay lag", fn=lambda: self.lag if self.lag is not None else -1)
+
+    def refresh(self):
+        try:
+            with self.read_engine.connect() as conn:
+                self.lag = float(conn.execute(self.LAG_QUERY).scalar() or 0)
+            self.healthy = self.lag <= self.max_lag
+            self.error = None if self.healthy else f"replica lag {self.lag:.1f}s exceeds {self.max_lag:.1f}s"
+        except Exception as e:
+            self.healthy = False
+            self.error = str(e)
+        self.checked_at = time.monotonic()
+
+    def usable(self) -> bool:
+        if time.monotonic() - self.checked_at >= self.interval:
+            # Only one thread refreshes; the others keep routing on the last result
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.refresh()
+                finally:
+                    self._lock.release()
+        return self.healthy
+
+    def status(self) -> dict:
+        return {"healthy": self.healthy, "lag_seconds": self.lag, "error": self.error}
+
+class RoutingSession(Session):
+    """Routes sessions opened by get_read_db to the replica; flushes and all other sessions use the primary."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get("use_replica") and not self._flushing:
+            return read_engine
+        return engine
 
 try:
     engine = create_database_engine()
 except Exception as e:
     print(f"Error creating database engine: {e}")
-    # Create a dummy engine for development/testing
+    # No DATABASE_URL (development/testing): run without database functionality
     engine = None
 
+try:
+    read_engine = create_read_engine() if engine else None
+except Exception as e:
+    print(f"Error creating read replica engine, reads will use the primary: {e}")
+    read_engine = None
+
+replica_monitor = ReplicaMonitor(read_engine, DB_REPLICA_MAX_LAG_SECONDS, DB_REPLICA_CHECK_INTERVAL) if read_engine else None
+read_routes = {
+    route: metrics.counter("db_read_sessions_total", "Read-only sessions by target engine", {"target": route})
+    for route in ("replica", "primary")
+}
+
 Base = declarative_base()
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) if engine else None
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False) if engine else None
 
 def get_db():
     if not SessionLocal:
@@ -66,4 +384,16 @@ def get_db():
     try:
         yield db # Assuming yield db for FastAPI dependency injection
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """Session for read-only endpoints: replica when healthy and caught up, primary otherwise."""
+    if not SessionLocal:
+        raise Exception("Database not configured")
+    use_replica = replica_monitor is not None and replica_monitor.usable()
+    read_routes["replica" if use_replica else "primary"].inc()
+    db = SessionLocal(info={"use_replica": use_replica})
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String, Float
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String, Float, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -7,7 +7,7 @@ from database import Base
 class OrderDetail(Base):
     __tablename__ = "order_details"
 
-    order_id = Column(Integer, ForeignKey("orders.order_id"), primary_key = True)
+    order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), primary_key = True)
     prod_id = Column(Integer, ForeignKey("products.prod_id"), primary_key = True)
     order_weight = Column(String, nullable=False)
     order_amount = Column(Integer, nullable=True)
@@ -23,7 +23,7 @@ class OrderDetail(Base):
 class PawnDetail(Base):
     __tablename__ = "pawn_details"
 
-    pawn_id = Column(Integer, ForeignKey("pawns.pawn_id"), primary_key = True)
+    pawn_id = Column(Integer, ForeignKey("pawns.pawn_id", ondelete="CASCADE"), primary_key = True)
     prod_id = Column(Integer, ForeignKey("products.prod_id"), primary_key = True)
     pawn_weight = Column(String, nullable=False)
     pawn_amount = Column(Integer, nullable=False)
@@ -44,10 +44,14 @@ class Account(Base):
     role = Column(Enum("admin", "user", name = "role"), default = 'user')
     created_at = Column(DateTime, default = datetime.utcnow, nullable = False)
     updated_at = Column(DateTime, default = datetime.utcnow, onupdate = datetime.utcnow, nullable = False)
+    # Bumped on every update and exposed as the ETag (see etags.py)
+    version_id = Column(Integer, nullable=False, server_default="1")
     
     account_product = relationship("Product", primaryjoin="Account.cus_id == Product.user_id", back_populates="product_account")
-    account_order = relationship("Order", primaryjoin="Account.cus_id == Order.cus_id", back_populates="order_account")
-    account_pawn = relationship("Pawn", primaryjoin="Account.cus_id == Pawn.cus_id", back_populates="pawn_account")
+    account_order = relationship("Order", primaryjoin="Account.cus_id == Order.cus_id", back_populates="order_account", passive_deletes=True)
+    account_pawn = relationship("Pawn", primaryjoin="Account.cus_id == Pawn.cus_id", back_populates="pawn_account", passive_deletes=True)
+
+    __mapper_args__ = {"version_id_col": version_id}
 
 class Product(Base):
     __tablename__ = "products"
@@ -58,7 +62,7 @@ class Product(Base):
     amount = Column(Integer, nullable=True, default=None)
     user_id = Column(Integer, ForeignKey("accounts.cus_id"))
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True, index=True)
 
     product_account = relationship("Account", foreign_keys=[user_id], back_populates="account_product")
     product_order_detail = relationship("Order", secondary=OrderDetail.__table__, back_populates="order_product_detail")
@@ -68,23 +72,227 @@ class Order(Base):
     __tablename__ = "orders"
 
     order_id = Column(Integer, primary_key=True, index=True)
-    cus_id = Column(Integer, ForeignKey("accounts.cus_id"))
+    cus_id = Column(Integer, ForeignKey("accounts.cus_id", ondelete="CASCADE"), index=True)
     order_deposit = Column(Float, default=0, nullable=False)
     order_date = Column(DateTime, default = datetime.utcnow, nullable = False)
+    # Bumped on every update and exposed as the ETag (see etags.py)
+    version_id = Column(Integer, nullable=False, server_default="1")
     
     order_account = relationship("Account", foreign_keys=[cus_id], back_populates="account_order")
     order_product_detail = relationship("Product", secondary=OrderDetail.__table__, back_populates="product_order_detail")
+
+    __mapper_args__ = {"version_id_col": version_id}
     
 class Pawn(Base):
     __tablename__ = "pawns"
 
     pawn_id = Column(Integer, primary_key=True, index=True)
-    cus_id = Column(Integer, ForeignKey("accounts.cus_id"))
+    cus_id = Column(Integer, ForeignKey("accounts.cus_id", ondelete="CASCADE"), index=True)
     pawn_deposit = Column(Float, default=0, nullable=False)
     pawn_date = Column(DateTime, default=datetime.utcnow, nullable=False)
     pawn_expire_date = Column(DateTime, nullable=False)
+    # Running totals over pawn_payments, maintained by routes/pawn/ledger.py
+    balance_due = Column(Float, default=lambda context: context.get_current_parameters().get("pawn_deposit"), nullable=True)
+    interest_paid = Column(Float, default=0, server_default="0", nullable=False)
+    last_payment_at = Column(DateTime, nullable=True)
+    redeemed_at = Column(DateTime, nullable=True)
+    # Bumped on every update and exposed as the ETag (see etags.py)
+    version_id = Column(Integer, nullable=False, server_default="1")
 
     pawn_account = relationship("Account", foreign_keys=[cus_id], back_populates="account_pawn")
     pawn_product_detail = relationship("Product", secondary=PawnDetail.__table__, back_populates="product_pawn_detail")
-    
-    
\ No newline at end of file
+
+    __mapper_args__ = {"version_id_col": version_id}
+
+class PawnPayment(Base):
+    """Append-only payment ledger; never updated, only inserted (routes/pawn/ledger.py)."""
+    __tablename__ = "pawn_payments"
+
+    payment_id = Column(Integer, primary_key=True, index=True)
+    pawn_id = Column(Integer, ForeignKey("pawns.pawn_id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(Enum("interest", "principal", "redemption", "renewal", "fee", name="payment_kind"), nullable=False)
+    amount = Column(Float, nullable=False)
+    principal_paid = Column(Float, default=0, nullable=False)
+    interest_paid = Column(Float, default=0, nullable=False)
+    balance_after = Column(Float, nullable=False)
+    paid_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    posted_by = Column(Integer, nullable=True)
+    note = Column(String, nullable=True)
+
+""" Valuation """
+class MetalPrice(Base):
+    __tablename__ = "metal_prices"
+
+    # karat 0 is the price used when an item's karat can't be read from its name
+    metal = Column(String, primary_key=True)
+    karat = Column(Integer, primary_key=True, default=0, autoincrement=False)
+    price_per_gram = Column(Float, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class PawnValuation(Base):
+    """Latest revaluation of each active pawn (routes/valuation/engine.py); replaced on every run."""
+    __tablename__ = "pawn_valuations"
+
+    pawn_id = Column(Integer, primary_key=True, autoincrement=False)
+    cus_id = Column(Integer, index=True)
+    principal = Column(Float, nullable=False)
+    amount_due = Column(Float, nullable=False)
+    collateral_value = Column(Float, nullable=False)
+    # amount_due / collateral_value; NULL when nothing could be valued
+    ltv = Column(Float, nullable=True, index=True)
+    valued_at = Column(DateTime, nullable=False)
+
+""" Archive """
+# Rows moved out by an archiving client delete (see client.Staff.delete_client)
+# and by the lifecycle job (lifecycle.py). No foreign keys: archived rows outlive
+# the customer and products they point at. Pawn/order tables are range-partitioned
+# by their header's date, so detail rows carry it and it is part of every key;
+# lifecycle.ensure_archive_partitions() creates the yearly partitions.
+
+class AccountArchive(Base):
+    __tablename__ = "accounts_archive"
+
+    cus_id = Column(Integer, primary_key=True, autoincrement=False)
+    cus_name = Column(String, nullable=False)
+    address = Column(String, nullable=True)
+    phone_number = Column(String, nullable=False, index=True)
+    role = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class OrderArchive(Base):
+    __tablename__ = "orders_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (order_date)"}
+
+    order_id = Column(Integer, primary_key=True)
+    cus_id = Column(Integer, index=True)
+    order_deposit = Column(Float, nullable=False)
+    order_date = Column(DateTime, primary_key=True)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class OrderDetailArchive(Base):
+    __tablename__ = "order_details_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (order_date)"}
+
+    order_id = Column(Integer, primary_key=True)
+    prod_id = Column(Integer, primary_key=True)
+    order_weight = Column(String, nullable=False)
+    order_amount = Column(Integer, nullable=True)
+    product_sell_price = Column(Float, nullable=False)
+    product_labor_cost = Column(Float, nullable=False)
+    product_buy_price = Column(Float, nullable=False)
+    order_date = Column(DateTime, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class PawnArchive(Base):
+    __tablename__ = "pawns_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (pawn_date)"}
+
+    pawn_id = Column(Integer, primary_key=True)
+    cus_id = Column(Integer, index=True)
+    pawn_deposit = Column(Float, nullable=False)
+    pawn_date = Column(DateTime, primary_key=True)
+    pawn_expire_date = Column(DateTime, nullable=False)
+    balance_due = Column(Float, nullable=True)
+    interest_paid = Column(Float, nullable=True)
+    redeemed_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class PawnDetailArchive(Base):
+    __tablename__ = "pawn_details_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (pawn_date)"}
+
+    pawn_id = Column(Integer, primary_key=True)
+    prod_id = Column(Integer, primary_key=True)
+    pawn_weight = Column(String, nullable=False)
+    pawn_amount = Column(Integer, nullable=False)
+    pawn_unit_price = Column(Float, nullable=False)
+    pawn_date = Column(DateTime, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class PawnPaymentArchive(Base):
+    __tablename__ = "pawn_payments_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (pawn_date)"}
+
+    payment_id = Column(Integer, primary_key=True)
+    pawn_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    principal_paid = Column(Float, nullable=False)
+    interest_paid = Column(Float, nullable=False)
+    balance_after = Column(Float, nullable=False)
+    paid_at = Column(DateTime, nullable=False)
+    posted_by = Column(Integer, nullable=True)
+    note = Column(String, nullable=True)
+    pawn_date = Column(DateTime, primary_key=True)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+""" Migrations """
+# (table, column, DDL type, backfill) for columns added to tables that may
+# already exist; add_missing_columns() adds them, since create_all() won't.
+ADDED_COLUMNS = (
+    ("pawns", "balance_due", "double precision", "UPDATE pawns SET balance_due = pawn_deposit"),
+    ("pawns", "interest_paid", "double precision NOT NULL DEFAULT 0", None),
+    ("pawns", "last_payment_at", "timestamp without time zone", None),
+    ("pawns", "redeemed_at", "timestamp without time zone", None),
+    ("pawns_archive", "balance_due", "double precision", None),
+    ("pawns_archive", "interest_paid", "double precision", None),
+    ("pawns_archive", "redeemed_at", "timestamp without time zone", None),
+    ("accounts", "version_id", "integer NOT NULL DEFAULT 1", None),
+    ("orders", "version_id", "integer NOT NULL DEFAULT 1", None),
+    ("pawns", "version_id", "integer NOT NULL DEFAULT 1", None),
+)
+
+def add_missing_columns(conn):
+    """ALTER TABLE ... ADD COLUMN for every missing column in ADDED_COLUMNS, then its backfill. Idempotent."""
+    for table, column, ddl, backfill in ADDED_COLUMNS:
+        exists = conn.execute(text(
+            "SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+        ), {"table": table, "column": column}).first()
+        if exists:
+            continue
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        if backfill:
+            conn.execute(text(backfill))
+        print(f"Added column {table}.{column}")
+
+# (index, table, column) for indexes declared above after the table may already exist
+ADDED_INDEXES = (
+    ("ix_orders_cus_id", "orders", "cus_id"),
+    ("ix_pawns_cus_id", "pawns", "cus_id"),
+    ("ix_products_updated_at", "products", "updated_at"),
+)
+
+def add_missing_indexes(conn):
+    for name, table, column in ADDED_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})"))
+
+# (table, column, referenced table.column) declared ON DELETE CASCADE above.
+# create_all() doesn't touch existing tables, so upgrade_foreign_keys() brings
+# constraints created before the cascade was declared in line.
+CASCADE_FOREIGN_KEYS = (
+    ("orders", "cus_id", "accounts(cus_id)"),
+    ("pawns", "cus_id", "accounts(cus_id)"),
+    ("order_details", "order_id", "orders(order_id)"),
+    ("pawn_details", "pawn_id", "pawns(pawn_id)"),
+)
+
+def upgrade_foreign_keys(conn):
+    """Recreate non-cascading foreign keys from CASCADE_FOREIGN_KEYS as ON DELETE CASCADE. Idempotent."""
+    for table, column, target in CASCADE_FOREIGN_KEYS:
+        names = conn.execute(text("""
+            SELECT con.conname
+            FROM pg_constraint con
+            JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = ANY (con.conkey)
+            WHERE con.contype = 'f' AND con.conrelid = CAST(:table AS regclass)
+              AND att.attname = :column AND con.confdeltype <> 'c'
+        """), {"table": table, "column": column}).scalars().all()
+        for name in names:
+            conn.execute(text(
+                f'ALTER TABLE {table} DROP CONSTRAINT "{name}", '
+                f'ADD CONSTRAINT "{name}" FOREIGN KEY ({column}) REFERENCES {target} ON DELETE CASCADE'
+            ))
+            print(f"Foreign key {table}.{column} now cascades on delete")
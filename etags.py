@@ -0,0 +1,121 @@
+"""
+Entity tags for optimistic concurrency and conditional GETs.
+
+Pawn, Order and Account rows carry a version_id that SQLAlchemy bumps on
+every ORM update (version_id_col; set-based writers bump it themselves). It
+is exposed as a strong ETag such as "pawn-12-v3". A PATCH sent with
+If-Match is applied only while the row is still at that version, otherwise
+it fails with 412 Precondition Failed: two counters editing the same ticket
+can't silently overwrite each other, and no row stays locked while a ticket
+is open on screen. Without If-Match a PATCH behaves as before.
+
+Read endpoints that poll the same record build their ETag from those
+versions plus watermarks (max(updated_at), counts) read from indexes, in
+one small query. A matching If-None-Match returns 304 before the listing
+query runs. Representation tags keep the entity tag first and add
+qualifiers after a "." ("pawn-12-v3.c2.p..."), so they still work as
+If-Match.
+"""
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import func, select, true
+
+from entities import Account, Order, Pawn, Product
+
+def entity_tag(kind: str, row_id: int, version: int) -> str:
+    return f'"{kind}-{row_id}-v{version}"'
+
+def _entity_part(tag: str) -> str:
+    # Representation tags may append qualifiers after a "." ("pawn-12-v3.c2")
+    return tag.strip().strip('"').split(".", 1)[0]
+
+def matches(if_match: Optional[str], kind: str, row_id: int, version: int) -> bool:
+    """True when If-Match is absent, "*" or lists the row's current tag (strong comparison)."""
+    if if_match is None:
+        return True
+    current = _entity_part(entity_tag(kind, row_id, version))
+    tags = [tag.strip() for tag in if_match.split(",")]
+    return any(tag == "*" or (not tag.startswith("W/") and _entity_part(tag) == current) for tag in tags)
+
+def conflict(kind: str, row_id: int) -> HTTPException:
+    return HTTPException(
+        status_code=412,
+        detail=f"{kind.capitalize()} {row_id} was changed by someone else; reload it and try again",
+    )
+
+def require_version(if_match: Optional[str], kind: str, row_id: int, version: int):
+    if not matches(if_match, kind, row_id, version):
+        raise conflict(kind, row_id)
+
+def current_version(db, model, row_id: int) -> Optional[int]:
+    """The row's version_id by primary key, or None when it doesn't exist."""
+    key = model.__mapper__.primary_key[0]
+    return db.execute(select(model.version_id).where(key == row_id)).scalar()
+
+def set_entity_tag(response: Response, kind: str, row_id: int, version: Optional[int]):
+    if version is not None:
+        response.headers["ETag"] = entity_tag(kind, row_id, version)
+
+""" Conditional GET """
+def not_modified(if_none_match: Optional[str], tag: Optional[str]) -> bool:
+    """True when If-None-Match lists the current tag or "*" (weak comparison)."""
+    if not if_none_match or tag is None:
+        return False
+    return any(candidate.strip() == "*" or candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+def not_modified_response(tag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": tag})
+
+def _stamp(value) -> str:
+    return f"{value:%Y%m%d%H%M%S%f}" if value else "0"
+
+# Renaming a product changes every printout that shows it
+_products_changed = select(func.max(Product.updated_at)).scalar_subquery()
+
+def pawn_print_tag(db, pawn_id: int) -> Optional[str]:
+    """Pawn version, its customer's version and the product watermark; None for a pawn that isn't active."""
+    row = db.execute(
+        select(Pawn.version_id, Account.version_id, _products_changed)
+        .outerjoin(Account, Pawn.cus_id == Account.cus_id)
+        .where(Pawn.pawn_id == pawn_id)
+    ).first()
+    if row is None:
+        return None
+    pawn_version, customer_version, products = row
+    return f'"pawn-{pawn_id}-v{pawn_version}.c{customer_version or 0}.p{_stamp(products)}"'
+
+def order_print_tag(db, order_id: int) -> Optional[str]:
+    row = db.execute(
+        select(Order.version_id, Account.version_id, _products_changed)
+        .outerjoin(Account, Order.cus_id == Account.cus_id)
+        .where(Order.order_id == order_id)
+    ).first()
+    if row is None:
+        return None
+    order_version, customer_version, products = row
+    return f'"order-{order_id}-v{order_version}.c{customer_version or 0}.p{_stamp(products)}"'
+
+def customer_pawns_tag(db, cus_id: int) -> Optional[str]:
+    """Customer version plus count, id sum and version sum of their pawns (ix_pawns_cus_id)."""
+    pawns = select(
+        func.count().label("pawns"),
+        func.coalesce(func.sum(Pawn.pawn_id), 0).label("id_sum"),
+        func.coalesce(func.sum(Pawn.version_id), 0).label("version_sum"),
+    ).where(Pawn.cus_id == cus_id).subquery()
+    row = db.execute(
+        select(Account.version_id, pawns.c.pawns, pawns.c.id_sum, pawns.c.version_sum, _products_changed)
+        .join(pawns, true())
+        .where(Account.cus_id == cus_id)
+    ).first()
+    if row is None:
+        return None
+    customer_version, pawns, id_sum, version_sum, products = row
+    return f'"client-{cus_id}-v{customer_version}.n{pawns}-{id_sum}-{version_sum}.p{_stamp(products)}"'
+
+def products_tag(db) -> str:
+    """Product count, highest id and latest update; any insert, update or delete changes one of them."""
+    count, last_id, changed = db.execute(
+        select(func.count(), func.max(Product.prod_id), func.max(Product.updated_at))
+    ).one()
+    return f'"products-{count}-{last_id or 0}-{_stamp(changed)}"'
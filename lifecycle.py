@@ -0,0 +1,213 @@
+"""
+Data lifecycle: move old pawns and orders out of the active tables.
+
+The active tables (pawns, pawn_details, pawn_payments, orders, order_details) stay small
+and unpartitioned: their foreign keys and single-column primary keys can't
+carry a partition key. Everything older than the retention window moves to
+the *_archive tables, which are range-partitioned by year on pawn_date /
+order_date (see entities.py). Listings read the active tables by default and
+opt into the archive with `history=true` (statements.*_WITH_HISTORY).
+
+archive_forever() runs in every worker; a Postgres advisory lock makes sure
+only one of them moves rows at a time. Rows move in batches, each batch one
+DELETE ... RETURNING -> INSERT statement in its own short transaction.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import database
+import metrics
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+# Pawns move this many days after they expire or are redeemed, orders this many days after the order date
+PAWN_RETENTION_DAYS = int(os.getenv("PAWN_RETENTION_DAYS", "180"))
+ORDER_RETENTION_DAYS = int(os.getenv("ORDER_RETENTION_DAYS", "365"))
+
+""" Archive inserts """
+# INSERT INTO <table>_archive from a CTE returning the deleted rows (detail
+# CTEs also return their header's date). Shared with the archiving client delete.
+ARCHIVE_INSERTS = {
+    "accounts": """INSERT INTO accounts_archive (cus_id, cus_name, address, phone_number, role, created_at, updated_at, archived_at)
+    SELECT cus_id, cus_name, address, phone_number, role::text, created_at, updated_at, now() FROM {source}""",
+    "orders": """INSERT INTO orders_archive (order_id, cus_id, order_deposit, order_date, archived_at)
+    SELECT order_id, cus_id, order_deposit, order_date, now() FROM {source}""",
+    "order_details": """INSERT INTO order_details_archive (order_id, prod_id, order_weight, order_amount, product_sell_price,
+        product_labor_cost, product_buy_price, order_date, created_at, archived_at)
+    SELECT order_id, prod_id, order_weight, order_amount, product_sell_price,
+        product_labor_cost, product_buy_price, order_date, created_at, now() FROM {source}""",
+    "pawns": """INSERT INTO pawns_archive (pawn_id, cus_id, pawn_deposit, pawn_date, pawn_expire_date,
+        balance_due, interest_paid, redeemed_at, archived_at)
+    SELECT pawn_id, cus_id, pawn_deposit, pawn_date, pawn_expire_date,
+        balance_due, interest_paid, redeemed_at, now() FROM {source}""",
+    "pawn_details": """INSERT INTO pawn_details_archive (pawn_id, prod_id, pawn_weight, pawn_amount, pawn_unit_price,
+        pawn_date, created_at, archived_at)
+    SELECT pawn_id, prod_id, pawn_weight, pawn_amount, pawn_unit_price,
+        pawn_date, created_at, now() FROM {source}""",
+    "pawn_payments": """INSERT INTO pawn_payments_archive (payment_id, pawn_id, kind, amount, principal_paid, interest_paid,
+        balance_after, paid_at, posted_by, note, pawn_date, archived_at)
+    SELECT payment_id, pawn_id, kind::text, amount, principal_paid, interest_paid,
+        balance_after, paid_at, posted_by, note, pawn_date, now() FROM {source}""",
+}
+
+def archive_insert(table: str, source: str) -> str:
+    return ARCHIVE_INSERTS[table].format(source=source)
+
+""" Partitions """
+# archive table -> (partition column, active table holding the same dates)
+PARTITIONED_ARCHIVES = {
+    "pawns_archive": ("pawn_date", "pawns"),
+    "pawn_details_archive": ("pawn_date", "pawns"),
+    "pawn_payments_archive": ("pawn_date", "pawns"),
+    "orders_archive": ("order_date", "orders"),
+    "order_details_archive": ("order_date", "orders"),
+}
+
+def _create_year_partition(conn, table: str, column: str, year: int):
+    """
+    Create {table}_y{year}. Rows of that year already in the DEFAULT partition
+    (written while the year had no partition of its own) would make Postgres
+    reject the new partition, so the default is detached, the rows are moved
+    into the new partition and the default is attached again.
+    """
+    partition = f"{table}_y{year}"
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": partition}).scalar() is not None:
+        return
+    bounds = f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+    in_year = f"{column} >= '{year}-01-01' AND {column} < '{year + 1}-01-01'"
+    default = f"{table}_default"
+    has_default = conn.execute(text("SELECT to_regclass(:name)"), {"name": default}).scalar() is not None
+    if not (has_default and conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_year})")).scalar()):
+        conn.execute(text(f"CREATE TABLE {partition} PARTITION OF {table} {bounds}"))
+        return
+    print(f"Moving {year} rows of {default} into {partition}")
+    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    conn.execute(text(f"CREATE TABLE {partition} PARTITION OF {table} {bounds}"))
+    conn.execute(text(f"INSERT INTO {partition} SELECT * FROM {default} WHERE {in_year}"))
+    conn.execute(text(f"DELETE FROM {default} WHERE {in_year}"))
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+
+def ensure_archive_partitions(conn):
+    """
+    Create a yearly partition for every year from the oldest active row up to
+    next year, plus a DEFAULT partition as a safety net for NULL and far-future
+    dates. Idempotent.
+    """
+    next_year = datetime.utcnow().year + 1
+    for table, (column, source) in PARTITIONED_ARCHIVES.items():
+        kind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}).scalar()
+        if kind != "p":
+            # Created unpartitioned by an earlier version; leave it as it is
+            print(f"{table} is not partitioned; skipping partition maintenance")
+            continue
+        first_year = conn.execute(text(f"SELECT CAST(extract(year FROM min({column})) AS integer) FROM {source}")).scalar()
+        for year in range(min(first_year or next_year, next_year), next_year + 1):
+            _create_year_partition(conn, table, column, year)
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+
+""" Archiving """
+ARCHIVE_PAWNS = text(f"""
+WITH due AS (
+    SELECT pawn_id FROM pawns WHERE pawn_expire_date < :cutoff OR redeemed_at < :cutoff
+    ORDER BY pawn_id LIMIT :batch_size FOR UPDATE SKIP LOCKED
+), pawn_details_moved AS (
+    DELETE FROM pawn_details d USING due, pawns p
+    WHERE d.pawn_id = due.pawn_id AND p.pawn_id = due.pawn_id
+    RETURNING d.*, p.pawn_date
+), pawn_payments_moved AS (
+    DELETE FROM pawn_payments pp USING due, pawns p
+    WHERE pp.pawn_id = due.pawn_id AND p.pawn_id = due.pawn_id
+    RETURNING pp.*, p.pawn_date
+), pawns_moved AS (
+    DELETE FROM pawns p USING due WHERE p.pawn_id = due.pawn_id
+    RETURNING p.*
+), pawn_details_archived AS (
+    {archive_insert("pawn_details", "pawn_details_moved")}
+), pawn_payments_archived AS (
+    {archive_insert("pawn_payments", "pawn_payments_moved")}
+), pawns_archived AS (
+    {archive_insert("pawns", "pawns_moved")}
+)
+SELECT (SELECT count(*) FROM pawns_moved) AS headers, (SELECT count(*) FROM pawn_details_moved) AS details,
+    (SELECT count(*) FROM pawn_payments_moved) AS payments
+""")
+
+ARCHIVE_ORDERS = text(f"""
+WITH due AS (
+    SELECT order_id FROM orders WHERE order_date < :cutoff
+    ORDER BY order_id LIMIT :batch_size FOR UPDATE SKIP LOCKED
+), order_details_moved AS (
+    DELETE FROM order_details d USING due WHERE d.order_id = due.order_id
+    RETURNING d.*
+), orders_moved AS (
+    DELETE FROM orders o USING due WHERE o.order_id = due.order_id
+    RETURNING o.*
+), order_details_archived AS (
+    {archive_insert("order_details", "order_details_moved")}
+), orders_archived AS (
+    {archive_insert("orders", "orders_moved")}
+)
+SELECT (SELECT count(*) FROM orders_moved) AS headers, (SELECT count(*) FROM order_details_moved) AS details
+""")
+
+_archived = {
+    table: metrics.counter("archived_rows_total", "Rows moved to the archive tables by the lifecycle job", {"table": table})
+    for table in ("pawns", "pawn_details", "pawn_payments", "orders", "order_details")
+}
+
+def _archive_in_batches(conn, statement, cutoff: datetime, header_table: str, detail_table: str) -> int:
+    moved = 0
+    while True:
+        row = conn.execute(statement, {"cutoff": cutoff, "batch_size": ARCHIVE_BATCH_SIZE}).one()
+        conn.commit()
+        _archived[header_table].inc(row.headers)
+        _archived[detail_table].inc(row.details)
+        if "payments" in row._fields:
+            _archived["pawn_payments"].inc(row.payments)
+        moved += row.headers
+        if row.headers < ARCHIVE_BATCH_SIZE:
+            return moved
+
+def archive_old_rows() -> dict:
+    """
+    Move pawns expired or redeemed more than PAWN_RETENTION_DAYS ago and orders older than
+    ORDER_RETENTION_DAYS into the archive. Returns the moved header counts, or
+    None when another worker holds the archive lock.
+    """
+    now = datetime.utcnow()
+    with database.engine.connect() as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": database.ARCHIVE_LOCK_KEY}).scalar():
+            conn.commit()
+            return None
+        try:
+            conn.commit()
+            ensure_archive_partitions(conn)
+            conn.commit()
+            return {
+                "pawns": _archive_in_batches(conn, ARCHIVE_PAWNS, now - timedelta(days=PAWN_RETENTION_DAYS), "pawns", "pawn_details"),
+                "orders": _archive_in_batches(conn, ARCHIVE_ORDERS, now - timedelta(days=ORDER_RETENTION_DAYS), "orders", "order_details"),
+            }
+        finally:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": database.ARCHIVE_LOCK_KEY})
+            conn.commit()
+
+async def archive_forever(initial_delay: float = 60.0):
+    """Long-running task: archive old rows every ARCHIVE_INTERVAL_HOURS once the database is ready."""
+    if not ARCHIVE_ENABLED:
+        return
+    await asyncio.sleep(initial_delay)
+    while not database.db_state.ready:
+        await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            moved = await asyncio.to_thread(archive_old_rows)
+            if moved:
+                print(f"Archived {moved['pawns']} pawn(s) and {moved['orders']} order(s)")
+        except Exception as e:
+            print(f"Archiving failed: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
@@ -0,0 +1,118 @@
+"""
+Line-diffing updates for the detail tables (pawn_details, order_details).
+
+A PATCH that sends product lines used to delete every stored line of the
+pawn/order and insert them all again. sync_lines() reads the stored lines
+once, matches the incoming ones by prod_id and writes only the difference:
+one bulk INSERT for new products, one bulk UPDATE by primary key for lines
+whose values changed and one DELETE for products no longer listed.
+Unchanged lines are not touched, so their rows, index entries and
+created_at stay as they are. Products named for the first time are added
+with add_products() in the same transaction, so the header, new products
+and lines commit together.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from entities import Product
+
+@dataclass(slots=True)
+class LineDiff:
+    inserts: List[dict] = field(default_factory=list)
+    updates: List[dict] = field(default_factory=list)
+    deletes: List[int] = field(default_factory=list)
+    unchanged: int = 0
+
+    def summary(self) -> dict:
+        return {
+            "inserted": len(self.inserts),
+            "updated": len(self.updates),
+            "deleted": len(self.deletes),
+            "unchanged": self.unchanged,
+        }
+
+def diff_lines(stored: Dict[int, dict], incoming: Dict[int, dict], fields: Iterable[str]) -> LineDiff:
+    """Compare lines keyed by prod_id; updates carry only the changed fields."""
+    diff = LineDiff()
+    for prod_id, line in incoming.items():
+        current = stored.get(prod_id)
+        if current is None:
+            diff.inserts.append({"prod_id": prod_id, **{name: line.get(name) for name in fields}})
+            continue
+        changed = {name: line.get(name) for name in fields if line.get(name) != current[name]}
+        if changed:
+            diff.updates.append({"prod_id": prod_id, **changed})
+        else:
+            diff.unchanged += 1
+    diff.deletes = sorted(set(stored) - set(incoming))
+    return diff
+
+def product_ids_by_name(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    """Existing products for the given names in one query, keyed by lower-cased name."""
+    keys = {name.lower() for name in names if name}
+    if not keys:
+        return {}
+    rows = db.execute(
+        select(func.lower(Product.prod_name), Product.prod_id)
+        .where(func.lower(Product.prod_name).in_(keys))
+    ).all()
+    return {name: prod_id for name, prod_id in rows}
+
+def add_products(db: Session, names: Iterable[str], user_id: Optional[int] = None) -> list:
+    """
+    Insert products for the given names (lower-cased) in one statement inside
+    the caller's transaction; returns their rows for publishing after the commit.
+    """
+    keys = sorted({name.lower() for name in names})
+    if not keys:
+        return []
+    return db.execute(
+        insert(Product).returning(Product.prod_id, Product.prod_name, Product.unit_price, Product.amount),
+        [{"prod_name": key, "user_id": user_id} for key in keys],
+    ).all()
+
+def resolve_lines(db: Session, products, fields: Iterable[str], user_id: Optional[int] = None) -> Tuple[List[dict], list]:
+    """
+    Incoming product lines (objects with prod_id/prod_name and `fields`) as dicts
+    with prod_id, resolving names in one query. Unknown products are inserted
+    with add_products() and returned for publishing after the caller commits.
+    """
+    names = [product.prod_name for product in products if product.prod_id is None]
+    if not all(names):
+        raise HTTPException(status_code=400, detail="Every product line needs a prod_id or a prod_name")
+    known = product_ids_by_name(db, names)
+    created = add_products(db, [name for name in names if name.lower() not in known], user_id)
+    known.update({product.prod_name: product.prod_id for product in created})
+    lines = [
+        {"prod_id": product.prod_id or known[product.prod_name.lower()], **{name: getattr(product, name) for name in fields}}
+        for product in products
+    ]
+    return lines, created
+
+def sync_lines(db: Session, model, parent_column, parent_id: int, lines: List[dict], fields: Iterable[str]) -> LineDiff:
+    """
+    Make the parent's stored lines equal to `lines` (dicts with prod_id and
+    `fields`; a later duplicate prod_id wins) with at most three statements.
+    The caller commits.
+    """
+    fields = tuple(fields)
+    parent = parent_column.key
+    stored = {
+        row.prod_id: row._asdict()
+        for row in db.execute(
+            select(model.prod_id, *(getattr(model, name) for name in fields)).where(parent_column == parent_id)
+        )
+    }
+    diff = diff_lines(stored, {line["prod_id"]: line for line in lines}, fields)
+
+    if diff.inserts:
+        db.execute(insert(model), [{parent: parent_id, **line} for line in diff.inserts])
+    if diff.updates:
+        db.execute(update(model), [{parent: parent_id, **line} for line in diff.updates])
+    if diff.deletes:
+        db.execute(delete(model).where(parent_column == parent_id, model.prod_id.in_(diff.deletes)))
+    return diff
@@ -1,19 +1,34 @@
+import asyncio
 import logging
 import os
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
+from sqlalchemy import text
 
+import change_feed
 import entities
+from compression import CompressionMiddleware
+import lifecycle
+import metrics
+import database
 from database import engine, SessionLocal
 import routes.oauth2.controller as auth_controller
 import routes.product.controller as product_controller
 import routes.client.controller as client_controller
 import routes.order.controller as order_controller
 import routes.pawn.controller as pawn_controller
+import routes.health.controller as health_controller
+import routes.events.controller as events_controller
+import routes.valuation.controller as valuation_controller
+import routes.counter.controller as counter_controller
+import routes.batch.controller as batch_controller
+from routes.events.repository import broker as event_broker
+from routes.health.repository import monitor as health_monitor
+from routes.valuation import engine as valuation_engine
 
 # Configure logging
 logging.basicConfig(
@@ -57,29 +72,57 @@ def create_default_admin():
         # Don't raise the exception to allow the app to continue
         logger.warning("Admin user creation failed, but application will continue")
 
+def bootstrap_database():
+    """Create missing tables, columns, indexes and archive partitions, upgrade foreign keys and create the default admin. Runs in a single worker (see run_once_across_workers)."""
+    entities.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        entities.add_missing_columns(conn)
+        entities.add_missing_indexes(conn)
+        entities.upgrade_foreign_keys(conn)
+        lifecycle.ensure_archive_partitions(conn)
+    logger.info("Database tables initialized.")
+    create_default_admin()
+
+def is_bootstrapped(conn) -> bool:
+    return conn.execute(text("SELECT to_regclass('public.accounts')")).scalar() is not None
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application startup and shutdown."""
     logger.info("Starting Pawn Shop API...")
-    try:
-        if engine is not None:
-            entities.Base.metadata.create_all(engine)
-            logger.info("Database tables initialized.")
-            create_default_admin()
-        else:
-            logger.warning("Database engine is not available. Skipping database initialization.")
-    except Exception as e:
-        logger.error(f"Startup failed: {str(e)}")
-        # Don't raise the exception to allow the app to start even if DB is not available
-        logger.warning("Application will start without database functionality")
+    connect_task = None
+    if engine is not None:
+        # Don't block startup on the database: start serving immediately and
+        # report /health/ready once the connection and bootstrap succeed
+        connect_task = asyncio.create_task(database.connect_in_background(bootstrap_database, is_bootstrapped))
+    else:
+        logger.warning("Database engine is not available. Skipping database initialization.")
+    health_task = asyncio.create_task(health_monitor.run())
+    event_broker.bind(asyncio.get_running_loop())
+    feed_task = archive_task = revalue_task = None
+    if engine is not None:
+        # Fans writes from every worker out to the in-process caches and the SSE stream
+        feed_task = asyncio.create_task(change_feed.listen())
+        # Moves expired pawns and old orders to the archive partitions (one worker at a time)
+        archive_task = asyncio.create_task(lifecycle.archive_forever())
+        # Refreshes the collateral valuation snapshot behind /valuation/at-risk
+        revalue_task = asyncio.create_task(valuation_engine.revalue_forever())
     yield
     logger.info("Shutting down Pawn Shop API...")
+    for task in (connect_task, health_task, feed_task, archive_task, revalue_task):
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
 app = FastAPI(
     title="Pawn Shop Backend API",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -90,35 +133,16 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
-    allow_headers=["Authorization", "Content-Type"] if ENVIRONMENT == "production" else ["*"],
+    allow_headers=["Authorization", "Content-Type", "Last-Event-ID"] if ENVIRONMENT == "production" else ["*"],
     expose_headers=["X-Total-Count"] if ENVIRONMENT == "production" else []
 )
+# zstd/br/gzip for large JSON bodies (see compression.py)
+app.add_middleware(CompressionMiddleware)
 
-@app.get("/health", tags=["Health"])
-async def health_check():
-    """Return API health status."""
-    try:
-        health_status = {
-            "status": "healthy", 
-            "version": "1.0.0",
-            "database": "connected" if engine is not None else "disconnected"
-        }
-        
-        # Test database connection if available
-        if engine is not None:
-            try:
-                from sqlalchemy import text
-                with engine.connect() as conn:
-                    conn.execute(text("SELECT 1"))
-                health_status["database"] = "connected"
-            except Exception as e:
-                health_status["database"] = "error"
-                health_status["database_error"] = str(e)
-        
-        return health_status
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        raise HTTPException(status_code=503, detail="Service unavailable")
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose this worker's pool and application metrics in Prometheus text format."""
+    return PlainTextResponse(metrics.render_prometheus())
 
 @app.get("/", tags=["Root"])
 async def root():
@@ -126,11 +150,16 @@ async def root():
     return {"message": "Pawn Shop API", "version": "1.0.0"}
 
 # Include API routers
+app.include_router(health_controller.router)
 app.include_router(auth_controller.router, prefix="/api/v1", tags=["Authentication"])
 app.include_router(product_controller.router, prefix="/api/v1", tags=["Products"])
 app.include_router(client_controller.router, prefix="/api/v1", tags=["Clients"])
 app.include_router(order_controller.router, prefix="/api/v1", tags=["Orders"])
 app.include_router(pawn_controller.router, prefix="/api/v1", tags=["Pawns"])
+app.include_router(events_controller.router, prefix="/api/v1", tags=["Events"])
+app.include_router(valuation_controller.router, prefix="/api/v1", tags=["Valuation"])
+app.include_router(counter_controller.router, prefix="/api/v1", tags=["Counter"])
+app.include_router(batch_controller.router, prefix="/api/v1", tags=["Batch"])
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
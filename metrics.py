@@ -0,0 +1,134 @@
+"""
+Minimal in-process metrics registry exported in Prometheus text format at /metrics.
+
+Every uvicorn worker keeps its own values; series carry a `pid` label so a
+scraper can tell workers apart.
+"""
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: List["Metric"] = []
+_registry_lock = threading.Lock()
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = dict(labels or {})
+        self._lock = threading.Lock()
+
+    def samples(self):
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=None):
+        super().__init__(name, help_text, labels)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=None, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, labels)
+        self.value = 0.0
+        self.fn = fn
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def get(self) -> float:
+        return self.fn() if self.fn is not None else self.value
+
+    def samples(self):
+        yield self.name, self.labels, self.get()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{self.name}_bucket", {**self.labels, "le": str(bound)}, cumulative
+        yield f"{self.name}_bucket", {**self.labels, "le": "+Inf"}, self.count
+        yield f"{self.name}_sum", self.labels, self.sum
+        yield f"{self.name}_count", self.labels, self.count
+
+def _register(metric: Metric) -> Metric:
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+def counter(name: str, help_text: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+    return _register(Counter(name, help_text, labels))
+
+def gauge(name: str, help_text: str, labels: Optional[Dict[str, str]] = None, fn: Optional[Callable[[], float]] = None) -> Gauge:
+    return _register(Gauge(name, help_text, labels, fn))
+
+def histogram(name: str, help_text: str, labels: Optional[Dict[str, str]] = None, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labels, buckets))
+
+def render_prometheus() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    pid = {"pid": str(os.getpid())}
+    lines = []
+    described = set()
+    with _registry_lock:
+        # Series of one metric must be contiguous in the exposition
+        metrics = sorted(_registry, key=lambda metric: metric.name)
+    for metric in metrics:
+        if metric.name not in described:
+            described.add(metric.name)
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+        try:
+            samples = list(metric.samples())
+        except Exception:
+            # A callback gauge whose source is gone must not break the whole scrape
+            continue
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels({**labels, **pid})} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,105 @@
+"""
+Compact result records built straight from query rows.
+
+Slotted dataclasses avoid a dict per row on the large listing endpoints and
+are serialized natively by orjson (see response_model.render_response).
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+@dataclass(slots=True)
+class PawnLine:
+    prod_id: int
+    prod_name: str
+    pawn_weight: str
+    pawn_amount: int
+    pawn_unit_price: float
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            prod_id=row.prod_id,
+            prod_name=row.prod_name,
+            pawn_weight=row.pawn_weight or "",
+            pawn_amount=row.pawn_amount or 0,
+            pawn_unit_price=float(row.pawn_unit_price) if row.pawn_unit_price else 0,
+        )
+
+@dataclass(slots=True)
+class PawnHeader:
+    pawn_id: int
+    cus_id: int
+    customer_name: str
+    phone_number: str
+    address: Optional[str]
+    pawn_deposit: float
+    pawn_date: str
+    pawn_expire_date: str
+    products: List[PawnLine] = field(default_factory=list)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            pawn_id=row.pawn_id,
+            cus_id=row.cus_id,
+            customer_name=row.cus_name,
+            phone_number=row.phone_number,
+            address=row.address,
+            pawn_deposit=float(row.pawn_deposit) if row.pawn_deposit else 0,
+            pawn_date=str(row.pawn_date) if row.pawn_date else "",
+            pawn_expire_date=str(row.pawn_expire_date) if row.pawn_expire_date else "",
+        )
+
+@dataclass(slots=True)
+class OrderLine:
+    prod_name: str
+    prod_id: int
+    order_weight: str
+    order_amount: Optional[int]
+    product_sell_price: float
+    product_labor_cost: float
+    product_buy_price: float
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            prod_name=row.prod_name,
+            prod_id=row.prod_id,
+            order_weight=row.order_weight,
+            order_amount=row.order_amount,
+            product_sell_price=row.product_sell_price,
+            product_labor_cost=row.product_labor_cost,
+            product_buy_price=row.product_buy_price,
+        )
+
+@dataclass(slots=True)
+class OrderHeader:
+    order_id: int
+    order_deposit: float
+    order_date: object
+    products: List[OrderLine] = field(default_factory=list)
+
+def group_pawn_rows(rows) -> List[PawnHeader]:
+    """Group joined pawn/detail/product rows into one PawnHeader per pawn_id, keeping row order."""
+    headers = {}
+    for row in rows:
+        header = headers.get(row.pawn_id)
+        if header is None:
+            header = headers[row.pawn_id] = PawnHeader.from_row(row)
+        # Rows are unique per (pawn_id, prod_id), but keep the old guard against join fan-out
+        if not any(line.prod_id == row.prod_id for line in header.products):
+            header.products.append(PawnLine.from_row(row))
+    return list(headers.values())
+
+def group_order_rows(rows, date_format: Optional[str] = None) -> List[OrderHeader]:
+    """Group joined order/detail/product rows into one OrderHeader per order_id, keeping row order."""
+    headers = {}
+    for row in rows:
+        header = headers.get(row.order_id)
+        if header is None:
+            order_date = row.order_date
+            if date_format is not None:
+                order_date = order_date.strftime(date_format) if order_date else ""
+            header = headers[row.order_id] = OrderHeader(row.order_id, row.order_deposit, order_date)
+        header.products.append(OrderLine.from_row(row))
+    return list(headers.values())
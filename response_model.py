@@ -1,5 +1,6 @@
 from typing import Optional, TypeVar, Generic
 from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
 
 T = TypeVar("T")
 
@@ -7,4 +8,20 @@ class ResponseModel(BaseModel, Generic[T]):
     code: int
     status: str
     message: Optional[str] = None
-    result: Optional[T] = None
\ No newline at end of file
+    result: Optional[T] = None
+
+def render_response(response: ResponseModel, headers: Optional[dict] = None) -> ORJSONResponse:
+    """
+    Serialize a ResponseModel with a single orjson pass.
+    Returning a Response makes FastAPI skip the response_model re-validation,
+    so use this for large listings whose result is already plain dicts/lists.
+    """
+    return ORJSONResponse(
+        content={
+            "code": response.code,
+            "status": response.status,
+            "message": response.message,
+            "result": response.result,
+        },
+        headers=headers,
+    )
\ No newline at end of file
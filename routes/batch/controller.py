@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, Response
+from response_model import ResponseModel
+from routes.oauth2.repository import get_current_user
+from routes.batch.repository import Staff
+from routes.batch.model import *
+
+router = APIRouter(
+    tags=["Batch"],
+)
+
+staff = Staff()
+
+""" Batch """
+@router.post("/batch", response_model=ResponseModel)
+def run_batch(batch: RunBatch, response: Response, current_user: dict = Depends(get_current_user)):
+    """
+    Run create_client / create_product / create_pawn / create_order /
+    post_payment operations in order in one transaction, with one
+    authentication and one round trip; later operations can use earlier
+    results ("$client.cus_id")
+    """
+    staff.is_staff(current_user)
+    result = staff.run_batch(batch, current_user)
+    response.status_code = result.code
+    return result
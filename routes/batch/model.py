@@ -0,0 +1,20 @@
+import os
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
+
+MAX_BATCH_OPERATIONS = int(os.getenv("MAX_BATCH_OPERATIONS", "50"))
+
+class BatchOperation(BaseModel):
+    """
+    One call of an existing endpoint. String values of the form "$name.field"
+    (or "$index.field") in body are replaced by a field of an earlier result,
+    e.g. {"cus_id": "$client.cus_id"}.
+    """
+    op: Literal["create_client", "create_product", "create_pawn", "create_order", "post_payment"]
+    ref: Optional[str] = Field(None, pattern=r"^[A-Za-z_][\w-]*$")
+    body: Dict[str, Any] = Field(default_factory=dict)
+
+class RunBatch(BaseModel):
+    """atomic: all or nothing; otherwise each operation commits or rolls back on its own"""
+    operations: List[BatchOperation] = Field(min_length=1, max_length=MAX_BATCH_OPERATIONS)
+    atomic: bool = True
@@ -0,0 +1,187 @@
+import re
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import change_feed
+import database
+from response_model import ResponseModel
+from routes.batch.model import BatchOperation, RunBatch
+from routes.client.cache import customer_cache
+from routes.client.repository import Staff as ClientStaff
+from routes.order.repository import Staff as OrderStaff
+from routes.pawn.model import PostPayment
+from routes.pawn.repository import Staff as PawnStaff
+from routes.product.repository import Staff as ProductStaff
+from routes.user.model import CreateClient, CreateOrder, CreatePawn, CreateProduct
+
+clients, products, pawns, orders = ClientStaff(), ProductStaff(), PawnStaff(), OrderStaff()
+
+# op -> (body model, handler(body, db, current_user)); the same repository
+# methods the single endpoints call
+OPERATIONS = {
+    "create_client": (CreateClient, lambda body, db, current_user: clients.create_client(body, db)),
+    "create_product": (CreateProduct, products.create_product),
+    "create_pawn": (CreatePawn, pawns.create_pawn),
+    "create_order": (CreateOrder, orders.create_order),
+    "post_payment": (PostPayment, lambda body, db, current_user: pawns.post_payments([body], db, current_user)),
+}
+
+REFERENCE = re.compile(r"^\$([A-Za-z_][\w-]*|\d+)\.(\w+)$")
+
+""" Transaction """
+@contextmanager
+def batch_session():
+    """
+    A session inside one connection-level transaction. The repository methods
+    commit as usual, but in "create_savepoint" mode a commit only releases a
+    savepoint; nothing is durable until the caller commits the transaction.
+    Local change events are held back until then (change_feed.defer).
+    """
+    if database.engine is None:
+        raise Exception("Database not configured")
+    with database.engine.connect() as connection:
+        transaction = connection.begin()
+        db = Session(bind=connection, autoflush=False, join_transaction_mode="create_savepoint")
+        try:
+            yield connection, transaction, db
+        finally:
+            db.close()
+            if transaction.is_active:
+                transaction.rollback()
+
+def forget(events: List[change_feed.ChangeEvent]):
+    # find_customer may have cached a customer this batch created and then rolled back
+    for event in events:
+        if event.table == "accounts":
+            customer_cache.invalidate(cus_id=event.id)
+
+""" References """
+def resolve(value: Any, results: Dict[str, dict]) -> Any:
+    """Replace "$name.field" strings, however deeply nested, by the field of an earlier result."""
+    if isinstance(value, str):
+        match = REFERENCE.match(value)
+        if match is None:
+            return value
+        name, key = match.groups()
+        result = results.get(name)
+        if not isinstance(result, dict) or key not in result:
+            raise HTTPException(status_code=400, detail=f"Unresolved reference {value}")
+        return result[key]
+    if isinstance(value, list):
+        return [resolve(item, results) for item in value]
+    if isinstance(value, dict):
+        return {key: resolve(item, results) for key, item in value.items()}
+    return value
+
+def outcome(value) -> tuple:
+    """(code, message, result) of a repository return value."""
+    if isinstance(value, ResponseModel):
+        return value.code, value.message, value.result
+    # create_product returns the Product itself when it has no price and amount
+    return 200, None, {column.key: getattr(value, column.key) for column in value.__mapper__.primary_key}
+
+class Staff:
+    def is_staff(self, current_user: dict):
+        if current_user['role'] != 'admin':
+            raise HTTPException(
+                status_code=403,
+                detail="Permission denied",
+            )
+
+    def run_batch(self, batch: RunBatch, current_user: dict):
+        """Run the operations in order in one transaction; returns one entry per operation"""
+        refs = [operation.ref for operation in batch.operations if operation.ref]
+        if len(refs) != len(set(refs)):
+            raise HTTPException(status_code=400, detail="Every ref must be unique within the batch")
+
+        with batch_session() as (connection, transaction, db):
+            events = change_feed.defer(db)
+            try:
+                entries, failure = self._run_operations(batch, connection, db, current_user, events)
+                if failure is not None and batch.atomic:
+                    transaction.rollback()
+                else:
+                    transaction.commit()
+            except Exception:
+                # Nothing was committed: drop customers the batch may have cached
+                forget(events)
+                raise
+
+        if failure is not None and batch.atomic:
+            forget(events)
+            for entry in entries:
+                if entry["status"] == "ok":
+                    entry["status"] = "rolled_back"
+            return ResponseModel(
+                code=failure["code"],
+                status="Error",
+                message=f"Operation {failure['index']} ({failure['op']}) failed; nothing was saved",
+                result=entries
+            )
+
+        for event in events:
+            change_feed.dispatch(event)
+        failed = sum(entry["status"] == "failed" for entry in entries)
+        return ResponseModel(
+            code=207 if failed else 200,
+            status="Partial" if failed else "Success",
+            message=f"{len(entries) - failed} of {len(entries)} operation(s) saved",
+            result=entries
+        )
+
+    def _run_operations(self, batch: RunBatch, connection, db: Session, current_user: dict, events: list) -> tuple:
+        """(entries, first failed entry or None); an atomic batch stops at the first failure"""
+        entries = []
+        results: Dict[str, dict] = {}
+        failure = None
+        for index, operation in enumerate(batch.operations):
+            entry = {"index": index, "op": operation.op, "ref": operation.ref}
+            entries.append(entry)
+            if failure is not None and batch.atomic:
+                entry.update(code=424, status="skipped")
+                continue
+
+            # Non-atomic batches undo just the failed operation
+            savepoint = None if batch.atomic else connection.begin_nested()
+            published = len(events)
+            try:
+                entry.update(self._run_operation(operation, db, current_user, results))
+                db.commit()
+                if savepoint is not None:
+                    savepoint.commit()
+            except (HTTPException, ValidationError, SQLAlchemyError) as e:
+                db.rollback()
+                if savepoint is not None:
+                    savepoint.rollback()
+                forget(events[published:])
+                del events[published:]
+                entry.update(self._failure(e))
+                failure = failure or entry
+                continue
+
+            if isinstance(entry["result"], dict):
+                results[str(index)] = entry["result"]
+                if operation.ref:
+                    results[operation.ref] = entry["result"]
+        return entries, failure
+
+    def _run_operation(self, operation: BatchOperation, db: Session, current_user: dict, results: Dict[str, dict]) -> dict:
+        model, handler = OPERATIONS[operation.op]
+        body = model.model_validate(resolve(operation.body, results))
+        code, message, result = outcome(handler(body, db, current_user))
+        if code >= 400:
+            # Repository methods that report a rejection instead of raising
+            raise HTTPException(status_code=code, detail=result or message)
+        return {"code": code, "status": "ok", "message": message, "result": result}
+
+    def _failure(self, error: Exception) -> dict:
+        if isinstance(error, HTTPException):
+            return {"code": error.status_code, "status": "failed", "message": error.detail}
+        if isinstance(error, ValidationError):
+            return {"code": 422, "status": "failed", "message": error.errors(include_url=False, include_context=False)}
+        return {"code": 500, "status": "failed", "message": f"Database error: {error}"}
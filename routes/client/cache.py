@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import change_feed
+import metrics
+from entities import Account
+
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "10000"))
+CUSTOMER_CACHE_TTL = float(os.getenv("CUSTOMER_CACHE_TTL", "300"))
+
+@dataclass(slots=True)
+class CustomerRecord:
+    cus_id: int
+    cus_name: str
+    address: Optional[str]
+    phone_number: str
+    role: str
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            cus_id=row.cus_id,
+            cus_name=row.cus_name,
+            address=row.address,
+            phone_number=row.phone_number,
+            role=row.role,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+        )
+
+    def public(self) -> dict:
+        """Response form."""
+        return {
+            "cus_id": self.cus_id,
+            "cus_name": self.cus_name,
+            "address": self.address,
+            "phone_number": self.phone_number,
+            "role": self.role,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+CUSTOMER_COLUMNS = (
+    Account.cus_id,
+    Account.cus_name,
+    Account.address,
+    Account.phone_number,
+    Account.role,
+    Account.created_at,
+    Account.updated_at,
+)
+
+class CustomerCache:
+    """
+    Bounded LRU of customer records with a TTL, reachable by cus_id or phone_number.
+    Entries are keyed by cus_id; the phone index only points at a cus_id.
+    """
+
+    def __init__(self, max_size: int = CUSTOMER_CACHE_SIZE, ttl: float = CUSTOMER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_phone = {}
+        self._lock = threading.Lock()
+        self._hits = metrics.counter("customer_cache_requests_total", "Customer cache lookups", {"result": "hit"})
+        self._misses = metrics.counter("customer_cache_requests_total", "Customer cache lookups", {"result": "miss"})
+        metrics.gauge("customer_cache_entries", "Customers held in this worker's cache", fn=lambda: len(self._entries))
+
+    def _get(self, cus_id) -> Optional[CustomerRecord]:
+        entry = self._entries.get(cus_id)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at < time.monotonic():
+            self._drop(cus_id)
+            return None
+        self._entries.move_to_end(cus_id)
+        return record
+
+    def _drop(self, cus_id):
+        entry = self._entries.pop(cus_id, None)
+        if entry is not None and self._by_phone.get(entry[1].phone_number) == cus_id:
+            del self._by_phone[entry[1].phone_number]
+
+    def get_by_id(self, cus_id: int) -> Optional[CustomerRecord]:
+        with self._lock:
+            record = self._get(cus_id)
+        (self._hits if record else self._misses).inc()
+        return record
+
+    def get_by_phone(self, phone_number: str) -> Optional[CustomerRecord]:
+        with self._lock:
+            cus_id = self._by_phone.get(phone_number)
+            record = self._get(cus_id) if cus_id is not None else None
+        (self._hits if record else self._misses).inc()
+        return record
+
+    def put(self, record: CustomerRecord):
+        with self._lock:
+            self._drop(record.cus_id)
+            self._entries[record.cus_id] = (time.monotonic() + self.ttl, record)
+            self._by_phone[record.phone_number] = record.cus_id
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, cus_id: Optional[int] = None, phone_number: Optional[str] = None):
+        with self._lock:
+            if cus_id is None and phone_number is not None:
+                cus_id = self._by_phone.get(phone_number)
+            if cus_id is not None:
+                self._drop(cus_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_phone.clear()
+
+customer_cache = CustomerCache()
+
+def find_customer(db: Session, cus_id: Optional[int] = None, phone_number: Optional[str] = None) -> Optional[CustomerRecord]:
+    """
+    Customer by cus_id (preferred) or phone_number, from the cache or one Core
+    query. Only primary reads fill the cache; replica sessions (get_read_db) just read.
+    """
+    if cus_id:
+        record = customer_cache.get_by_id(cus_id)
+        condition = Account.cus_id == cus_id
+    elif phone_number:
+        record = customer_cache.get_by_phone(phone_number)
+        condition = Account.phone_number == phone_number
+    else:
+        return None
+    if record is not None:
+        return record
+
+    row = db.connection().execute(select(*CUSTOMER_COLUMNS).where(condition)).first()
+    if row is None:
+        return None
+    record = CustomerRecord.from_row(row)
+    if not db.info.get("use_replica"):
+        # A lagging replica could put back a row another worker just invalidated
+        customer_cache.put(record)
+    return record
+
+def invalidate_customer(db: Session, cus_id: int, *phone_numbers: str, op: str = "update"):
+    """Announce a changed or deleted customer on the change feed; call after the commit."""
+    change_feed.publish(db, "accounts", op, cus_id, {"phones": list(phone_numbers)} if phone_numbers else None)
+
+def _on_account_change(event: change_feed.ChangeEvent):
+    customer_cache.invalidate(cus_id=event.id)
+    for phone_number in event.data.get("phones", ()):
+        customer_cache.invalidate(phone_number=phone_number)
+
+change_feed.subscribe("accounts", _on_account_change)
+# Entries may have changed while the feed was disconnected
+change_feed.on_resync(customer_cache.clear)
@@ -1,12 +1,15 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 # from models import Account
-from database import get_db
+from database import get_db, get_read_db
 from response_model import ResponseModel
 from routes.oauth2.repository import get_current_user
 from routes.client.repository import Staff
 from routes.client.model import *
+import etags
+from entities import Account
+from sqlalchemy import select
 # from routes.user.model import CreatePawn 
 
 router = APIRouter(
@@ -27,7 +30,7 @@ def create_client(client_info: CreateClient, db: Session = Depends(get_db), curr
 def get_clients_paginated(
     page: int = Query(1, ge=1, description="Page number (starts from 1)"),
     search: str = Query(None, description="Search by name, phone number, or address"),
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
@@ -36,46 +39,62 @@ def get_clients_paginated(
 @router.get("/client/{phone_number}", response_model=ResponseModel[List[GetClient]])
 def get_client_phone(
     phone_number: str,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.get_client_phone(phone_number, db)
+    result = staff.get_client_phone(phone_number, db)
+    client = db.execute(select(Account.cus_id, Account.version_id).where(Account.phone_number == phone_number)).first()
+    if client:
+        etags.set_entity_tag(response, "client", client.cus_id, client.version_id)
+    return result
 
 @router.delete("/client/{cus_id}", response_model=ResponseModel)
 def delete_client(
     cus_id: int,
+    archive: bool = Query(False, description="Move the client and their orders/pawns to the archive tables instead of discarding them"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.delete_client(cus_id, db)
+    return staff.delete_client(cus_id, db, archive)
 
 @router.delete("/client/phone/{phone_number}", response_model=ResponseModel)
 def delete_client_by_phone(
     phone_number: str,
+    archive: bool = Query(False, description="Move the client and their orders/pawns to the archive tables instead of discarding them"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.delete_client_by_phone(phone_number, db)
+    return staff.delete_client_by_phone(phone_number, db, archive)
 
 @router.patch("/client/{cus_id}", response_model=ResponseModel)
 def update_client(
     cus_id: int,
     client_update: CreateClient,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag from a previous update; 412 if the client changed since"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.update_client(cus_id, client_update, db)
+    result = staff.update_client(cus_id, client_update, db, if_match)
+    etags.set_entity_tag(response, "client", cus_id, (result.result or {}).get("version"))
+    return result
 
 @router.patch("/client/phone/{phone_number}", response_model=ResponseModel)
 def update_client_by_phone(
     phone_number: str,
     client_update: CreateClient,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag from a previous update; 412 if the client changed since"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.update_client_by_phone(phone_number, client_update, db)
\ No newline at end of file
+    result = staff.update_client_by_phone(phone_number, client_update, db, if_match)
+    updated = result.result or {}
+    etags.set_entity_tag(response, "client", updated.get("cus_id"), updated.get("version"))
+    return result
\ No newline at end of file
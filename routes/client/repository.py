@@ -5,11 +5,75 @@ from entities import *
 from response_model import ResponseModel
 from typing import List, Dict
 # from app.models import Client, Pawn
-from sqlalchemy.sql import func, or_, and_
+from sqlalchemy.sql import func, or_, and_, text
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from collections import defaultdict
 from typing import Dict, Any
 import math
+import change_feed
+import etags
+import lifecycle
+from routes.client.cache import find_customer, invalidate_customer
+
+""" Client deletion """
+# Deletes a customer's pawn/order details, pawns, orders and account in one
+# statement and returns the row counts. The children are deleted explicitly, so
+# it works whether or not the ON DELETE CASCADE upgrade has run. In archive mode
+# the deleted rows are inserted into the *_archive tables by the same statement.
+DELETE_CLIENT_SQL = """
+WITH client AS (
+    SELECT cus_id FROM accounts WHERE {key} = :value AND role = 'user' FOR UPDATE
+), pawn_details_moved AS (
+    DELETE FROM pawn_details d USING pawns p, client c
+    WHERE d.pawn_id = p.pawn_id AND p.cus_id = c.cus_id
+    RETURNING d.*, p.pawn_date
+), pawn_payments_moved AS (
+    DELETE FROM pawn_payments pp USING pawns p, client c
+    WHERE pp.pawn_id = p.pawn_id AND p.cus_id = c.cus_id
+    RETURNING pp.*, p.pawn_date
+), order_details_moved AS (
+    DELETE FROM order_details d USING orders o, client c
+    WHERE d.order_id = o.order_id AND o.cus_id = c.cus_id
+    RETURNING d.*
+), pawns_moved AS (
+    DELETE FROM pawns p USING client c WHERE p.cus_id = c.cus_id
+    RETURNING p.*
+), orders_moved AS (
+    DELETE FROM orders o USING client c WHERE o.cus_id = c.cus_id
+    RETURNING o.*
+), account_moved AS (
+    DELETE FROM accounts a USING client c WHERE a.cus_id = c.cus_id
+    RETURNING a.*
+){archive}
+SELECT m.cus_id, m.cus_name, m.phone_number,
+    (SELECT count(*) FROM orders_moved) AS orders,
+    (SELECT count(*) FROM order_details_moved) AS order_details,
+    (SELECT count(*) FROM pawns_moved) AS pawns,
+    (SELECT count(*) FROM pawn_details_moved) AS pawn_details,
+    (SELECT count(*) FROM pawn_payments_moved) AS pawn_payments
+FROM account_moved m
+"""
+
+ARCHIVE_CLIENT_SQL = "".join(
+    f""", {table}_archived AS (
+    {lifecycle.archive_insert(table, source)}
+)"""
+    for table, source in (
+        ("accounts", "account_moved"),
+        ("orders", "orders_moved"),
+        ("order_details", "order_details_moved"),
+        ("pawns", "pawns_moved"),
+        ("pawn_details", "pawn_details_moved"),
+        ("pawn_payments", "pawn_payments_moved"),
+    )
+)
+
+DELETE_CLIENT_STATEMENTS = {
+    (key, archive): text(DELETE_CLIENT_SQL.format(key=key, archive=ARCHIVE_CLIENT_SQL if archive else ""))
+    for key in ("cus_id", "phone_number")
+    for archive in (False, True)
+}
 
 class Staff:
     def is_staff(self, current_user: dict):
@@ -20,7 +84,7 @@ class Staff:
             )
             
     def create_client(self, client_info: CreateClient, db: Session, not_exist: bool = False):
-        existing_client = db.query(Account).filter(Account.phone_number == client_info.phone_number).first()
+        existing_client = find_customer(db, phone_number=client_info.phone_number)
         if existing_client:
             raise HTTPException(
                 status_code=400,
@@ -36,6 +100,7 @@ class Staff:
                 db.add(client)
                 db.commit()
                 db.refresh(client)
+                change_feed.publish(db, "accounts", "insert", client.cus_id)
             except SQLAlchemyError as e:
                 db.rollback()
                 print(f"Error occurred: {str(e)}")
@@ -51,11 +116,13 @@ class Staff:
         db.add(client)
         db.commit()
         db.refresh(client)
+        change_feed.publish(db, "accounts", "insert", client.cus_id)
         
         return ResponseModel(
             code=200,
             status="Success",
-            message="Client created successfully"
+            message="Client created successfully",
+            result={"cus_id": client.cus_id}
         )
         
     def get_clients_paginated(self, page: int, db: Session, search: str = None, page_size: int = 10):
@@ -111,7 +178,7 @@ class Staff:
         )
         
     def get_client_phone(self, phone_number: str, db: Session):
-        client = db.query(Account).filter(Account.phone_number == phone_number).all()
+        client = find_customer(db, phone_number=phone_number)
         
         if not client:
             # Return a structured response instead of raising an exception
@@ -125,123 +192,54 @@ class Staff:
         return ResponseModel(
             code=200,
             status="Success",
-            result=client
+            result=[client.public()]
         )
 
-    def delete_client(self, cus_id: int, db: Session):
-        """Delete a client and all their associated data (orders, pawns, etc.)"""
-        try:
-            # Check if client exists
-            client = db.query(Account).filter(
-                and_(
-                    Account.cus_id == cus_id,
-                    Account.role == 'user'  # Only allow deleting customers, not admins
-                )
-            ).first()
-            
-            if not client:
-                return ResponseModel(
-                    code=404,
-                    status="Error",
-                    message=f"Client with ID {cus_id} not found"
-                )
-            
-            # Get client's orders and pawns for summary
-            client_orders = db.query(Order).filter(Order.cus_id == cus_id).all()
-            client_pawns = db.query(Pawn).filter(Pawn.cus_id == cus_id).all()
-            
-            # Delete in reverse order to respect foreign key constraints
-            # 1. Delete pawn details
-            db.query(PawnDetail).join(Pawn).filter(Pawn.cus_id == cus_id).delete(synchronize_session=False)
-            
-            # 2. Delete order details
-            db.query(OrderDetail).join(Order).filter(Order.cus_id == cus_id).delete(synchronize_session=False)
-            
-            # 3. Delete pawns
-            db.query(Pawn).filter(Pawn.cus_id == cus_id).delete()
-            
-            # 4. Delete orders
-            db.query(Order).filter(Order.cus_id == cus_id).delete()
-            
-            # 5. Delete the client account
-            db.delete(client)
-            db.commit()
-            
-            # Prepare summary message
-            summary = []
-            if client_orders:
-                summary.append(f"{len(client_orders)} order(s)")
-            if client_pawns:
-                summary.append(f"{len(client_pawns)} pawn(s)")
-            
-            summary_text = f" and {', '.join(summary)}" if summary else ""
-            
-            return ResponseModel(
-                code=200,
-                status="Success",
-                message=f"Client {client.cus_name} (ID: {cus_id}) deleted successfully{summary_text}"
-            )
-            
-        except Exception as e:
-            db.rollback()
-            return ResponseModel(
-                code=500,
-                status="Error",
-                message=f"Failed to delete client: {str(e)}"
-            )
+    def delete_client(self, cus_id: int, db: Session, archive: bool = False):
+        """Delete (or archive) a client and all their associated data (orders, pawns, etc.)"""
+        return self._delete_client(db, "cus_id", cus_id, archive, f"Client with ID {cus_id} not found", f"ID: {cus_id}")
 
-    def delete_client_by_phone(self, phone_number: str, db: Session):
-        """Delete a client by phone number and all their associated data"""
+    def delete_client_by_phone(self, phone_number: str, db: Session, archive: bool = False):
+        """Delete (or archive) a client by phone number and all their associated data"""
+        return self._delete_client(db, "phone_number", phone_number, archive, f"Client with phone number {phone_number} not found", f"Phone: {phone_number}")
+
+    def _delete_client(self, db: Session, key: str, value, archive: bool, not_found: str, label: str):
         try:
-            # Check if client exists
-            client = db.query(Account).filter(
-                and_(
-                    Account.phone_number == phone_number,
-                    Account.role == 'user'  # Only allow deleting customers, not admins
-                )
-            ).first()
-            
-            if not client:
+            # One statement: nothing is loaded into the session however long the history
+            row = db.execute(DELETE_CLIENT_STATEMENTS[key, archive], {"value": value}).first()
+            if row is None:
+                db.rollback()
                 return ResponseModel(
                     code=404,
                     status="Error",
-                    message=f"Client with phone number {phone_number} not found"
+                    message=not_found
                 )
-            
-            # Get client's orders and pawns for summary
-            client_orders = db.query(Order).filter(Order.cus_id == client.cus_id).all()
-            client_pawns = db.query(Pawn).filter(Pawn.cus_id == client.cus_id).all()
-            
-            # Delete in reverse order to respect foreign key constraints
-            # 1. Delete pawn details
-            db.query(PawnDetail).join(Pawn).filter(Pawn.cus_id == client.cus_id).delete(synchronize_session=False)
-            
-            # 2. Delete order details
-            db.query(OrderDetail).join(Order).filter(Order.cus_id == client.cus_id).delete(synchronize_session=False)
-            
-            # 3. Delete pawns
-            db.query(Pawn).filter(Pawn.cus_id == client.cus_id).delete()
-            
-            # 4. Delete orders
-            db.query(Order).filter(Order.cus_id == client.cus_id).delete()
-            
-            # 5. Delete the client account
-            db.delete(client)
             db.commit()
+            invalidate_customer(db, row.cus_id, row.phone_number, op="delete")
             
             # Prepare summary message
             summary = []
-            if client_orders:
-                summary.append(f"{len(client_orders)} order(s)")
-            if client_pawns:
-                summary.append(f"{len(client_pawns)} pawn(s)")
+            if row.orders:
+                summary.append(f"{row.orders} order(s)")
+            if row.pawns:
+                summary.append(f"{row.pawns} pawn(s)")
             
             summary_text = f" and {', '.join(summary)}" if summary else ""
+            action = "archived" if archive else "deleted"
             
             return ResponseModel(
                 code=200,
                 status="Success",
-                message=f"Client {client.cus_name} (Phone: {phone_number}) deleted successfully{summary_text}"
+                message=f"Client {row.cus_name} ({label}) {action} successfully{summary_text}",
+                result={
+                    "cus_id": row.cus_id,
+                    "archived": archive,
+                    "orders": row.orders,
+                    "order_details": row.order_details,
+                    "pawns": row.pawns,
+                    "pawn_details": row.pawn_details,
+                    "pawn_payments": row.pawn_payments,
+                }
             )
             
         except Exception as e:
@@ -252,8 +250,8 @@ class Staff:
                 message=f"Failed to delete client: {str(e)}"
             )
 
-    def update_client(self, cus_id: int, client_update: CreateClient, db: Session):
-        """Update an existing client's information"""
+    def update_client(self, cus_id: int, client_update: CreateClient, db: Session, if_match: Optional[str] = None):
+        """Update an existing client's information; with if_match, only if it is still at that version (412 otherwise)"""
         try:
             # Check if client exists
             client = db.query(Account).filter(
@@ -269,6 +267,7 @@ class Staff:
                     status="Error",
                     message=f"Client with ID {cus_id} not found"
                 )
+            etags.require_version(if_match, "client", cus_id, client.version_id)
             
             # Check if new phone number conflicts with another client (if phone number is being updated)
             if client_update.phone_number and client_update.phone_number != client.phone_number:
@@ -288,6 +287,7 @@ class Staff:
                     )
             
             # Update client information
+            old_phone = client.phone_number
             if client_update.cus_name:
                 client.cus_name = client_update.cus_name
             if client_update.address:
@@ -296,13 +296,21 @@ class Staff:
                 client.phone_number = client_update.phone_number
             
             db.commit()
+            invalidate_customer(db, client.cus_id, old_phone)
             
             return ResponseModel(
                 code=200,
                 status="Success",
-                message=f"Client {client.cus_name} (ID: {cus_id}) updated successfully"
+                message=f"Client {client.cus_name} (ID: {cus_id}) updated successfully",
+                result={"cus_id": client.cus_id, "version": client.version_id}
             )
             
+        except HTTPException:
+            db.rollback()
+            raise
+        except StaleDataError:
+            db.rollback()
+            raise etags.conflict("client", client.cus_id)
         except Exception as e:
             db.rollback()
             return ResponseModel(
@@ -311,8 +319,8 @@ class Staff:
                 message=f"Failed to update client: {str(e)}"
             )
 
-    def update_client_by_phone(self, phone_number: str, client_update: CreateClient, db: Session):
-        """Update an existing client's information by phone number"""
+    def update_client_by_phone(self, phone_number: str, client_update: CreateClient, db: Session, if_match: Optional[str] = None):
+        """Update an existing client's information by phone number; if_match as in update_client"""
         try:
             # Check if client exists
             client = db.query(Account).filter(
@@ -328,6 +336,7 @@ class Staff:
                     status="Error",
                     message=f"Client with phone number {phone_number} not found"
                 )
+            etags.require_version(if_match, "client", client.cus_id, client.version_id)
             
             # Check if new phone number conflicts with another client (if phone number is being updated)
             if client_update.phone_number and client_update.phone_number != phone_number:
@@ -347,6 +356,7 @@ class Staff:
                     )
             
             # Update client information
+            old_phone = client.phone_number
             if client_update.cus_name:
                 client.cus_name = client_update.cus_name
             if client_update.address:
@@ -355,13 +365,21 @@ class Staff:
                 client.phone_number = client_update.phone_number
             
             db.commit()
+            invalidate_customer(db, client.cus_id, old_phone)
             
             return ResponseModel(
                 code=200,
                 status="Success",
-                message=f"Client {client.cus_name} (Phone: {phone_number}) updated successfully"
+                message=f"Client {client.cus_name} (Phone: {phone_number}) updated successfully",
+                result={"cus_id": client.cus_id, "version": client.version_id}
             )
             
+        except HTTPException:
+            db.rollback()
+            raise
+        except StaleDataError:
+            db.rollback()
+            raise etags.conflict("client", client.cus_id)
         except Exception as e:
             db.rollback()
             return ResponseModel(
@@ -0,0 +1,34 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Query, Response
+from sqlalchemy.orm import Session
+from database import get_db
+from response_model import ResponseModel
+from routes.oauth2.repository import get_current_user
+from routes.counter.repository import Staff
+import etags
+
+router = APIRouter(
+    tags=["Counter"],
+)
+
+staff = Staff()
+
+""" Counter Screen """
+@router.get("/counter/bootstrap", response_model=ResponseModel)
+def get_bootstrap(
+    last: int = Query(3, ge=1, le=20, description="How many of the latest pawns and orders"),
+    product_limit: int = Query(10, ge=1, le=100, description="Size of the first product page"),
+    product_search: Optional[str] = Query(None, description="Filter the product page by name"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Next pawn/order ids, the latest pawns and orders and the first product page
+    in one response, built by a single query
+    """
+    staff.is_staff(current_user)
+    document, tag = staff.get_bootstrap(db, last, product_limit, product_search)
+    if etags.not_modified(if_none_match, tag):
+        return etags.not_modified_response(tag)
+    return Response(content=document, media_type="application/json", headers={"ETag": tag})
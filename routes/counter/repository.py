@@ -0,0 +1,149 @@
+import hashlib
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+""" Counter bootstrap """
+# Everything a counter screen loads on start (/pawn/next-id, /order/next-id,
+# /pawn/last, /order/last and the first /product page) in one statement.
+# Postgres builds the whole response document, same shapes as those
+# endpoints, so the worker neither groups rows nor re-serializes them.
+BOOTSTRAP_SQL = text("""
+WITH last_pawns AS (
+    SELECT pawn_id, cus_id, pawn_date, pawn_expire_date, pawn_deposit, coalesce(balance_due, pawn_deposit, 0) AS balance_due
+    FROM pawns ORDER BY pawn_id DESC LIMIT :last
+), pawn_lines AS (
+    SELECT d.pawn_id,
+        json_agg(json_build_object(
+            'prod_name', pr.prod_name, 'prod_id', pr.prod_id,
+            'pawn_weight', d.pawn_weight, 'pawn_amount', d.pawn_amount, 'pawn_unit_price', d.pawn_unit_price,
+            'subtotal', d.pawn_amount * d.pawn_unit_price
+        ) ORDER BY d.prod_id) AS products,
+        count(*) AS total_products,
+        sum(d.pawn_amount * d.pawn_unit_price) AS total_amount
+    FROM pawn_details d JOIN products pr ON pr.prod_id = d.prod_id
+    WHERE d.pawn_id IN (SELECT pawn_id FROM last_pawns)
+    GROUP BY d.pawn_id
+), last_orders AS (
+    SELECT order_id, cus_id, order_date, order_deposit
+    FROM orders ORDER BY order_id DESC LIMIT :last
+), order_lines AS (
+    SELECT d.order_id,
+        json_agg(json_build_object(
+            'prod_name', pr.prod_name, 'prod_id', pr.prod_id,
+            'order_weight', d.order_weight, 'order_amount', d.order_amount,
+            'product_sell_price', d.product_sell_price, 'product_labor_cost', d.product_labor_cost,
+            'product_buy_price', d.product_buy_price,
+            'subtotal', d.order_amount * d.product_sell_price
+        ) ORDER BY d.prod_id) AS products,
+        count(*) AS total_products,
+        sum(d.order_amount * d.product_sell_price) AS total_amount
+    FROM order_details d JOIN products pr ON pr.prod_id = d.prod_id
+    WHERE d.order_id IN (SELECT order_id FROM last_orders)
+    GROUP BY d.order_id
+), product_page AS (
+    SELECT prod_id, prod_name, unit_price, amount
+    FROM products
+    WHERE CAST(:search AS text) IS NULL OR prod_name ILIKE '%' || CAST(:search AS text) || '%'
+    ORDER BY prod_id LIMIT :product_limit
+), product_count AS (
+    SELECT count(*) AS total FROM products
+    WHERE CAST(:search AS text) IS NULL OR prod_name ILIKE '%' || CAST(:search AS text) || '%'
+)
+SELECT json_build_object(
+    'code', 200,
+    'status', 'Success',
+    'message', 'Counter bootstrap retrieved successfully',
+    'result', json_build_object(
+        'next_pawn_id', (SELECT coalesce(max(pawn_id), 0) + 1 FROM pawns),
+        'next_order_id', (SELECT coalesce(max(order_id), 0) + 1 FROM orders),
+        'last_pawns', coalesce((
+            SELECT json_agg(json_build_object(
+                'pawn_info', json_build_object(
+                    'pawn_id', p.pawn_id,
+                    'pawn_date', to_char(p.pawn_date, 'YYYY-MM-DD'),
+                    'pawn_expire_date', to_char(p.pawn_expire_date, 'YYYY-MM-DD'),
+                    'pawn_deposit', p.pawn_deposit,
+                    'total_amount', coalesce(l.total_amount, 0),
+                    'remaining_balance', coalesce(l.total_amount, 0) - p.pawn_deposit
+                ),
+                'client_info', CASE WHEN a.cus_id IS NULL THEN NULL ELSE json_build_object(
+                    'cus_id', a.cus_id, 'cus_name', a.cus_name, 'address', a.address, 'phone_number', a.phone_number
+                ) END,
+                'products', coalesce(l.products, '[]'::json),
+                'summary', json_build_object(
+                    'total_products', coalesce(l.total_products, 0),
+                    'total_amount', coalesce(l.total_amount, 0),
+                    'deposit_paid', p.pawn_deposit,
+                    'balance_due', p.balance_due
+                )
+            ) ORDER BY p.pawn_id DESC)
+            FROM last_pawns p
+            LEFT JOIN accounts a ON a.cus_id = p.cus_id AND a.role = 'user'
+            LEFT JOIN pawn_lines l ON l.pawn_id = p.pawn_id
+        ), '[]'::json),
+        'last_orders', coalesce((
+            SELECT json_agg(json_build_object(
+                'order_info', json_build_object(
+                    'order_id', o.order_id,
+                    'order_date', to_char(o.order_date, 'YYYY-MM-DD HH24:MI:SS'),
+                    'order_deposit', o.order_deposit,
+                    'total_amount', coalesce(l.total_amount, 0),
+                    'remaining_balance', coalesce(l.total_amount, 0) - o.order_deposit
+                ),
+                'client_info', CASE WHEN a.cus_id IS NULL THEN NULL ELSE json_build_object(
+                    'cus_id', a.cus_id, 'cus_name', a.cus_name, 'address', a.address, 'phone_number', a.phone_number
+                ) END,
+                'products', coalesce(l.products, '[]'::json),
+                'summary', json_build_object(
+                    'total_products', coalesce(l.total_products, 0),
+                    'total_amount', coalesce(l.total_amount, 0),
+                    'deposit_paid', o.order_deposit,
+                    'balance_due', coalesce(l.total_amount, 0) - o.order_deposit
+                )
+            ) ORDER BY o.order_id DESC)
+            FROM last_orders o
+            LEFT JOIN accounts a ON a.cus_id = o.cus_id AND a.role = 'user'
+            LEFT JOIN order_lines l ON l.order_id = o.order_id
+        ), '[]'::json),
+        'products', json_build_object(
+            'products', coalesce((
+                SELECT json_agg(json_build_object('id', prod_id, 'name', prod_name, 'price', unit_price, 'amount', amount) ORDER BY prod_id)
+                FROM product_page
+            ), '[]'::json),
+            'pagination', (
+                SELECT json_build_object(
+                    'current_page', 1,
+                    'total_pages', greatest(ceil(total / CAST(:product_limit AS numeric)), 1),
+                    'total_count', total,
+                    'limit', :product_limit,
+                    'has_next', total > :product_limit,
+                    'has_prev', false
+                )
+                FROM product_count
+            )
+        )
+    )
+)::text
+""")
+
+class Staff:
+    def is_staff(self, current_user: dict):
+        if current_user['role'] != 'admin':
+            raise HTTPException(
+                status_code=403,
+                detail="Permission denied",
+            )
+
+    def get_bootstrap(self, db: Session, last: int = 3, product_limit: int = 10, search: Optional[str] = None) -> Tuple[str, str]:
+        """The bootstrap document as JSON text, and a strong ETag over its bytes"""
+        document = db.execute(BOOTSTRAP_SQL, {
+            "last": last,
+            "product_limit": product_limit,
+            "search": search or None,
+        }).scalar()
+        # The document is small; hashing it is cheaper than a second round trip for watermarks
+        etag = '"counter-' + hashlib.blake2b(document.encode(), digest_size=12).hexdigest() + '"'
+        return document, etag
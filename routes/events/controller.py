@@ -0,0 +1,48 @@
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+
+from routes.events.repository import broker
+from routes.oauth2.repository import verify_access_token
+
+router = APIRouter(
+    tags=["Events"],
+)
+
+""" Live counter events """
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = Query(None, description="Access token (EventSource cannot send an Authorization header)"),
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-sent events for counter screens: `pawn` and `order` (op insert/update/delete),
+    `next_id`, a `snapshot` of the next ids on connect, `resync` when events may have
+    been missed, and a heartbeat comment when idle.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if token is None and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise credentials_exception
+    current_user = verify_access_token(token, credentials_exception)
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    subscriber = broker.subscribe(last_event_id)
+    return StreamingResponse(
+        broker.stream(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import secrets
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import func, select
+
+import change_feed
+import database
+import metrics
+from entities import Order, Pawn
+
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+# Recent events kept for replay when a browser reconnects with Last-Event-ID
+EVENTS_REPLAY_SIZE = int(os.getenv("EVENTS_REPLAY_SIZE", "512"))
+
+# change feed table -> (SSE event name, next-id key)
+STREAMED_TABLES = {
+    "pawns": ("pawn", "next_pawn_id"),
+    "orders": ("order", "next_order_id"),
+}
+
+class Subscriber:
+    """One SSE connection: a bounded queue; a client too slow to drain it is disconnected."""
+
+    def __init__(self, max_size: int):
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.overflowed = False
+
+    def offer(self, message: str):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The browser reconnects with Last-Event-ID and catches up from the replay buffer
+            self.overflowed = True
+
+class EventBroker:
+    """
+    Turns change-feed events for pawns and orders into server-sent events for the
+    counter screens, and tracks the next pawn/order ids so screens don't poll
+    /pawn/next-id and /order/next-id.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers = set()
+        self.next_ids = {key: None for _, key in STREAMED_TABLES.values()}
+        # Event ids are "<epoch>-<sequence>": the sequence is per process, so an id
+        # from another worker or an earlier process must not be replayed against it
+        self._epoch = secrets.token_hex(4)
+        self._sequence = 0
+        self._replay = deque(maxlen=EVENTS_REPLAY_SIZE)
+        self._connections = metrics.gauge("events_connections", "Open SSE connections", fn=lambda: len(self.subscribers))
+        self._dropped = metrics.counter("events_slow_consumers_total", "SSE connections closed because their queue was full")
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    # Change feed side: may run on request threads
+    def on_change(self, event: change_feed.ChangeEvent):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._apply_change, event)
+
+    def on_resync(self):
+        # Events may have been missed: reload next ids and tell screens to refetch
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._broadcast, "resync", {})
+        return self.refresh_next_ids()
+
+    # Event loop side
+    def _apply_change(self, event: change_feed.ChangeEvent):
+        name, key = STREAMED_TABLES[event.table]
+        self._broadcast(name, {"op": event.op, "id": event.id, **event.data})
+
+        current = self.next_ids[key]
+        if event.op == "insert" and current is not None and event.id >= current:
+            self._set_next_id(key, event.id + 1)
+        elif event.op == "delete" and (current is None or event.id == current - 1):
+            # The highest id went away; only the database knows the new maximum
+            asyncio.ensure_future(self._refresh_quietly())
+
+    def _set_next_id(self, key: str, value: int):
+        if self.next_ids[key] != value:
+            self.next_ids[key] = value
+            self._broadcast("next_id", {key: value})
+
+    def _broadcast(self, name: str, data: dict):
+        self._sequence += 1
+        message = f"id: {self._epoch}-{self._sequence}\nevent: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+        self._replay.append((self._sequence, message))
+        for subscriber in self.subscribers:
+            subscriber.offer(message)
+
+    async def refresh_next_ids(self):
+        def query():
+            with database.engine.connect() as conn:
+                return (
+                    conn.execute(select(func.max(Pawn.pawn_id))).scalar(),
+                    conn.execute(select(func.max(Order.order_id))).scalar(),
+                )
+        max_pawn, max_order = await asyncio.to_thread(query)
+        self._set_next_id("next_pawn_id", (max_pawn or 0) + 1)
+        self._set_next_id("next_order_id", (max_order or 0) + 1)
+
+    async def _refresh_quietly(self):
+        try:
+            await self.refresh_next_ids()
+        except Exception as e:
+            print(f"Failed to refresh next ids: {e}")
+
+    def _missed_since(self, last_event_id: str) -> Optional[list]:
+        """Messages after last_event_id, or None when this process can't tell what was missed."""
+        epoch, _, position = last_event_id.rpartition("-")
+        if epoch != self._epoch or not position.isdigit():
+            return None
+        last_seen = int(position)
+        if last_seen > self._sequence:
+            return None
+        if last_seen == self._sequence:
+            return []
+        # Replay only if nothing between last_seen and now has been evicted
+        if not self._replay or self._replay[0][0] > last_seen + 1:
+            return None
+        return [message for sequence, message in self._replay if sequence > last_seen]
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(EVENTS_QUEUE_SIZE)
+        missed = self._missed_since(last_event_id) if last_event_id else None
+        if missed is not None:
+            for message in missed:
+                subscriber.offer(message)
+        else:
+            # The id moves the browser onto this process's sequence for its next reconnect
+            subscriber.offer(f"id: {self._epoch}-{self._sequence}\nevent: snapshot\ndata: {json.dumps(self.next_ids)}\n\n")
+            if last_event_id:
+                # Reconnected from another worker, a restart or past the replay buffer
+                subscriber.offer("event: resync\ndata: {}\n\n")
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+        if subscriber.overflowed:
+            self._dropped.inc()
+
+    async def stream(self, subscriber: Subscriber, is_disconnected):
+        """SSE body: queued events, a comment line as heartbeat when idle."""
+        try:
+            yield "retry: 3000\n\n"
+            while not subscriber.overflowed:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+broker = EventBroker()
+
+for table in STREAMED_TABLES:
+    change_feed.subscribe(table, broker.on_change)
+change_feed.on_resync(broker.on_resync)
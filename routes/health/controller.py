@@ -0,0 +1,33 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from routes.health.repository import monitor
+
+router = APIRouter(
+    tags=["Health"],
+)
+
+""" Probes """
+@router.get("/health/live")
+async def liveness_check():
+    """Process is up and the event loop is responsive; never does I/O."""
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness_check():
+    """Cached database, pool and replica health plus live threadpool saturation; 503 when not ready."""
+    result = monitor.readiness()
+    return JSONResponse(status_code=200 if result["status"] == "ready" else 503, content=result)
+
+@router.get("/health")
+async def health_check():
+    """Summary kept for existing clients; served from the cached snapshot."""
+    database = monitor.snapshot["database"]
+    health_status = {
+        "status": "healthy",
+        "version": "1.0.0",
+        "database": database.get("status", "unknown"),
+    }
+    if "error" in database:
+        health_status["database_error"] = database["error"]
+    return health_status
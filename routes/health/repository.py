@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+
+import anyio.to_thread
+from sqlalchemy import text
+
+import database
+import metrics
+
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "5"))
+
+class HealthMonitor:
+    """
+    Deep health snapshot refreshed by one background task per worker.
+    Probes read the cached snapshot, so they never open connections or
+    compete with request traffic for pool slots.
+    """
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.snapshot = {"database": {"status": "unknown"}}
+        self.checked_at = None
+        self._latency = metrics.gauge("health_db_latency_seconds", "Round trip of the last health SELECT 1", fn=self._last_latency)
+
+    def _last_latency(self) -> float:
+        latency = self.snapshot["database"].get("latency_ms")
+        return latency / 1000 if latency is not None else -1
+
+    def probe_database(self) -> dict:
+        if database.engine is None:
+            return {"status": "disabled"}
+        started = time.perf_counter()
+        with database.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return {"status": "connected", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def collect(self) -> dict:
+        """Run the I/O-bound checks; called from a worker thread."""
+        try:
+            db = self.probe_database()
+        except Exception as e:
+            db = {"status": "error", "error": str(e)}
+
+        snapshot = {"database": db, "bootstrap": database.db_state.status()}
+        if database.engine is not None:
+            snapshot["pool"] = database.pool_status(database.engine)
+        if database.replica_monitor is not None:
+            # The monitor refreshes itself on its own interval; don't add a second lag query
+            database.replica_monitor.usable()
+            snapshot["replica"] = {**database.replica_monitor.status(), "pool": database.pool_status(database.read_engine)}
+        return snapshot
+
+    async def refresh(self):
+        try:
+            with anyio.fail_after(self.timeout):
+                self.snapshot = await asyncio.to_thread(self.collect)
+        except TimeoutError:
+            self.snapshot = {**self.snapshot, "database": {"status": "timeout", "error": f"health check exceeded {self.timeout:.0f}s"}}
+        self.checked_at = time.monotonic()
+
+    async def run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    def saturation(self) -> dict:
+        """Threadpool usage of this worker; sync endpoints queue here once every token is borrowed."""
+        statistics = anyio.to_thread.current_default_thread_limiter().statistics()
+        return {
+            "threads_busy": statistics.borrowed_tokens,
+            "threads_total": statistics.total_tokens,
+            "queued": statistics.tasks_waiting,
+        }
+
+    def stale(self) -> bool:
+        return self.checked_at is None or time.monotonic() - self.checked_at > self.interval * 3 + self.timeout
+
+    def readiness(self) -> dict:
+        ready = (
+            database.engine is not None
+            and database.db_state.ready
+            and self.snapshot["database"].get("status") == "connected"
+            and not self.stale()
+        )
+        return {
+            "status": "ready" if ready else "not_ready",
+            "checked_seconds_ago": None if self.checked_at is None else round(time.monotonic() - self.checked_at, 1),
+            **self.snapshot,
+            "saturation": self.saturation(),
+        }
+
+monitor = HealthMonitor()
@@ -45,8 +45,8 @@ def sign_in_get(
     db: Session = Depends(get_db)
 ):
     """Login endpoint that accepts query parameters for easier testing"""
-    user = db.query(Account).filter(Account.phone_number == phone_number).first()
-    if user and pwd_context.verify(password, user.password):
+    user = get_credentials(db, phone_number)
+    if user and user.password and pwd_context.verify(password, user.password):
         access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")))
         refresh_token_expires = timedelta(days=int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7")))
         access_token = create_token(data={"sub": user.phone_number, "id": user.cus_id, "type": "access_token", "role": user.role}, expires_delta=access_token_expires)
@@ -91,7 +91,7 @@ def refresh_access_token(refresh_token: str, db: Session = Depends(get_db)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     payload = verify_refresh_token(refresh_token, credentials_exception)
-    user = db.query(Account).filter(Account.phone_number == payload.get("sub")).first()
+    user = get_credentials(db, payload.get("sub"))
     if user:
         access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")))
         access_token = create_token(data={"sub": user.phone_number, "id": user.cus_id, "type": "access_token", "role": user.role}, expires_delta=access_token_expires)
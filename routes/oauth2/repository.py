@@ -4,6 +4,7 @@ from jose import JWTError, jwt
 from fastapi.security import HTTPBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from entities import Account
 from dotenv import load_dotenv
@@ -31,6 +32,15 @@ def create_user(db: Session, cus_name: str, phone_number: str, password: Optiona
     db.refresh(user)
     return user
 
+def get_credentials(db: Session, phone_number: str):
+    """Sign-in fields read from the session's bind (the primary for get_db); never from the customer cache"""
+    if not phone_number:
+        return None
+    return db.execute(
+        select(Account.cus_id, Account.phone_number, Account.role, Account.password)
+        .where(Account.phone_number == phone_number)
+    ).first()
+
 def create_token(data: dict, expires_delta: timedelta):
     to_encode = data.copy()
     expire = datetime.utcnow() + expires_delta
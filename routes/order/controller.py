@@ -1,11 +1,12 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from database import get_db
-from response_model import ResponseModel
+from database import get_db, get_read_db
+from response_model import ResponseModel, render_response
 from routes.oauth2.repository import get_current_user
 from routes.order.repository import Staff
 from routes.order.model import *
+import etags
 
 router = APIRouter(
     tags=["Orders"],
@@ -23,7 +24,7 @@ def create_order(order_info: CreateOrder, db: Session = Depends(get_db), current
 
 @router.get("/order", response_model=ResponseModel)
 def get_client_order(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
@@ -37,7 +38,7 @@ def get_all_client_order(
     search_name: str = Query(None, description="Search by customer name"),
     search_phone: str = Query(None, description="Search by phone number"),
     search_address: str = Query(None, description="Search by address"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
@@ -58,7 +59,7 @@ def get_all_client_order(
 @router.get("/order/client/{cus_id}", response_model=ResponseModel)
 def get_client_id(
     cus_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
@@ -69,7 +70,7 @@ def get_client_order(
     phone_number: Optional[str] = None,
     cus_name: Optional[str] = None,
     cus_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
@@ -91,24 +92,31 @@ def get_last_order(
     staff.is_staff(current_user)
     return staff.get_last_order(db)
 
-@router.get("/order/print", response_model=ResponseModel)
+@router.get("/order/print", response_model=ResponseModel[Union[OrderPrintDocument, List[CustomerOrderPrint]]])
 def get_order_print(
     order_id: Optional[int] = None, 
-    db: Session = Depends(get_db), 
+    history: bool = Query(False, description="Include archived orders"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db), 
     current_user: dict = Depends(get_current_user)):
 
     staff.is_staff(current_user) 
     if not order_id:
         raise HTTPException(status_code=400, detail="Order ID is required")
     
+    # Answer a poll for an unchanged order before building it
+    tag = etags.order_print_tag(db, order_id)
+    if etags.not_modified(if_none_match, tag):
+        return etags.not_modified_response(tag)
+    
     try:
         # Call your staff.get_order_print function
-        result = staff.get_order_print(db, order_id)
+        result = staff.get_order_print(db, order_id, history)
         
         if not result:
             raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
         
-        return result
+        return render_response(result, {"ETag": tag} if tag else None)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -125,8 +133,12 @@ def delete_order(
 def update_order(
     order_id: int,
     order_update: PatchOrder,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag from a previous read; 412 if the order changed since"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.update_order(order_id, order_update, db, current_user)
\ No newline at end of file
+    result = staff.update_order(order_id, order_update, db, current_user, if_match)
+    etags.set_entity_tag(response, "order", order_id, (result.result or {}).get("version"))
+    return result
\ No newline at end of file
@@ -76,4 +76,41 @@ class PatchOrder(BaseModel):
     phone_number: Optional[str] = None
     order_date: Optional[date] = None
     order_deposit: Optional[float] = None
-    order_product_detail: List[BuyProducts] = Field(default_factory=list)
\ No newline at end of file
+    order_product_detail: List[BuyProducts] = Field(default_factory=list)
+
+""" Result documents (response schema only, serialized without re-validation) """
+class OrderPrintProduct(BaseModel):
+    prod_id: int
+    prod_name: str
+    order_weight: Optional[str] = None
+    order_amount: Optional[int] = None
+    product_sell_price: Optional[float] = None
+    product_labor_cost: Optional[float] = None
+    product_buy_price: Optional[float] = None
+    item_profit: float
+
+class OrderPrintCustomer(BaseModel):
+    cus_id: int
+    customer_name: str
+    phone_number: str
+    address: Optional[str] = None
+
+class OrderPrintDocument(BaseModel):
+    order_id: int
+    order_deposit: float
+    order_date: str
+    total_amount: float
+    total_cost: float
+    profit: float
+    customer: OrderPrintCustomer
+    products: List[OrderPrintProduct] = Field(default_factory=list)
+
+class OrderPrintEntry(BaseModel):
+    order_id: int
+    order_deposit: float
+    order_date: str
+    products: List[OrderPrintProduct] = Field(default_factory=list)
+    order_total: float
+
+class CustomerOrderPrint(OrderPrintCustomer):
+    orders: List[OrderPrintEntry] = Field(default_factory=list)
@@ -7,10 +7,18 @@ from entities import *
 from response_model import ResponseModel
 from typing import List, Dict, Optional
 # from app.models import Client, Pawn
-from sqlalchemy.sql import func, or_, and_
+from sqlalchemy.sql import func, or_, and_, select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from collections import defaultdict
 from typing import Dict, Any
+from records import group_order_rows
+import statements
+import change_feed
+import line_diff
+import etags
+from routes.client.cache import find_customer, invalidate_customer
+from routes.product.catalog import publish_product
 
 class Staff:
     def is_staff(self, current_user: dict):
@@ -22,12 +30,9 @@ class Staff:
         
     def create_client(self, client_info: CreateClient, db: Session, not_exist: bool = False):
         # Check for existing client by phone_number
-        existing_client = db.query(Account).filter(
-            Account.phone_number == client_info.phone_number,
-            Account.role == 'user'
-        ).first()
+        existing_client = find_customer(db, phone_number=client_info.phone_number)
 
-        if existing_client:
+        if existing_client and existing_client.role == 'user':
             raise HTTPException(
                 status_code=400,
                 detail="Phone Number already registered",
@@ -44,6 +49,7 @@ class Staff:
                 db.add(client)
                 db.commit()
                 db.refresh(client)
+                change_feed.publish(db, "accounts", "insert", client.cus_id)
             except SQLAlchemyError as e:
                 db.rollback()
                 print(f"Error occurred: {str(e)}")
@@ -61,6 +67,7 @@ class Staff:
         db.add(client)
         db.commit()
         db.refresh(client)
+        change_feed.publish(db, "accounts", "insert", client.cus_id)
         
         return ResponseModel(
             code=200,
@@ -69,18 +76,20 @@ class Staff:
         )
         
     def create_order(self, order_info: CreateOrder, db: Session, current_user: dict):
-        existing_customer = db.query(Account).filter(
-            and_(
-                or_(Account.cus_id == order_info.cus_id),  # Simplified (removed duplicate)
-                Account.role == 'user'
-            )
-        ).first()
+        # Customer by cus_id, served from the customer cache
+        existing_customer = find_customer(db, cus_id=order_info.cus_id)
+        if existing_customer and existing_customer.role != 'user':
+            existing_customer = None
 
         if existing_customer:
-            existing_customer.cus_name = order_info.cus_name
-            existing_customer.address = order_info.address
-            db.commit()
-            db.refresh(existing_customer)
+            # Skip the write when name and address are unchanged
+            if (existing_customer.cus_name, existing_customer.address) != (order_info.cus_name, order_info.address):
+                db.query(Account).filter(Account.cus_id == existing_customer.cus_id).update(
+                    {"cus_name": order_info.cus_name, "address": order_info.address, "version_id": Account.version_id + 1},
+                    synchronize_session=False,
+                )
+                db.commit()
+                invalidate_customer(db, existing_customer.cus_id)
         else:
             existing_customer = self.create_client(
                 CreateClient(
@@ -134,11 +143,13 @@ class Staff:
             db.add(order_detail)
 
         db.commit()
+        change_feed.publish(db, "orders", "insert", order.order_id, {"cus_id": order.cus_id})
 
         return ResponseModel(
             code=200,
             status="Success",
-            message="ផលិតផលរក្សាទុកបានជោគជ័យ"
+            message="ផលិតផលរក្សាទុកបានជោគជ័យ",
+            result={"order_id": order.order_id, "cus_id": order.cus_id}
         )
         
     def get_client_order(self, db: Session, phone_number: Optional[str] = None, cus_name: Optional[str] = None, cus_id: Optional[int] = None):
@@ -152,15 +163,13 @@ class Staff:
         if cus_id:
             filters.append(Account.cus_id == cus_id)
 
-        # Fetch ALL customers matching the search criteria with all required fields
-        clients = db.query(
-            Account.cus_id, 
-            Account.cus_name, 
-            Account.phone_number, 
-            Account.address
-        ).filter(and_(*filters)).all()
+        # Fetch ALL customers matching the search criteria as plain dicts
+        clients_data = statements.fetch_mappings(
+            db,
+            select(Account.cus_id, Account.cus_name, Account.phone_number, Account.address).where(*filters),
+        )
 
-        if not clients:
+        if not clients_data:
             return ResponseModel(
                 code=404,
                 status="Error",
@@ -168,16 +177,6 @@ class Staff:
                 result=[]
             )
 
-        # Convert to list of dictionaries for better JSON response
-        clients_data = []
-        for client in clients:
-            clients_data.append({
-                "cus_id": client.cus_id,
-                "cus_name": client.cus_name,
-                "phone_number": client.phone_number,
-                "address": client.address
-            })
-
         return ResponseModel(
             code=200,
             status="Success",
@@ -190,30 +189,14 @@ class Staff:
         db: Session,
         cus_id: Optional[str] = None,
     ):
-        orders = (
-            db.query(
-                Account.cus_name,
-                Account.cus_id,
-                Account.address
-            )
-            .filter(
-                and_(
-                    Account.cus_id == cus_id,
-                    Account.role == "user",
-                )
-            )
-            .all()
+        result = statements.fetch_mappings(
+            db,
+            select(Account.cus_name, Account.cus_id, Account.address).where(
+                Account.cus_id == cus_id,
+                Account.role == "user",
+            ),
         )
 
-        result = [
-            {
-                "cus_name": order.cus_name,
-                "cus_id": order.cus_id,
-                "address": order.address
-            }
-            for order in orders
-        ]
-
         return result
         
     def get_product(self, db: Session):
@@ -255,12 +238,14 @@ class Staff:
                 db.add(product)
                 db.commit()
                 db.refresh(product)
+                publish_product(db, product, op="insert")
                 
             else: 
                 product = Product(prod_name = func.lower(product_info.prod_name), user_id = current_user['id'])
                 db.add(product)
                 db.commit()
                 db.refresh(product)
+                publish_product(db, product, op="insert")
                 return product
             
             
@@ -271,71 +256,19 @@ class Staff:
             )
       
     def get_order_detail(self, db: Session, cus_ids: List[int]):
-        # Ensure we are filtering with multiple `cus_id`s
-        orders = (
-            db.query(
-                Order.order_id,
-                Order.order_deposit,
-                Order.order_date,
-                Product.prod_name,
-                Product.prod_id,
-                OrderDetail.order_weight,
-                OrderDetail.order_amount,
-                OrderDetail.product_sell_price,
-                OrderDetail.product_labor_cost,
-                OrderDetail.product_buy_price,
-            )
-            .join(Order, OrderDetail.order_id == Order.order_id)
-            .join(Product, OrderDetail.prod_id == Product.prod_id)
-            .filter(Order.cus_id.in_(cus_ids))  # Fetch orders for multiple `cus_id`s
-            .all()
-        )
+        # Fetch orders for multiple `cus_id`s
+        orders = statements.fetch_rows(db, statements.ORDER_LINES_BY_CUSTOMERS, {"cus_ids": list(cus_ids)})
 
-        grouped_orders = defaultdict(lambda: {
-            "order_id": None,
-            "order_deposit": 0,
-            "order_date": "",
-            "products": [],
-        })
-
-        for order in orders:
-            order_id = order[0]  # `order_id`
-
-            if grouped_orders[order_id]["order_id"] is None:
-                grouped_orders[order_id]["order_id"] = order_id
-                grouped_orders[order_id]["order_deposit"] = order[1]
-                grouped_orders[order_id]["order_date"] = order[2]  # Order Date
-
-            product = {
-                "prod_name": order[3],  # Product Name
-                "prod_id": order[4],  # Product ID
-                "order_weight": order[5],  # Product Weight
-                "order_amount": order[6],  # Order Amount
-                "product_sell_price": order[7],  # Sell Price
-                "product_labor_cost": order[8],  # Labor Cost
-                "product_buy_price": order[9],  # Buy Price
-            }
-
-            grouped_orders[order_id]["products"].append(product)  # Append products correctly
-
-        return list(grouped_orders.values())  # Return all orders
+        # One slotted OrderHeader per order with OrderLine products
+        return group_order_rows(orders)
 
     # Updated Repository Method - Change page_size to limit parameter
     def get_all_client_order_paginated(self, page: int, db: Session, search_id: int = None, search_name: str = None, search_phone: str = None, search_address: str = None, limit: int = 10):
         # Calculate offset
         offset = (page - 1) * limit
         
-        # Build base query for clients with orders
-        query = db.query(
-            Account.cus_id,
-            Account.cus_name,
-            Account.address,
-            Account.phone_number
-        ).join(
-            Order, Account.cus_id == Order.cus_id
-        ).filter(
-            Account.role == 'user'
-        ).distinct()
+        # Base query: distinct customers holding an order
+        query = statements.CUSTOMERS_WITH_ORDERS
         
         # Build search filters
         search_filters = []
@@ -366,13 +299,13 @@ class Staff:
         
         # Apply all search filters with AND logic
         if search_filters:
-            query = query.filter(and_(*search_filters))
+            query = query.where(and_(*search_filters))
         
         # Get total count for pagination info
-        total_clients = query.count()
+        total_clients = statements.count_rows(db, query)
         
-        # Get paginated clients with orders - using limit instead of page_size
-        clients_with_orders = query.offset(offset).limit(limit).all()
+        # Get paginated clients with orders as plain dicts - using limit instead of page_size
+        clients_data = statements.fetch_mappings(db, query.offset(offset).limit(limit))
         
         # Build search description for messages
         search_description = []
@@ -384,7 +317,7 @@ class Staff:
             search_text = None
         
         # Handle empty results
-        if not clients_with_orders:
+        if not clients_data:
             message = "No clients with orders found"
             if search_text:
                 message = f"No clients with orders found matching {search_text}"
@@ -405,16 +338,6 @@ class Staff:
                 }
             )
         
-        # Convert to list of dictionaries
-        clients_data = []
-        for client in clients_with_orders:
-            clients_data.append({
-                "cus_id": client.cus_id,
-                "cus_name": client.cus_name,
-                "address": client.address,
-                "phone_number": client.phone_number
-            })
-        
         # Calculate pagination metadata - using limit instead of page_size
         total_pages = math.ceil(total_clients / limit) if total_clients > 0 else 1
         has_next = page < total_pages
@@ -443,60 +366,16 @@ class Staff:
     
     def get_client_id(self, cus_id: int, db: Session):  # Changed from str to int
         # First check if client exists
-        client = db.query(Account).filter(
-            and_(
-                Account.cus_id == cus_id,
-                Account.role == 'user'
-            )
-        ).first()
+        client = find_customer(db, cus_id=cus_id)
         
-        if not client:
+        if not client or client.role != 'user':
             raise HTTPException(status_code=404, detail="Client not found")
         
         # Get client's order details
-        orders = db.query(
-            Order.order_id,
-            Order.order_deposit,
-            Order.order_date,
-            Product.prod_name,
-            Product.prod_id,
-            OrderDetail.order_weight,
-            OrderDetail.order_amount,
-            OrderDetail.product_sell_price,
-            OrderDetail.product_labor_cost,
-            OrderDetail.product_buy_price,
-        ).join(OrderDetail, Order.order_id == OrderDetail.order_id)\
-        .join(Product, OrderDetail.prod_id == Product.prod_id)\
-        .filter(Order.cus_id == cus_id)\
-        .all()
+        orders = statements.fetch_rows(db, statements.CUSTOMER_ORDER_LINES, {"cus_id": cus_id})
         
         # Group orders by order_id
-        grouped_orders = defaultdict(lambda: {
-            "order_id": None,
-            "order_deposit": 0,
-            "order_date": "",
-            "products": [],
-        })
-
-        for order in orders:
-            order_id = order[0]
-
-            if grouped_orders[order_id]["order_id"] is None:
-                grouped_orders[order_id]["order_id"] = order_id
-                grouped_orders[order_id]["order_deposit"] = order[1]
-                grouped_orders[order_id]["order_date"] = order[2].strftime("%Y-%m-%d") if order[2] else ""
-
-            product = {
-                "prod_name": order[3],
-                "prod_id": order[4],
-                "order_weight": order[5],
-                "order_amount": order[6],
-                "product_sell_price": order[7],
-                "product_labor_cost": order[8],
-                "product_buy_price": order[9],
-            }
-
-            grouped_orders[order_id]["products"].append(product)
+        grouped_orders = group_order_rows(orders, date_format="%Y-%m-%d")
 
         # Return the complete client and order information
         result = {
@@ -506,7 +385,7 @@ class Staff:
                 "address": client.address,
                 "phone_number": client.phone_number
             },
-            "orders": list(grouped_orders.values()) if grouped_orders else [],
+            "orders": grouped_orders,
             "total_orders": len(grouped_orders)
         }
 
@@ -630,39 +509,17 @@ class Staff:
                 message=f"Failed to retrieve last orders: {str(e)}"
             )
 
-    def get_order_print(self, db: Session, order_id: Optional[int] = None):
+    def get_order_print(self, db: Session, order_id: Optional[int] = None, history: bool = False):
         """
         Retrieve all orders or a specific order by ID along with customer details.
+        history=True also looks in the archive.
         """
-        # Base query for fetching order data
-        order_query = (
-            db.query(
-                Account.cus_id,
-                Account.cus_name,
-                Account.phone_number,
-                Account.address,
-                Order.order_id,
-                Order.order_deposit,
-                Order.order_date,
-                Product.prod_id,
-                Product.prod_name,
-                OrderDetail.order_weight,
-                OrderDetail.order_amount,
-                OrderDetail.product_sell_price,
-                OrderDetail.product_labor_cost,
-                OrderDetail.product_buy_price,
-            )
-            .join(Order, Account.cus_id == Order.cus_id)
-            .join(OrderDetail, Order.order_id == OrderDetail.order_id)
-            .join(Product, OrderDetail.prod_id == Product.prod_id)
-            .filter(Account.role == "user")
-        )
-
-        # Filter by specific order_id if provided
+        # Fetch all order lines, or only the lines of order_id when provided
         if order_id:
-            order_query = order_query.filter(Order.order_id == order_id)
-
-        orders = order_query.all()
+            statement = statements.ORDER_PRINT_LINES_BY_ORDER_WITH_HISTORY if history else statements.ORDER_PRINT_LINES_BY_ORDER
+            orders = statements.fetch_rows(db, statement, {"order_id": order_id})
+        else:
+            orders = statements.fetch_rows(db, statements.ALL_ORDER_PRINT_LINES_WITH_HISTORY if history else statements.ALL_ORDER_PRINT_LINES)
 
         # Handle empty results
         if not orders:
@@ -789,8 +646,10 @@ class Staff:
             db.query(OrderDetail).filter(OrderDetail.order_id == order_id).delete()
             
             # Delete the order
+            cus_id = order.cus_id
             db.delete(order)
             db.commit()
+            change_feed.publish(db, "orders", "delete", order_id, {"cus_id": cus_id})
             
             return ResponseModel(
                 code=200,
@@ -806,8 +665,8 @@ class Staff:
                 message=f"Failed to delete order: {str(e)}"
             )
 
-    def update_order(self, order_id: int, order_update: PatchOrder, db: Session, current_user: dict):
-        """Update an existing order"""
+    def update_order(self, order_id: int, order_update: PatchOrder, db: Session, current_user: dict, if_match: Optional[str] = None):
+        """Update an existing order; with if_match, only if it is still at that version (412 otherwise)"""
         try:
             # Check if order exists
             order = db.query(Order).filter(Order.order_id == order_id).first()
@@ -817,11 +676,17 @@ class Staff:
                     status="Error",
                     message=f"Order {order_id} not found"
                 )
+            etags.require_version(if_match, "order", order_id, order.version_id)
+            # Nothing is committed before the end: the order's UPDATE then runs with
+            # WHERE version_id = the version checked above and a concurrent edit
+            # fails the whole PATCH (412), customer fields included
+            customer_change = None
             
             # Update customer information if provided
             if order_update.cus_name or order_update.address or order_update.phone_number:
                 customer = db.query(Account).filter(Account.cus_id == order.cus_id).first()
                 if customer:
+                    old_phone = customer.phone_number
                     if order_update.cus_name:
                         customer.cus_name = order_update.cus_name
                     if order_update.address:
@@ -844,50 +709,46 @@ class Staff:
                             )
                         
                         customer.phone_number = order_update.phone_number
-                    db.commit()
+                    db.flush()
+                    customer_change = (customer.cus_id, old_phone)
             
             # Update order information
             if order_update.order_deposit is not None:
                 order.order_deposit = order_update.order_deposit
             
-            db.commit()
-            
-            # Update order details if provided
+            # Update order details if provided: only the lines that differ are written
+            lines, new_products, lines_changed = None, [], False
             if order_update.order_product_detail:
-                # Delete existing order details
-                db.query(OrderDetail).filter(OrderDetail.order_id == order_id).delete()
-                
-                # Add new order details
-                for product in order_update.order_product_detail:
-                    existing_product = db.query(Product).filter(
-                        Product.prod_name == func.lower(product.prod_name)
-                    ).first()
-
-                    if not existing_product:
-                        prod = self.create_product(CreateProduct(prod_name=product.prod_name), db, current_user)
-                        prod_id = prod.prod_id
-                    else:
-                        prod_id = existing_product.prod_id
-
-                    order_detail = OrderDetail(
-                        order_id=order_id,
-                        prod_id=prod_id,
-                        order_weight=product.order_weight,
-                        order_amount=product.order_amount,
-                        product_sell_price=product.product_sell_price,
-                        product_labor_cost=product.product_labor_cost,
-                        product_buy_price=product.product_buy_price,
-                    )
-                    db.add(order_detail)
-                
-                db.commit()
+                fields = ("order_weight", "order_amount", "product_sell_price", "product_labor_cost", "product_buy_price")
+                products, new_products = line_diff.resolve_lines(db, order_update.order_product_detail, fields, current_user.get('id'))
+                diff = line_diff.sync_lines(db, OrderDetail, OrderDetail.order_id, order_id, products, fields)
+                lines = diff.summary()
+                lines_changed = bool(diff.inserts or diff.updates or diff.deletes)
+            if customer_change or lines_changed:
+                # Customer and line edits are edits of the order: bump its version too, which
+                # also puts the version check on the order when no header field changed
+                order.version_id = order.version_id + 1
+            
+            db.commit()
+            if customer_change:
+                invalidate_customer(db, *customer_change)
+            for product in new_products:
+                publish_product(db, product, op="insert")
+            change_feed.publish(db, "orders", "update", order_id, {"cus_id": order.cus_id})
             
             return ResponseModel(
                 code=200,
                 status="Success",
-                message=f"Order {order_id} updated successfully"
+                message=f"Order {order_id} updated successfully",
+                result={"version": order.version_id, "lines": lines}
             )
             
+        except HTTPException:
+            db.rollback()
+            raise
+        except StaleDataError:
+            db.rollback()
+            raise etags.conflict("order", order_id)
         except Exception as e:
             db.rollback()
             return ResponseModel(
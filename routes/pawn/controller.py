@@ -1,12 +1,14 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 # from models import Account
-from database import get_db
-from response_model import ResponseModel
+from database import get_db, get_read_db
+from response_model import ResponseModel, render_response
 from routes.oauth2.repository import get_current_user
 from routes.pawn.repository import Staff
 from routes.pawn.model import *
+import etags
 # from routes.user.model import CreatePawn 
 
 router = APIRouter(
@@ -18,20 +20,21 @@ staff = Staff()
 staff_service = Staff()
 
 """ Manage Pawn and Payment """ 
-@router.get("/pawn", response_model=ResponseModel)
+@router.get("/pawn", response_model=ResponseModel[List[PawnDocument]])
 def get_pawn_by_id(
-    db: Session = Depends(get_db), 
+    history: bool = Query(False, description="Include archived pawns"),
+    db: Session = Depends(get_read_db), 
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    result = staff.get_all_pawn_details(db)  # Use the new method
+    result = staff.get_all_pawn_details(db, history)  # Use the new method
     
-    return ResponseModel(
+    return render_response(ResponseModel(
         code=200,
         status="success", 
         message="Pawn details retrieved successfully",
         result=result
-    )
+    ))
 
 @router.post("/pawn", response_model = ResponseModel)
 def create_pawn(
@@ -49,7 +52,7 @@ def get_all_client_pawn(
     search_name: str = Query("", description="Search by customer name"),
     search_phone: str = Query("", description="Search by phone number"),
     search_address: str = Query("", description="Search by address"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
@@ -65,18 +68,26 @@ def get_all_client_pawn(
 @router.get("/pawn/client/{cus_id}", response_model=ResponseModel)
 def get_client_id(
     cus_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.get_client_id(cus_id, db)
+    tag = etags.customer_pawns_tag(db, cus_id)
+    if etags.not_modified(if_none_match, tag):
+        return etags.not_modified_response(tag)
+    result = staff.get_client_id(cus_id, db)
+    if tag:
+        response.headers["ETag"] = tag
+    return result
 
 @router.get("/pawn/search", response_model=ResponseModel)
 def get_client_pawn(
     phone_number: Optional[str] = None,
     cus_name: Optional[str] = None,
     cus_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
@@ -99,14 +110,91 @@ def get_last_pawns(
     return staff.get_last_pawns(db)
 
 
-@router.get("/pawn/print", response_model=ResponseModel)
+@router.get("/pawn/redemption", response_model=ResponseModel)
+def get_book_redemptions(
+    as_of: Optional[date] = Query(None, description="Price as of this date (default today)"),
+    schedule: Optional[str] = Query(None, description="Rate schedule name"),
+    cus_id: Optional[int] = Query(None, description="Only this customer's pawns"),
+    include_items: bool = Query(False, description="Include the amount due per pawn"),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return render_response(staff.get_book_redemptions(db, as_of, schedule, cus_id, include_items))
+
+@router.get("/pawn/redemption/{pawn_id}", response_model=ResponseModel)
+def get_redemption_quote(
+    pawn_id: int,
+    as_of: Optional[date] = Query(None, description="Price as of this date (default today)"),
+    schedule: Optional[str] = Query(None, description="Rate schedule name"),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return staff.get_redemption_quote(db, pawn_id, as_of, schedule)
+
+
+@router.post("/pawn/payments", response_model=ResponseModel)
+def post_payments(
+    payments: List[PostPayment],
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return staff.post_payments(payments, db, current_user)
+
+@router.post("/pawn/renew", response_model=ResponseModel)
+def renew_pawns(
+    renewal: RenewPawns,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return render_response(staff.renew_pawns(renewal, db, current_user))
+
+@router.post("/pawn/{pawn_id}/payments", response_model=ResponseModel)
+def post_pawn_payment(
+    pawn_id: int,
+    payment: PostPayment,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    payment.pawn_id = pawn_id
+    return staff.post_payments([payment], db, current_user)
+
+@router.get("/pawn/{pawn_id}/payments", response_model=ResponseModel)
+def get_pawn_payments(
+    pawn_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return render_response(staff.get_pawn_payments(pawn_id, db))
+
+@router.get("/pawn/{pawn_id}/balance", response_model=ResponseModel)
+def get_pawn_balance(
+    pawn_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return staff.get_pawn_balance(pawn_id, db)
+
+
+@router.get("/pawn/print", response_model=ResponseModel[Union[PawnPrintDocument, List[CustomerPawnPrint]]])
 def get_pawn_by_id(
     pawn_id: Optional[int] = None, 
-    db: Session = Depends(get_db),
+    history: bool = Query(False, description="Include archived pawns"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.get_pawn_print(db, pawn_id)
+    tag = etags.pawn_print_tag(db, pawn_id) if pawn_id else None
+    if etags.not_modified(if_none_match, tag):
+        return etags.not_modified_response(tag)
+    return render_response(staff.get_pawn_print(db, pawn_id, history), {"ETag": tag} if tag else None)
 
 @router.delete("/pawn/{pawn_id}", response_model=ResponseModel)
 def delete_pawn(
@@ -121,8 +209,12 @@ def delete_pawn(
 def update_pawn(
     pawn_id: int,
     pawn_update: PatchPawn,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag from a previous read; 412 if the pawn changed since"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     staff.is_staff(current_user)
-    return staff.update_pawn(pawn_id, pawn_update, db, current_user)
\ No newline at end of file
+    result = staff.update_pawn(pawn_id, pawn_update, db, current_user, if_match)
+    etags.set_entity_tag(response, "pawn", pawn_id, (result.result or {}).get("version"))
+    return result
\ No newline at end of file
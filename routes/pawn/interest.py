@@ -0,0 +1,149 @@
+"""
+Pawn interest and redemption amounts.
+
+A RateSchedule turns (principal, pawn date, expire date, as-of date) into the
+interest, overdue penalty and amount due to redeem a ticket. compute() works
+on NumPy arrays, so one ticket and the whole active book go through the same
+code: the book is fetched as one row of column arrays (array_agg) and priced
+with a handful of vector operations instead of a Python loop per ticket.
+
+Dates are integer day numbers (days since 1970-01-01). Interest accrues on
+the amount lent, `pawn_deposit`; interest and fees already paid (the pawn's
+running `interest_paid`, see ledger.py) are deducted from it, and the amount
+due adds what remains to the outstanding principal, `balance_due`.
+"""
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import Date, Integer, cast, func, literal_column, select, type_coerce
+
+from entities import Pawn
+
+EPOCH = date(1970, 1, 1)
+DAYS_PER_MONTH = 30
+
+@dataclass(slots=True, frozen=True)
+class RateSchedule:
+    """
+    method "monthly_flat": every started month is charged in full once it is
+    more than `grace_days` old; "daily": interest accrues per day after the
+    first `grace_days`. At least `min_days` are charged either way, and
+    `overdue_monthly_rate` accrues per day past the expire date on top.
+    """
+    method: str = "monthly_flat"
+    monthly_rate: float = 0.03
+    grace_days: int = 0
+    min_days: int = DAYS_PER_MONTH
+    overdue_monthly_rate: float = 0.0
+
+    def __post_init__(self):
+        if self.method not in ("monthly_flat", "daily"):
+            raise ValueError(f"Unknown interest method {self.method!r}")
+
+def load_schedules() -> Dict[str, RateSchedule]:
+    """Built-in schedules, overridden or extended by PAWN_RATE_SCHEDULES ({"name": {field: value}})."""
+    schedules = {
+        "monthly_flat": RateSchedule(),
+        "monthly_flat_grace": RateSchedule(grace_days=5),
+        "daily": RateSchedule(method="daily", min_days=0),
+    }
+    for name, fields in json.loads(os.getenv("PAWN_RATE_SCHEDULES", "{}")).items():
+        schedules[name] = RateSchedule(**fields)
+    return schedules
+
+SCHEDULES = load_schedules()
+DEFAULT_SCHEDULE = os.getenv("PAWN_RATE_SCHEDULE", "monthly_flat")
+
+def get_schedule(name: Optional[str] = None) -> Optional[RateSchedule]:
+    return SCHEDULES.get(name or DEFAULT_SCHEDULE)
+
+def day_number(value: date) -> int:
+    return (value - EPOCH).days
+
+def compute(principal, start_day, expire_day, as_of_day: int, schedule: RateSchedule, balance=None, paid=None) -> dict:
+    """
+    Interest, penalty and amount due for arrays of tickets, all as float64/int64 arrays.
+    balance defaults to the principal and paid (interest/fees already paid) to zero.
+    """
+    principal = np.asarray(principal, dtype=np.float64)
+    balance = principal if balance is None else np.asarray(balance, dtype=np.float64)
+    paid = np.zeros_like(principal) if paid is None else np.asarray(paid, dtype=np.float64)
+    elapsed = np.maximum(as_of_day - np.asarray(start_day, dtype=np.int64), 0)
+    chargeable = np.maximum(elapsed - schedule.grace_days, 0)
+    if schedule.method == "monthly_flat":
+        # ceil to whole months without going through floats
+        chargeable = -(-chargeable // DAYS_PER_MONTH) * DAYS_PER_MONTH
+    charged_days = np.maximum(chargeable, schedule.min_days)
+    overdue_days = np.maximum(as_of_day - np.asarray(expire_day, dtype=np.int64), 0)
+
+    daily_rate = schedule.monthly_rate / DAYS_PER_MONTH
+    interest = np.round(principal * daily_rate * charged_days, 2)
+    penalty = np.round(principal * (schedule.overdue_monthly_rate / DAYS_PER_MONTH) * overdue_days, 2)
+    charges_due = np.maximum(interest + penalty - paid, 0)
+    return {
+        "elapsed_days": elapsed,
+        "charged_days": charged_days,
+        "overdue_days": overdue_days,
+        "interest": interest,
+        "penalty": penalty,
+        "interest_paid": paid,
+        "charges_due": charges_due,
+        "amount_due": balance + charges_due,
+    }
+
+def _epoch_days(column):
+    return type_coerce(cast(column, Date) - literal_column("DATE '1970-01-01'"), Integer)
+
+# The active book as one row of parallel arrays, in a single scan
+BOOK_COLUMNS = select(
+    func.array_agg(Pawn.pawn_id),
+    func.array_agg(func.coalesce(Pawn.cus_id, 0)),
+    func.array_agg(func.coalesce(Pawn.pawn_deposit, 0)),
+    func.array_agg(_epoch_days(Pawn.pawn_date)),
+    func.array_agg(_epoch_days(Pawn.pawn_expire_date)),
+    func.array_agg(func.coalesce(Pawn.balance_due, Pawn.pawn_deposit, 0)),
+    func.array_agg(func.coalesce(Pawn.interest_paid, 0)),
+)
+
+@dataclass(slots=True)
+class PawnBook:
+    pawn_id: np.ndarray
+    cus_id: np.ndarray
+    principal: np.ndarray
+    start_day: np.ndarray
+    expire_day: np.ndarray
+    balance_due: np.ndarray
+    interest_paid: np.ndarray
+
+    def __len__(self):
+        return len(self.pawn_id)
+
+def load_book(db, condition=None, include_redeemed: bool = False) -> PawnBook:
+    """Fetch the (optionally filtered) open pawns column-wise in a single query."""
+    statement = BOOK_COLUMNS if include_redeemed else BOOK_COLUMNS.where(Pawn.redeemed_at.is_(None))
+    if condition is not None:
+        statement = statement.where(condition)
+    row = db.connection().execute(statement).one()
+    ids, cus_ids, principal, start, expire, balance, paid = (value or [] for value in row)
+    return PawnBook(
+        pawn_id=np.array(ids, dtype=np.int64),
+        cus_id=np.array(cus_ids, dtype=np.int64),
+        principal=np.array(principal, dtype=np.float64),
+        start_day=np.array(start, dtype=np.int64),
+        expire_day=np.array(expire, dtype=np.int64),
+        balance_due=np.array(balance, dtype=np.float64),
+        interest_paid=np.array(paid, dtype=np.float64),
+    )
+
+def price_book(book: PawnBook, as_of: date, schedule: RateSchedule) -> dict:
+    return compute(
+        book.principal, book.start_day, book.expire_day, day_number(as_of), schedule,
+        balance=book.balance_due, paid=book.interest_paid,
+    )
+
+def schedule_info(name: Optional[str]) -> dict:
+    return {"name": name or DEFAULT_SCHEDULE, **asdict(get_schedule(name))}
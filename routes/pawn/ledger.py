@@ -0,0 +1,259 @@
+"""
+Pawn payments ledger.
+
+pawn_payments is append-only: every interest payment, partial principal,
+redemption, renewal fee or other fee is one row carrying the principal
+balance after it. The pawn header keeps the running totals (balance_due,
+interest_paid, last_payment_at, redeemed_at), so reading what is owed is a
+primary-key lookup however long the loan has run.
+
+post_payments() applies a batch in three statements whatever its size: lock
+the touched headers (SELECT ... FOR UPDATE), insert every ledger row, and
+bulk-update the headers. The batch is validated as a whole first; if any
+entry is invalid nothing is written.
+
+renew_pawns() extends many open pawns in a single statement: it selects the
+pawns, moves their expire date, adds the renewal fee to interest_paid and
+writes one "renewal" ledger row for each.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, insert, select, text, update
+from sqlalchemy.orm import Session
+
+import change_feed
+from entities import Pawn, PawnPayment
+
+PAYMENT_KINDS = ("interest", "principal", "redemption", "renewal", "fee")
+# Kinds that reduce the principal balance; everything else counts as interest/fees paid
+PRINCIPAL_KINDS = {"principal", "redemption"}
+
+HEADER_COLUMNS = (
+    Pawn.pawn_id,
+    Pawn.cus_id,
+    Pawn.pawn_deposit,
+    Pawn.balance_due,
+    Pawn.interest_paid,
+    Pawn.last_payment_at,
+    Pawn.redeemed_at,
+)
+
+@dataclass(slots=True)
+class LedgerBatch:
+    payments: List[dict] = field(default_factory=list)
+    headers: Dict[int, dict] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+
+def balance_of(row) -> float:
+    # balance_due is NULL only for rows written before the ledger existed
+    return row.balance_due if row.balance_due is not None else (row.pawn_deposit or 0)
+
+def lock_headers(db: Session, pawn_ids) -> Dict[int, dict]:
+    """Current running totals of the given pawns, row-locked until the caller commits."""
+    rows = db.execute(
+        select(*HEADER_COLUMNS)
+        .where(Pawn.pawn_id.in_(sorted(set(pawn_ids))))
+        # Same lock order in every transaction
+        .order_by(Pawn.pawn_id)
+        .with_for_update()
+    ).all()
+    return {
+        row.pawn_id: {
+            "cus_id": row.cus_id,
+            "balance_due": balance_of(row),
+            "interest_paid": row.interest_paid or 0,
+            "last_payment_at": row.last_payment_at,
+            "redeemed_at": row.redeemed_at,
+        }
+        for row in rows
+    }
+
+def apply_payments(headers: Dict[int, dict], entries: List[dict], posted_by: Optional[int] = None) -> LedgerBatch:
+    """Validate entries in order against the running totals in `headers`, updating them in place."""
+    batch = LedgerBatch(headers=headers)
+    now = datetime.utcnow()
+    for index, entry in enumerate(entries):
+        pawn_id, kind, amount = entry["pawn_id"], entry["kind"], round(entry["amount"], 2)
+        header = headers.get(pawn_id)
+        if header is None:
+            batch.errors.append(f"#{index}: pawn {pawn_id} not found")
+            continue
+        if header["redeemed_at"] is not None:
+            batch.errors.append(f"#{index}: pawn {pawn_id} is already redeemed")
+            continue
+        if kind not in PAYMENT_KINDS:
+            batch.errors.append(f"#{index}: unknown payment kind {kind}")
+            continue
+
+        balance = header["balance_due"]
+        if kind == "principal" and amount > balance:
+            batch.errors.append(f"#{index}: principal payment {amount} exceeds the balance due {balance} of pawn {pawn_id}")
+            continue
+        if kind == "redemption" and amount < balance:
+            batch.errors.append(f"#{index}: redemption {amount} doesn't cover the balance due {balance} of pawn {pawn_id}")
+            continue
+
+        principal_paid = min(amount, balance) if kind in PRINCIPAL_KINDS else 0
+        paid_at = entry.get("paid_at") or now
+        balance = round(balance - principal_paid, 2)
+        header["balance_due"] = balance
+        header["interest_paid"] = round(header["interest_paid"] + amount - principal_paid, 2)
+        header["last_payment_at"] = max(filter(None, (header["last_payment_at"], paid_at)))
+        if kind == "redemption" or balance <= 0:
+            header["redeemed_at"] = paid_at
+        header["touched"] = True
+
+        batch.payments.append({
+            "pawn_id": pawn_id,
+            "kind": kind,
+            "amount": amount,
+            "principal_paid": principal_paid,
+            "interest_paid": round(amount - principal_paid, 2),
+            "balance_after": balance,
+            "paid_at": paid_at,
+            "posted_by": posted_by,
+            "note": entry.get("note"),
+        })
+    return batch
+
+# Core executemany rather than an ORM bulk update, so the version (etags.py) can be bumped in SQL
+pawns = Pawn.__table__
+UPDATE_HEADER = (
+    update(pawns)
+    .where(pawns.c.pawn_id == bindparam("b_pawn_id"))
+    .values(
+        balance_due=bindparam("b_balance_due"),
+        interest_paid=bindparam("b_interest_paid"),
+        last_payment_at=bindparam("b_last_payment_at"),
+        redeemed_at=bindparam("b_redeemed_at"),
+        version_id=pawns.c.version_id + 1,
+    )
+)
+
+def write_batch(db: Session, batch: LedgerBatch) -> List[int]:
+    """Insert the ledger rows and update the touched headers; returns payment ids in entry order."""
+    if not batch.payments:
+        return []
+    payment_ids = db.execute(
+        insert(PawnPayment).returning(PawnPayment.payment_id, sort_by_parameter_order=True),
+        batch.payments,
+    ).scalars().all()
+    db.execute(UPDATE_HEADER, [
+        {
+            "b_pawn_id": pawn_id,
+            "b_balance_due": header["balance_due"],
+            "b_interest_paid": header["interest_paid"],
+            "b_last_payment_at": header["last_payment_at"],
+            "b_redeemed_at": header["redeemed_at"],
+        }
+        for pawn_id, header in batch.headers.items()
+        if header.get("touched")
+    ])
+    return payment_ids
+
+def post_payments(db: Session, entries: List[dict], posted_by: Optional[int] = None) -> LedgerBatch:
+    """Validate and post a batch atomically; on errors nothing is written and the transaction is rolled back."""
+    batch = apply_payments(lock_headers(db, [entry["pawn_id"] for entry in entries]), entries, posted_by)
+    if batch.errors:
+        db.rollback()
+        return batch
+    for payment, payment_id in zip(batch.payments, write_batch(db, batch)):
+        payment["payment_id"] = payment_id
+    db.commit()
+    publish_balances(db, batch)
+    return batch
+
+def publish_balances(db: Session, batch: LedgerBatch):
+    change_feed.publish_many(db, "pawns", "update", [
+        (pawn_id, {"cus_id": header["cus_id"], "balance_due": header["balance_due"], "redeemed": header["redeemed_at"] is not None})
+        for pawn_id, header in batch.headers.items()
+        if header.get("touched")
+    ])
+
+""" Renewals """
+# Targets are the open pawns matching every given filter (a NULL parameter
+# matches everything). The fee per pawn is fee + fee_rate x balance due.
+RENEW_PAWNS = text("""
+WITH target AS (
+    SELECT p.pawn_id,
+        round(CAST(:fee + :fee_rate * coalesce(p.balance_due, p.pawn_deposit, 0) AS numeric), 2)::float8 AS fee
+    FROM pawns p
+    WHERE p.redeemed_at IS NULL
+        AND (CAST(:pawn_ids AS integer[]) IS NULL OR p.pawn_id = ANY(CAST(:pawn_ids AS integer[])))
+        AND (CAST(:cus_id AS integer) IS NULL OR p.cus_id = CAST(:cus_id AS integer))
+        AND (CAST(:expiring_from AS timestamp) IS NULL OR p.pawn_expire_date >= CAST(:expiring_from AS timestamp))
+        AND (CAST(:expiring_to AS timestamp) IS NULL OR p.pawn_expire_date < CAST(:expiring_to AS timestamp) + interval '1 day')
+    ORDER BY p.pawn_id
+    FOR UPDATE
+), renewed AS (
+    UPDATE pawns p SET
+        pawn_expire_date = coalesce(CAST(:new_expire_date AS timestamp), p.pawn_expire_date + make_interval(days => :extend_days)),
+        interest_paid = p.interest_paid + t.fee,
+        last_payment_at = CASE WHEN t.fee > 0 THEN CAST(:now AS timestamp) ELSE p.last_payment_at END,
+        version_id = p.version_id + 1
+    FROM target t
+    WHERE p.pawn_id = t.pawn_id
+    RETURNING p.pawn_id, p.cus_id, p.pawn_expire_date, coalesce(p.balance_due, p.pawn_deposit, 0) AS balance_due, t.fee
+), recorded AS (
+    INSERT INTO pawn_payments (pawn_id, kind, amount, principal_paid, interest_paid, balance_after, paid_at, posted_by, note)
+    SELECT pawn_id, 'renewal', fee, 0, fee, balance_due, CAST(:now AS timestamp), :posted_by, :note
+    FROM renewed
+    RETURNING payment_id
+)
+SELECT
+    (SELECT count(*) FROM recorded) AS payments,
+    coalesce(array_agg(pawn_id ORDER BY pawn_id), '{}') AS pawn_ids,
+    coalesce(array_agg(cus_id ORDER BY pawn_id), '{}') AS cus_ids,
+    coalesce(array_agg(pawn_expire_date ORDER BY pawn_id), '{}') AS expire_dates,
+    coalesce(sum(fee), 0) AS fees,
+    min(pawn_expire_date) AS first_expire_date,
+    max(pawn_expire_date) AS last_expire_date
+FROM renewed
+""")
+
+def renew_pawns(
+    db: Session,
+    pawn_ids: Optional[List[int]] = None,
+    cus_id: Optional[int] = None,
+    expiring_from: Optional[date] = None,
+    expiring_to: Optional[date] = None,
+    extend_days: int = 30,
+    new_expire_date: Optional[date] = None,
+    fee: float = 0,
+    fee_rate: float = 0,
+    posted_by: Optional[int] = None,
+    note: Optional[str] = None,
+) -> dict:
+    """Renew every open pawn matching the filters in one statement and commit; returns a summary."""
+    row = db.execute(RENEW_PAWNS, {
+        "pawn_ids": sorted(set(pawn_ids)) if pawn_ids else None,
+        "cus_id": cus_id,
+        "expiring_from": expiring_from,
+        "expiring_to": expiring_to,
+        "extend_days": extend_days,
+        "new_expire_date": new_expire_date,
+        "fee": fee,
+        "fee_rate": fee_rate,
+        "now": datetime.utcnow(),
+        "posted_by": posted_by,
+        "note": note,
+    }).one()
+    db.commit()
+
+    change_feed.publish_many(db, "pawns", "update", [
+        (pawn_id, {"cus_id": owner, "pawn_expire_date": expire_date.isoformat()})
+        for pawn_id, owner, expire_date in zip(row.pawn_ids, row.cus_ids, row.expire_dates)
+    ])
+    summary = {
+        "renewed": len(row.pawn_ids),
+        "payments": row.payments,
+        "fees": round(row.fees, 2),
+        "first_expire_date": row.first_expire_date,
+        "last_expire_date": row.last_expire_date,
+        "pawn_ids": row.pawn_ids,
+    }
+    if pawn_ids:
+        summary["skipped"] = sorted(set(pawn_ids) - set(row.pawn_ids))
+    return summary
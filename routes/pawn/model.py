@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from datetime import date
-from typing import Optional, List
+from datetime import date, datetime
+from typing import Literal, Optional, List
 # from typing import , Optional
 
 class BuyProducts(BaseModel):
@@ -83,5 +83,80 @@ class PatchPawn(BaseModel):
     pawn_date: Optional[date] = None
     pawn_expire_date: Optional[date] = None
     pawn_deposit: Optional[float] = None
-    pawn_product_detail: List[PawnProductDetail] = Field(default_factory=list) 
-    
+    pawn_product_detail: List[PawnProductDetail] = Field(default_factory=list)
+
+class PostPayment(BaseModel):
+    """One ledger entry; pawn_id comes from the path on /pawn/{pawn_id}/payments"""
+    pawn_id: Optional[int] = None
+    kind: Literal["interest", "principal", "redemption", "renewal", "fee"]
+    amount: float = Field(gt=0)
+    paid_at: Optional[datetime] = None
+    note: Optional[str] = None
+
+class RenewPawns(BaseModel):
+    """Which open pawns to renew (every given filter must match) and how"""
+    pawn_ids: List[int] = Field(default_factory=list)
+    cus_id: Optional[int] = None
+    expiring_from: Optional[date] = None
+    expiring_to: Optional[date] = None
+    extend_days: int = Field(30, gt=0)
+    new_expire_date: Optional[date] = None
+    fee: float = Field(0, ge=0)
+    fee_rate: float = Field(0, ge=0)
+    note: Optional[str] = None
+
+""" Result documents (response schema only, serialized without re-validation) """
+class PawnProductRecord(BaseModel):
+    prod_id: int
+    prod_name: str
+    pawn_weight: str
+    pawn_amount: int
+    pawn_unit_price: float
+
+class PawnDocument(BaseModel):
+    pawn_id: int
+    cus_id: int
+    customer_name: str
+    phone_number: str
+    address: Optional[str] = None
+    pawn_deposit: float
+    pawn_date: str
+    pawn_expire_date: str
+    products: List[PawnProductRecord] = Field(default_factory=list)
+
+class PawnPrintProduct(BaseModel):
+    prod_id: int
+    prod_name: str
+    pawn_weight: Optional[str] = None
+    pawn_weight_numeric: float
+    pawn_amount: Optional[int] = None
+    pawn_unit_price: Optional[float] = None
+
+class PawnPrintCustomer(BaseModel):
+    cus_id: int
+    customer_name: str
+    phone_number: str
+    address: Optional[str] = None
+
+class PawnPrintDocument(BaseModel):
+    pawn_id: int
+    pawn_deposit: float
+    pawn_date: str
+    pawn_expire_date: Optional[str] = None
+    total_amount: float
+    total_weight: float
+    customer: PawnPrintCustomer
+    products: List[PawnPrintProduct] = Field(default_factory=list)
+
+class PawnPrintEntry(BaseModel):
+    pawn_id: int
+    pawn_deposit: float
+    pawn_date: str
+    pawn_expire_date: Optional[str] = None
+    products: List[PawnPrintProduct] = Field(default_factory=list)
+    pawn_total_amount: float
+    pawn_total_weight: float
+
+class CustomerPawnPrint(PawnPrintCustomer):
+    pawns: List[PawnPrintEntry] = Field(default_factory=list)
+
@@ -1,15 +1,25 @@
 from fastapi import HTTPException
 from routes.user.model import *
-from routes.pawn.model import PatchPawn
+from routes.pawn.model import PatchPawn, PostPayment, RenewPawns
 from sqlalchemy.orm import Session
 from entities import *
 from response_model import ResponseModel
 from typing import List, Dict
 # from app.models import Client, Pawn
-from sqlalchemy.sql import func, or_, and_
+from sqlalchemy.sql import func, or_, and_, select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from collections import defaultdict
 from typing import Dict, Any
+from records import PawnLine, group_pawn_rows
+import statements
+import change_feed
+import line_diff
+import etags
+from routes.client.cache import find_customer, invalidate_customer
+from routes.product.catalog import publish_product
+from routes.pawn import interest, ledger
+from datetime import date
 
 class Staff:
     def is_staff(self, current_user: dict):
@@ -36,21 +46,23 @@ class Staff:
                     detail=f"Pawn record with ID {pawn_info.pawn_id} already exists."
                 )
 
-            # ✅ Check if customer exists by phone number or cus_id
-            existing_customer = db.query(Account).filter(
-                or_(
-                    Account.phone_number == pawn_info.phone_number, 
-                    Account.cus_id == pawn_info.cus_id
-                ),
-                Account.role == 'user'
-            ).first()
+            # ✅ Check if customer exists by cus_id or phone number (served from the customer cache)
+            existing_customer = find_customer(db, cus_id=pawn_info.cus_id)
+            if existing_customer is None or existing_customer.role != 'user':
+                # cus_id missing or pointing at an admin: the phone number may still be a customer's
+                existing_customer = find_customer(db, phone_number=pawn_info.phone_number)
+            if existing_customer and existing_customer.role != 'user':
+                existing_customer = None
 
             if existing_customer:
-                # ✅ Update existing customer's name and address
-                existing_customer.cus_name = pawn_info.cus_name
-                existing_customer.address = pawn_info.address
-                db.commit()
-                db.refresh(existing_customer)
+                # ✅ Update existing customer's name and address, skipping the write when nothing changed
+                if (existing_customer.cus_name, existing_customer.address) != (pawn_info.cus_name, pawn_info.address):
+                    db.query(Account).filter(Account.cus_id == existing_customer.cus_id).update(
+                        {"cus_name": pawn_info.cus_name, "address": pawn_info.address, "version_id": Account.version_id + 1},
+                        synchronize_session=False,
+                    )
+                    db.commit()
+                    invalidate_customer(db, existing_customer.cus_id)
             else:
                 # ✅ Create a new customer if not found
                 existing_customer = self.create_client(
@@ -100,15 +112,17 @@ class Staff:
                 db.add(pawn_detail)
 
             db.commit()  # ✅ Commit all pawn details at once for efficiency
+            change_feed.publish(db, "pawns", "insert", pawn.pawn_id, {"cus_id": pawn.cus_id})
 
             return ResponseModel(
                 code=200,
                 status="Success",
-                message=f"Pawn record created successfully with multiple products. (Pawn ID: {pawn.pawn_id})"
+                message=f"Pawn record created successfully with multiple products. (Pawn ID: {pawn.pawn_id})",
+                result={"pawn_id": pawn.pawn_id, "cus_id": pawn.cus_id}
             )
 
     def create_client(self, client_info: CreateClient, db: Session, not_exist: bool = False):
-        existing_client = db.query(Account).filter(Account.phone_number == client_info.phone_number).first()
+        existing_client = find_customer(db, phone_number=client_info.phone_number)
         if existing_client:
             raise HTTPException(
                 status_code=400,
@@ -124,6 +138,7 @@ class Staff:
                 db.add(client)
                 db.commit()
                 db.refresh(client)
+                change_feed.publish(db, "accounts", "insert", client.cus_id)
             except SQLAlchemyError as e:
                 db.rollback()
                 print(f"Error occurred: {str(e)}")
@@ -139,6 +154,7 @@ class Staff:
         db.add(client)
         db.commit()
         db.refresh(client)
+        change_feed.publish(db, "accounts", "insert", client.cus_id)
         
         return ResponseModel(
             code=200,
@@ -163,12 +179,14 @@ class Staff:
                 db.add(product)
                 db.commit()
                 db.refresh(product)
+                publish_product(db, product, op="insert")
                 
             else: 
                 product = Product(prod_name = func.lower(product_info.prod_name), user_id = current_user['id'])
                 db.add(product)
                 db.commit()
                 db.refresh(product)
+                publish_product(db, product, op="insert")
                 return product
             
             
@@ -189,15 +207,13 @@ class Staff:
         if cus_id:
             filters.append(Account.cus_id == cus_id)
 
-        # Fetch ALL customers matching the search criteria with all required fields
-        clients = db.query(
-            Account.cus_id, 
-            Account.cus_name, 
-            Account.phone_number, 
-            Account.address
-        ).filter(and_(*filters)).all()
+        # Fetch ALL customers matching the search criteria as plain dicts
+        clients_data = statements.fetch_mappings(
+            db,
+            select(Account.cus_id, Account.cus_name, Account.phone_number, Account.address).where(*filters),
+        )
 
-        if not clients:
+        if not clients_data:
             return ResponseModel(
                 code=404,
                 status="Error",
@@ -205,16 +221,6 @@ class Staff:
                 result=[]
             )
 
-        # Convert to list of dictionaries for better JSON response
-        clients_data = []
-        for client in clients:
-            clients_data.append({
-                "cus_id": client.cus_id,
-                "cus_name": client.cus_name,
-                "phone_number": client.phone_number,
-                "address": client.address
-            })
-
         return ResponseModel(
             code=200,
             status="Success",
@@ -251,148 +257,17 @@ class Staff:
         if not search_conditions:
             return []
         
-        pawns = (
-            db.query(
-                Account.cus_id,  # 0
-                Account.cus_name, # 1
-                Account.phone_number, # 2
-                Account.address, # 3
-                Pawn.pawn_id, # 4
-                Pawn.pawn_deposit, # 5
-                Pawn.pawn_date, # 6
-                Pawn.pawn_expire_date, # 7
-                Product.prod_id, # 8
-                Product.prod_name, # 9
-                PawnDetail.pawn_weight, # 10
-                PawnDetail.pawn_amount, # 11
-                PawnDetail.pawn_unit_price, # 12
-            )
-            .select_from(Account)
-            .join(Pawn, Account.cus_id == Pawn.cus_id)
-            .join(PawnDetail, Pawn.pawn_id == PawnDetail.pawn_id)
-            .join(Product, PawnDetail.prod_id == Product.prod_id)
-            .filter(
-                and_(
-                    or_(*search_conditions),
-                    Account.role == "user",
-                )
-            )
-            .all()
-        )
+        pawns = statements.fetch_rows(db, statements.ALL_PAWN_LINES.where(or_(*search_conditions)))
 
-        grouped_pawns = defaultdict(lambda: {
-            "pawn_id": None,
-            "cus_id": None,
-            "customer_name": "",
-            "phone_number": "",
-            "address": "",
-            "pawn_deposit": 0,
-            "pawn_date": "",
-            "pawn_expire_date": "",
-            "products": [],
-        })
-
-        for pawn in pawns:
-            pawn_id = pawn[4]
-            if grouped_pawns[pawn_id]["pawn_id"] is None:
-                grouped_pawns[pawn_id].update({
-                    "pawn_id": pawn[4],
-                    "cus_id": pawn[0],
-                    "customer_name": pawn[1],
-                    "phone_number": pawn[2],
-                    "address": pawn[3],
-                    "pawn_deposit": float(pawn[5]) if pawn[5] else 0,
-                    "pawn_date": str(pawn[6]) if pawn[6] else "",
-                    "pawn_expire_date": str(pawn[7]) if pawn[7] else "",
-                })
-
-            product = {
-                "prod_id": pawn[8],
-                "prod_name": pawn[9],
-                "pawn_weight": pawn[10] or "",
-                "pawn_amount": pawn[11] or 0,
-                "pawn_unit_price": float(pawn[12]) if pawn[12] else 0,
-            }
-
-            # Check if product already exists before appending
-            product_exists = any(
-                p["prod_id"] == product["prod_id"] 
-                for p in grouped_pawns[pawn_id]["products"]
-            )
-            if not product_exists:
-                grouped_pawns[pawn_id]["products"].append(product)
-
-        return list(grouped_pawns.values())
+        # One slotted PawnHeader per pawn with PawnLine products
+        return group_pawn_rows(pawns)
         
-    def get_all_pawn_details(self, db: Session):
-        """Get all pawn details without search conditions"""
-        pawns = (
-            db.query(
-                Account.cus_id,  # 0
-                Account.cus_name, # 1
-                Account.phone_number, # 2
-                Account.address, # 3
-                Pawn.pawn_id, # 4
-                Pawn.pawn_deposit, # 5
-                Pawn.pawn_date, # 6
-                Pawn.pawn_expire_date, # 7
-                Product.prod_id, # 8
-                Product.prod_name, # 9
-                PawnDetail.pawn_weight, # 10
-                PawnDetail.pawn_amount, # 11
-                PawnDetail.pawn_unit_price, # 12
-            )
-            .select_from(Account)
-            .join(Pawn, Account.cus_id == Pawn.cus_id)
-            .join(PawnDetail, Pawn.pawn_id == PawnDetail.pawn_id)
-            .join(Product, PawnDetail.prod_id == Product.prod_id)
-            .filter(Account.role == "user")
-            .all()
-        )
-
-        grouped_pawns = defaultdict(lambda: {
-            "pawn_id": None,
-            "cus_id": None,
-            "customer_name": "",
-            "phone_number": "",
-            "address": "",
-            "pawn_deposit": 0,
-            "pawn_date": "",
-            "pawn_expire_date": "",
-            "products": [],
-        })
-
-        for pawn in pawns:
-            pawn_id = pawn[4]
-            if grouped_pawns[pawn_id]["pawn_id"] is None:
-                grouped_pawns[pawn_id].update({
-                    "pawn_id": pawn[4],
-                    "cus_id": pawn[0],
-                    "customer_name": pawn[1],
-                    "phone_number": pawn[2],
-                    "address": pawn[3],
-                    "pawn_deposit": float(pawn[5]) if pawn[5] else 0,
-                    "pawn_date": str(pawn[6]) if pawn[6] else "",
-                    "pawn_expire_date": str(pawn[7]) if pawn[7] else "",
-                })
-
-            product = {
-                "prod_id": pawn[8],
-                "prod_name": pawn[9],
-                "pawn_weight": pawn[10] or "",
-                "pawn_amount": pawn[11] or 0,
-                "pawn_unit_price": float(pawn[12]) if pawn[12] else 0,
-            }
-
-            # Check if product already exists before appending
-            product_exists = any(
-                p["prod_id"] == product["prod_id"] 
-                for p in grouped_pawns[pawn_id]["products"]
-            )
-            if not product_exists:
-                grouped_pawns[pawn_id]["products"].append(product)
+    def get_all_pawn_details(self, db: Session, history: bool = False):
+        """Get all pawn details without search conditions; history=True includes archived pawns"""
+        pawns = statements.fetch_rows(db, statements.ALL_PAWN_LINES_WITH_HISTORY if history else statements.ALL_PAWN_LINES)
 
-        return list(grouped_pawns.values())
+        # One slotted PawnHeader per pawn with PawnLine products
+        return group_pawn_rows(pawns)
     
     def get_all_client_pawn(
             self, 
@@ -403,43 +278,31 @@ class Staff:
             search_phone: str = "",
             search_address: str = ""
         ):
-        # Build base query
-        query = db.query(
-            Account.cus_id,
-            Account.cus_name, 
-            Account.address,
-            Account.phone_number
-        ).join(
-            Pawn, Account.cus_id == Pawn.cus_id
-        ).filter(
-            Account.role == 'user'
-        )
+        # Base query: distinct customers holding a pawn
+        query = statements.CUSTOMERS_WITH_PAWNS
         
         # Add individual search filters
         if search_name.strip():
             name_term = f"%{search_name.strip()}%"
-            query = query.filter(Account.cus_name.ilike(name_term))
+            query = query.where(Account.cus_name.ilike(name_term))
         
         if search_phone.strip():
             phone_term = f"%{search_phone.strip()}%"
-            query = query.filter(Account.phone_number.ilike(phone_term))
+            query = query.where(Account.phone_number.ilike(phone_term))
         
         if search_address.strip():
             address_term = f"%{search_address.strip()}%"
-            query = query.filter(Account.address.ilike(address_term))
-        
-        # Use distinct to avoid duplicates
-        query = query.distinct()
+            query = query.where(Account.address.ilike(address_term))
         
         # Get total count for pagination
-        total_count = query.count()
+        total_count = statements.count_rows(db, query)
         
         # Calculate pagination info
         total_pages = (total_count + limit - 1) // limit
         offset = (page - 1) * limit
         
-        # Get paginated results
-        clients_with_pawns = query.offset(offset).limit(limit).all()
+        # Get paginated results as plain dicts
+        clients_data = statements.fetch_mappings(db, query.offset(offset).limit(limit))
         
         # Build search summary for message
         search_criteria = []
@@ -452,7 +315,7 @@ class Staff:
         
         search_summary = " and ".join(search_criteria) if search_criteria else ""
         
-        if not clients_with_pawns:
+        if not clients_data:
             message = "No clients with pawns found"
             if search_summary:
                 message += f" matching {search_summary}"
@@ -472,16 +335,6 @@ class Staff:
                 }
             )
         
-        # Convert to list of dictionaries
-        clients_data = []
-        for client in clients_with_pawns:
-            clients_data.append({
-                "cus_id": client.cus_id,
-                "cus_name": client.cus_name,
-                "address": client.address,
-                "phone_number": client.phone_number
-            })
-        
         # Build pagination info
         pagination_info = {
             "current_page": page,
@@ -506,22 +359,13 @@ class Staff:
 
     # Alternative: Simple search without pagination (if you prefer)
     def get_all_client_pawn_simple(self, db: Session, search: str = ""):
-        # Build base query
-        query = db.query(
-            Account.cus_id,
-            Account.cus_name, 
-            Account.address,
-            Account.phone_number
-        ).join(
-            Pawn, Account.cus_id == Pawn.cus_id
-        ).filter(
-            Account.role == 'user'
-        )
+        # Base query: distinct customers holding a pawn
+        query = statements.CUSTOMERS_WITH_PAWNS
         
         # Add search filters if search term provided
         if search.strip():
             search_term = f"%{search.strip()}%"
-            query = query.filter(
+            query = query.where(
                 or_(
                     Account.cus_name.ilike(search_term),
                     Account.phone_number.ilike(search_term),
@@ -529,10 +373,10 @@ class Staff:
                 )
             )
         
-        # Get all results with distinct
-        clients_with_pawns = query.distinct().all()
+        # Get all results as plain dicts
+        clients_data = statements.fetch_mappings(db, query)
         
-        if not clients_with_pawns:
+        if not clients_data:
             return ResponseModel(
                 code=404,
                 status="Not Found",
@@ -540,16 +384,6 @@ class Staff:
                 result=[]
             )
         
-        # Convert to list of dictionaries
-        clients_data = []
-        for client in clients_with_pawns:
-            clients_data.append({
-                "cus_id": client.cus_id,
-                "cus_name": client.cus_name,
-                "address": client.address,
-                "phone_number": client.phone_number
-            })
-        
         return ResponseModel(
             code=200,
             status="Success",
@@ -559,31 +393,13 @@ class Staff:
         
     def get_client_id(self, cus_id: int, db: Session):
         # First check if client exists
-        client = db.query(Account).filter(
-            and_(
-                Account.cus_id == cus_id,
-                Account.role == 'user'
-            )
-        ).first()
+        client = find_customer(db, cus_id=cus_id)
         
-        if not client:
+        if not client or client.role != 'user':
             raise HTTPException(status_code=404, detail="Client not found")
         
         # Get client's pawn details
-        pawns = db.query(
-            Pawn.pawn_id,           
-            Pawn.pawn_deposit,      
-            Pawn.pawn_date,
-            Pawn.pawn_expire_date,  # Added this line         
-            Product.prod_name,
-            Product.prod_id,
-            PawnDetail.pawn_weight,      
-            PawnDetail.pawn_amount,      
-            PawnDetail.pawn_unit_price,  
-        ).join(PawnDetail, Pawn.pawn_id == PawnDetail.pawn_id)\
-        .join(Product, PawnDetail.prod_id == Product.prod_id)\
-        .filter(Pawn.cus_id == cus_id)\
-        .all()
+        pawns = statements.fetch_rows(db, statements.CUSTOMER_PAWN_LINES, {"cus_id": cus_id})
         
         # Group pawns by pawn_id
         grouped_pawns = defaultdict(lambda: {
@@ -595,23 +411,15 @@ class Staff:
         })
 
         for pawn in pawns:
-            pawn_id = pawn[0]
+            pawn_id = pawn.pawn_id
 
             if grouped_pawns[pawn_id]["pawn_id"] is None:
                 grouped_pawns[pawn_id]["pawn_id"] = pawn_id
-                grouped_pawns[pawn_id]["pawn_deposit"] = pawn[1]
-                grouped_pawns[pawn_id]["pawn_date"] = pawn[2].strftime("%Y-%m-%d") if pawn[2] else ""
-                grouped_pawns[pawn_id]["pawn_expire_date"] = pawn[3].strftime("%Y-%m-%d") if pawn[3] else ""  # Added this line
+                grouped_pawns[pawn_id]["pawn_deposit"] = pawn.pawn_deposit
+                grouped_pawns[pawn_id]["pawn_date"] = pawn.pawn_date.strftime("%Y-%m-%d") if pawn.pawn_date else ""
+                grouped_pawns[pawn_id]["pawn_expire_date"] = pawn.pawn_expire_date.strftime("%Y-%m-%d") if pawn.pawn_expire_date else ""
 
-            product = {
-                "prod_name": pawn[4],
-                "prod_id": pawn[5],
-                "pawn_weight": pawn[6],     
-                "pawn_amount": pawn[7],     
-                "pawn_unit_price": pawn[8], 
-            }
-
-            grouped_pawns[pawn_id]["products"].append(product)
+            grouped_pawns[pawn_id]["products"].append(PawnLine.from_row(pawn))
 
         # Return the complete client and pawn information
         result = {
@@ -631,6 +439,179 @@ class Staff:
             result=result
         )
         
+    def get_redemption_quote(self, db: Session, pawn_id: int, as_of: Optional[date] = None, schedule: Optional[str] = None):
+        """What the customer owes today (or on as_of) to redeem one pawn"""
+        rate_schedule = interest.get_schedule(schedule)
+        if rate_schedule is None:
+            raise HTTPException(status_code=400, detail=f"Unknown rate schedule {schedule}")
+        as_of = as_of or date.today()
+
+        book = interest.load_book(db, Pawn.pawn_id == pawn_id)
+        if not len(book):
+            redeemed_at = db.execute(select(Pawn.redeemed_at).where(Pawn.pawn_id == pawn_id)).first()
+            if redeemed_at is not None:
+                return ResponseModel(
+                    code=409,
+                    status="Error",
+                    message=f"Pawn {pawn_id} was already redeemed on {redeemed_at[0]:%Y-%m-%d}"
+                )
+            return ResponseModel(
+                code=404,
+                status="Error",
+                message=f"Pawn with ID {pawn_id} not found"
+            )
+        priced = interest.price_book(book, as_of, rate_schedule)
+
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"Redemption amount for pawn {pawn_id} as of {as_of}",
+            result={
+                "pawn_id": pawn_id,
+                "cus_id": int(book.cus_id[0]),
+                "principal": float(book.principal[0]),
+                "balance_due": float(book.balance_due[0]),
+                "as_of": as_of,
+                "schedule": interest.schedule_info(schedule),
+                **{key: values[0].item() for key, values in priced.items()},
+            }
+        )
+
+    def get_book_redemptions(
+        self,
+        db: Session,
+        as_of: Optional[date] = None,
+        schedule: Optional[str] = None,
+        cus_id: Optional[int] = None,
+        include_items: bool = False,
+    ):
+        """Redemption amounts for every open pawn (or one customer's), priced in one vectorized pass"""
+        rate_schedule = interest.get_schedule(schedule)
+        if rate_schedule is None:
+            raise HTTPException(status_code=400, detail=f"Unknown rate schedule {schedule}")
+        as_of = as_of or date.today()
+
+        book = interest.load_book(db, Pawn.cus_id == cus_id if cus_id else None)
+        priced = interest.price_book(book, as_of, rate_schedule)
+
+        result = {
+            "as_of": as_of,
+            "schedule": interest.schedule_info(schedule),
+            "tickets": len(book),
+            "overdue_tickets": int((priced["overdue_days"] > 0).sum()),
+            "principal": round(float(book.principal.sum()), 2),
+            "balance_due": round(float(book.balance_due.sum()), 2),
+            "interest": round(float(priced["interest"].sum()), 2),
+            "penalty": round(float(priced["penalty"].sum()), 2),
+            "amount_due": round(float(priced["amount_due"].sum()), 2),
+        }
+        if include_items:
+            # Column-wise tolist() converts each array in C; zip builds the rows
+            columns = {"pawn_id": book.pawn_id, "cus_id": book.cus_id, "principal": book.principal, "balance_due": book.balance_due, **priced}
+            names = list(columns)
+            result["items"] = [dict(zip(names, values)) for values in zip(*(array.tolist() for array in columns.values()))]
+
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"Redemption amounts for {len(book)} pawn(s) as of {as_of}",
+            result=result
+        )
+
+    """ Payments """
+    def post_payments(self, entries: List[PostPayment], db: Session, current_user: dict):
+        """Post a batch of ledger entries atomically; any invalid entry rejects the whole batch"""
+        if not entries:
+            raise HTTPException(status_code=400, detail="No payments given")
+        if any(entry.pawn_id is None for entry in entries):
+            raise HTTPException(status_code=400, detail="Every payment needs a pawn_id")
+
+        batch = ledger.post_payments(db, [entry.model_dump() for entry in entries], current_user.get('id'))
+        if batch.errors:
+            return ResponseModel(
+                code=400,
+                status="Error",
+                message=f"{len(batch.errors)} payment(s) rejected; nothing was posted",
+                result=batch.errors
+            )
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"{len(batch.payments)} payment(s) posted",
+            result={
+                "payments": batch.payments,
+                "balances": [
+                    {"pawn_id": pawn_id, "balance_due": header["balance_due"], "interest_paid": header["interest_paid"], "redeemed_at": header["redeemed_at"]}
+                    for pawn_id, header in batch.headers.items()
+                    if header.get("touched")
+                ],
+            }
+        )
+
+    def renew_pawns(self, renewal: RenewPawns, db: Session, current_user: dict):
+        """Extend many pawns at once: one set-based UPDATE plus one renewal ledger row per pawn"""
+        if not (renewal.pawn_ids or renewal.cus_id or renewal.expiring_from or renewal.expiring_to):
+            raise HTTPException(status_code=400, detail="Give pawn_ids, cus_id or an expiring_from/expiring_to range")
+        if renewal.expiring_from and renewal.expiring_to and renewal.expiring_from > renewal.expiring_to:
+            raise HTTPException(status_code=400, detail="expiring_from must be before expiring_to")
+
+        options = renewal.model_dump()
+        summary = ledger.renew_pawns(db, **options, posted_by=current_user.get('id'))
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"{summary['renewed']} pawn(s) renewed",
+            result=summary
+        )
+
+    def get_pawn_balance(self, pawn_id: int, db: Session):
+        """Running totals from the pawn header; no ledger scan"""
+        row = db.execute(select(*ledger.HEADER_COLUMNS).where(Pawn.pawn_id == pawn_id)).first()
+        if row is None:
+            return ResponseModel(
+                code=404,
+                status="Error",
+                message=f"Pawn with ID {pawn_id} not found"
+            )
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"Balance of pawn {pawn_id}",
+            result={
+                "pawn_id": row.pawn_id,
+                "cus_id": row.cus_id,
+                "principal": row.pawn_deposit,
+                "balance_due": ledger.balance_of(row),
+                "interest_paid": row.interest_paid or 0,
+                "last_payment_at": row.last_payment_at,
+                "redeemed_at": row.redeemed_at,
+            }
+        )
+
+    def get_pawn_payments(self, pawn_id: int, db: Session):
+        payments = statements.fetch_mappings(
+            db,
+            select(
+                PawnPayment.payment_id,
+                PawnPayment.kind,
+                PawnPayment.amount,
+                PawnPayment.principal_paid,
+                PawnPayment.interest_paid,
+                PawnPayment.balance_after,
+                PawnPayment.paid_at,
+                PawnPayment.posted_by,
+                PawnPayment.note,
+            )
+            .where(PawnPayment.pawn_id == pawn_id)
+            .order_by(PawnPayment.paid_at, PawnPayment.payment_id)
+        )
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"{len(payments)} payment(s) on pawn {pawn_id}",
+            result=payments
+        )
+
     def get_next_pawn_id(self, db: Session):
         try:
             # Get the highest pawn_id from the database
@@ -724,7 +705,8 @@ class Staff:
                         "total_products": len(products),
                         "total_amount": total_amount,
                         "deposit_paid": pawn.pawn_deposit,
-                        "balance_due": total_amount - pawn.pawn_deposit
+                        # Outstanding principal from the payments ledger (pawn_deposit is the amount lent)
+                        "balance_due": ledger.balance_of(pawn)
                     }
                 }
                 
@@ -744,9 +726,10 @@ class Staff:
                 message=f"Failed to retrieve last pawns: {str(e)}"
             )
 
-    def get_pawn_print(self, db: Session, pawn_id: Optional[int] = None):
+    def get_pawn_print(self, db: Session, pawn_id: Optional[int] = None, history: bool = False):
         """
         Retrieve all pawn records or a specific pawn by ID along with customer and product details.
+        history=True also looks in the archive.
         """
         
         def parse_weight(weight_str):
@@ -763,34 +746,12 @@ class Staff:
                 return float(match.group(1))
             return 0.0
         
-        # Query to fetch all pawn records (or filter by pawn_id if provided)
-        pawn_query = (
-            db.query(
-                Account.cus_id,
-                Account.cus_name,
-                Account.phone_number,
-                Account.address,
-                Pawn.pawn_id,
-                Pawn.pawn_deposit,
-                Pawn.pawn_date,
-                Pawn.pawn_expire_date,
-                Product.prod_id,
-                Product.prod_name,
-                PawnDetail.pawn_weight,
-                PawnDetail.pawn_amount,
-                PawnDetail.pawn_unit_price,
-            )
-            .join(Pawn, Account.cus_id == Pawn.cus_id)
-            .join(PawnDetail, Pawn.pawn_id == PawnDetail.pawn_id)
-            .join(Product, PawnDetail.prod_id == Product.prod_id)
-            .filter(Account.role == "user")
-        )
-
-        # If pawn_id is provided, filter the query
+        # Fetch all pawn records, or only the lines of pawn_id when provided
         if pawn_id:
-            pawn_query = pawn_query.filter(Pawn.pawn_id == pawn_id)
-
-        pawns = pawn_query.all()
+            statement = statements.PAWN_LINES_BY_PAWN_WITH_HISTORY if history else statements.PAWN_LINES_BY_PAWN
+            pawns = statements.fetch_rows(db, statement, {"pawn_id": pawn_id})
+        else:
+            pawns = statements.fetch_rows(db, statements.ALL_PAWN_LINES_WITH_HISTORY if history else statements.ALL_PAWN_LINES)
 
         # If no pawn records found, return a 404 response
         if not pawns:
@@ -917,8 +878,10 @@ class Staff:
             db.query(PawnDetail).filter(PawnDetail.pawn_id == pawn_id).delete()
             
             # Delete the pawn
+            cus_id = pawn.cus_id
             db.delete(pawn)
             db.commit()
+            change_feed.publish(db, "pawns", "delete", pawn_id, {"cus_id": cus_id})
             
             return ResponseModel(
                 code=200,
@@ -934,8 +897,8 @@ class Staff:
                 message=f"Failed to delete pawn: {str(e)}"
             )
 
-    def update_pawn(self, pawn_id: int, pawn_update: PatchPawn, db: Session, current_user: dict):
-        """Update an existing pawn"""
+    def update_pawn(self, pawn_id: int, pawn_update: PatchPawn, db: Session, current_user: dict, if_match: Optional[str] = None):
+        """Update an existing pawn; with if_match, only if it is still at that version (412 otherwise)"""
         try:
             # Check if pawn exists
             pawn = db.query(Pawn).filter(Pawn.pawn_id == pawn_id).first()
@@ -945,11 +908,17 @@ class Staff:
                     status="Error",
                     message=f"Pawn {pawn_id} not found"
                 )
+            etags.require_version(if_match, "pawn", pawn_id, pawn.version_id)
+            # Nothing is committed before the end: the pawn's UPDATE then runs with
+            # WHERE version_id = the version checked above and a concurrent edit
+            # fails the whole PATCH (412), customer fields included
+            customer_change = None
             
             # Update customer information if provided
             if pawn_update.cus_name or pawn_update.address or pawn_update.phone_number:
                 customer = db.query(Account).filter(Account.cus_id == pawn.cus_id).first()
                 if customer:
+                    old_phone = customer.phone_number
                     if pawn_update.cus_name:
                         customer.cus_name = pawn_update.cus_name
                     if pawn_update.address:
@@ -972,52 +941,54 @@ class Staff:
                             )
                         
                         customer.phone_number = pawn_update.phone_number
-                    db.commit()
+                    db.flush()
+                    customer_change = (customer.cus_id, old_phone)
             
             # Update pawn information
             if pawn_update.pawn_deposit is not None:
+                # A corrected loan amount moves the outstanding principal by the same delta
+                old_deposit = pawn.pawn_deposit or 0
+                balance = pawn.balance_due if pawn.balance_due is not None else old_deposit
+                pawn.balance_due = round(balance + pawn_update.pawn_deposit - old_deposit, 2)
                 pawn.pawn_deposit = pawn_update.pawn_deposit
             if pawn_update.pawn_date is not None:
                 pawn.pawn_date = pawn_update.pawn_date
             if pawn_update.pawn_expire_date is not None:
                 pawn.pawn_expire_date = pawn_update.pawn_expire_date
             
-            db.commit()
-            
-            # Update pawn details if provided
+            # Update pawn details if provided: only the lines that differ are written
+            lines, new_products, lines_changed = None, [], False
             if pawn_update.pawn_product_detail:
-                # Delete existing pawn details
-                db.query(PawnDetail).filter(PawnDetail.pawn_id == pawn_id).delete()
-                
-                # Add new pawn details
-                for product in pawn_update.pawn_product_detail:
-                    existing_product = db.query(Product).filter(
-                        Product.prod_name.ilike(product.prod_name)
-                    ).first()
-
-                    if not existing_product:
-                        prod = self.create_product(CreateProduct(prod_name=product.prod_name), db, current_user)
-                        prod_id = prod.prod_id
-                    else:
-                        prod_id = existing_product.prod_id
-
-                    pawn_detail = PawnDetail(
-                        pawn_id=pawn_id,
-                        prod_id=prod_id,
-                        pawn_weight=product.pawn_weight,
-                        pawn_amount=product.pawn_amount,
-                        pawn_unit_price=product.pawn_unit_price
-                    )
-                    db.add(pawn_detail)
-                
-                db.commit()
+                fields = ("pawn_weight", "pawn_amount", "pawn_unit_price")
+                products, new_products = line_diff.resolve_lines(db, pawn_update.pawn_product_detail, fields, current_user.get('id'))
+                diff = line_diff.sync_lines(db, PawnDetail, PawnDetail.pawn_id, pawn_id, products, fields)
+                lines = diff.summary()
+                lines_changed = bool(diff.inserts or diff.updates or diff.deletes)
+            if customer_change or lines_changed:
+                # Customer and line edits are edits of the pawn: bump its version too, which
+                # also puts the version check on the pawn when no header field changed
+                pawn.version_id = pawn.version_id + 1
+            
+            db.commit()
+            if customer_change:
+                invalidate_customer(db, *customer_change)
+            for product in new_products:
+                publish_product(db, product, op="insert")
+            change_feed.publish(db, "pawns", "update", pawn_id, {"cus_id": pawn.cus_id})
             
             return ResponseModel(
                 code=200,
                 status="Success",
-                message=f"Pawn {pawn_id} updated successfully"
+                message=f"Pawn {pawn_id} updated successfully",
+                result={"version": pawn.version_id, "lines": lines}
             )
             
+        except HTTPException:
+            db.rollback()
+            raise
+        except StaleDataError:
+            db.rollback()
+            raise etags.conflict("pawn", pawn_id)
         except Exception as e:
             db.rollback()
             return ResponseModel(
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import change_feed
+import database
+from entities import Product
+
+# Minimum trigram similarity (Jaccard) for a fuzzy autocomplete match
+PRODUCT_FUZZY_THRESHOLD = float(os.getenv("PRODUCT_FUZZY_THRESHOLD", "0.3"))
+
+@dataclass(slots=True)
+class CatalogProduct:
+    prod_id: int
+    prod_name: str
+    unit_price: Optional[float]
+    amount: Optional[int]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(prod_id=row.prod_id, prod_name=row.prod_name, unit_price=row.unit_price, amount=row.amount)
+
+    def as_dict(self) -> dict:
+        # Same keys as the /product listing
+        return {"id": self.prod_id, "name": self.prod_name, "price": self.unit_price, "amount": self.amount}
+
+def normalize(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ProductCatalog:
+    """
+    In-process product name index for autocomplete.
+
+    `_prefixes` is a sorted array of (token, prod_id) holding the whole
+    normalized name and each of its words, so a prefix lookup is one bisect
+    plus a scan of the matches. `_trigrams` maps each trigram to the products
+    containing it for typo-tolerant matching when prefixes run out.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._products: Dict[int, CatalogProduct] = {}
+        self._keys: Dict[int, str] = {}
+        self._prefixes: List[tuple] = []
+        self._trigrams = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _tokens(key: str) -> set:
+        return {key, *key.split(" ")}
+
+    def _add(self, product: CatalogProduct):
+        key = normalize(product.prod_name)
+        self._products[product.prod_id] = product
+        self._keys[product.prod_id] = key
+        for token in self._tokens(key):
+            insort(self._prefixes, (token, product.prod_id))
+        for gram in trigrams(key):
+            self._trigrams[gram].add(product.prod_id)
+
+    def _remove(self, prod_id: int):
+        key = self._keys.pop(prod_id, None)
+        self._products.pop(prod_id, None)
+        if key is None:
+            return
+        for token in self._tokens(key):
+            index = bisect_left(self._prefixes, (token, prod_id))
+            if index < len(self._prefixes) and self._prefixes[index] == (token, prod_id):
+                del self._prefixes[index]
+        for gram in trigrams(key):
+            ids = self._trigrams.get(gram)
+            if ids is not None:
+                ids.discard(prod_id)
+                if not ids:
+                    del self._trigrams[gram]
+
+    def load(self, db: Session):
+        """(Re)build the whole index from the products table."""
+        rows = db.connection().execute(
+            select(Product.prod_id, Product.prod_name, Product.unit_price, Product.amount)
+        ).all()
+        with self._lock:
+            self._products.clear()
+            self._keys.clear()
+            self._prefixes = []
+            self._trigrams = defaultdict(set)
+            for row in rows:
+                product = CatalogProduct.from_row(row)
+                key = normalize(product.prod_name)
+                self._products[product.prod_id] = product
+                self._keys[product.prod_id] = key
+                self._prefixes.extend((token, product.prod_id) for token in self._tokens(key))
+                for gram in trigrams(key):
+                    self._trigrams[gram].add(product.prod_id)
+            # One sort instead of an insort per token
+            self._prefixes.sort()
+            self.loaded = True
+
+    def upsert(self, product: CatalogProduct):
+        with self._lock:
+            self._remove(product.prod_id)
+            self._add(product)
+
+    def remove(self, prod_id: int):
+        with self._lock:
+            self._remove(prod_id)
+
+    def complete(self, term: str, limit: int = 10, fuzzy: bool = True) -> List[dict]:
+        """Products whose name or one of its words starts with `term`; trigram matches fill the rest."""
+        key = normalize(term)
+        if not key:
+            return []
+        with self._lock:
+            ranked = {}
+            index = bisect_left(self._prefixes, (key,))
+            while index < len(self._prefixes) and self._prefixes[index][0].startswith(key):
+                prod_id = self._prefixes[index][1]
+                # Whole-name prefix ranks above a match on a later word
+                rank = 0 if self._keys[prod_id].startswith(key) else 1
+                if rank < ranked.get(prod_id, 2):
+                    ranked[prod_id] = rank
+                index += 1
+            matches = sorted(ranked, key=lambda prod_id: (ranked[prod_id], self._keys[prod_id]))[:limit]
+
+            if fuzzy and len(matches) < limit:
+                query_grams = trigrams(key)
+                shared = defaultdict(int)
+                for gram in query_grams:
+                    for prod_id in self._trigrams.get(gram, ()):
+                        if prod_id not in ranked:
+                            shared[prod_id] += 1
+                scored = []
+                for prod_id, count in shared.items():
+                    similarity = count / (len(query_grams) + len(trigrams(self._keys[prod_id])) - count)
+                    if similarity >= PRODUCT_FUZZY_THRESHOLD:
+                        scored.append((-similarity, self._keys[prod_id], prod_id))
+                scored.sort()
+                matches.extend(prod_id for _, _, prod_id in scored[:limit - len(matches)])
+
+            return [self._products[prod_id].as_dict() for prod_id in matches]
+
+    def __len__(self):
+        return len(self._products)
+
+catalog = ProductCatalog()
+
+def publish_product(db: Session, product=None, deleted_id: Optional[int] = None, op: str = "update"):
+    """
+    Announce a committed product change on the change feed; every worker's catalog applies it.
+    Pass the refreshed Product after insert/update, or deleted_id after a delete.
+    """
+    if product is None:
+        change_feed.publish(db, "products", "delete", deleted_id)
+        return
+    change_feed.publish(db, "products", op, product.prod_id, {
+        "prod_name": product.prod_name,
+        "unit_price": product.unit_price,
+        "amount": product.amount,
+    })
+
+def _on_product_change(event: change_feed.ChangeEvent):
+    if event.op == "delete":
+        catalog.remove(event.id)
+    else:
+        catalog.upsert(CatalogProduct(event.id, event.data["prod_name"], event.data["unit_price"], event.data["amount"]))
+
+def reload_catalog():
+    with database.SessionLocal() as db:
+        catalog.load(db)
+    print(f"Product catalog loaded: {len(catalog)} products")
+
+change_feed.subscribe("products", _on_product_change)
+# Initial load, and a full reload whenever the feed reconnects (NOTIFYs may have been missed)
+change_feed.on_resync(lambda: asyncio.to_thread(reload_catalog))
@@ -1,12 +1,13 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 # from models import Account
-from database import get_db
+from database import get_db, get_read_db
 from response_model import ResponseModel
 from routes.oauth2.repository import get_current_user
 from routes.product.repository import Staff
 from routes.product.model import *
+import etags
 # from routes.user.model import CreatePawn 
 
 router = APIRouter(
@@ -25,19 +26,25 @@ def create_product(product_info: CreateProduct, db: Session = Depends(get_db), c
 
 @router.get("/product", response_model=ResponseModel)
 def get_all_product(
-    db: Session = Depends(get_db), 
+    response: Response,
+    db: Session = Depends(get_read_db), 
     current_user: dict = Depends(get_current_user),
     page: int = Query(1, ge=1, description="Page number (starts from 1)"),
     limit: int = Query(10, ge=1, le=100, description="Number of items per page (max 100)"),
-    search: Optional[str] = Query(None, description="Search products by name")
+    search: Optional[str] = Query(None, description="Search products by name"),
+    if_none_match: Optional[str] = Header(None),
 ):
     staff.is_staff(current_user)
+    tag = etags.products_tag(db)
+    if etags.not_modified(if_none_match, tag):
+        return etags.not_modified_response(tag)
+    response.headers["ETag"] = tag
     return staff.get_product(db=db, page=page, limit=limit, search=search)
 
 @router.get("/product/search", response_model=ResponseModel)
 def search_products(
     search_term: str = Query(..., min_length=1, description="Search term for product name"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user),
     page: int = Query(1, ge=1, description="Page number (starts from 1)"),
     limit: int = Query(10, ge=1, le=100, description="Number of items per page (max 100)")
@@ -48,6 +55,19 @@ def search_products(
     staff.is_staff(current_user)
     return staff.search_products(db=db, search_term=search_term, page=page, limit=limit)
 
+@router.get("/product/autocomplete", response_model=ResponseModel)
+def autocomplete_products(
+    term: str = Query(..., min_length=1, description="Beginning of the product name being typed"),
+    limit: int = Query(10, ge=1, le=50, description="Maximum number of suggestions"),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Product name suggestions served from the in-memory catalog (no database query once loaded)
+    """
+    staff.is_staff(current_user)
+    return staff.autocomplete_products(db=db, term=term, limit=limit)
+
 @router.put("/product", response_model=ResponseModel)
 def update_product(
     updated_product: UpdateProduct, 
@@ -10,6 +10,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from collections import defaultdict
 from typing import Dict, Any
 import math
+from routes.product.catalog import catalog, publish_product
 
 class Staff:
     def is_staff(self, current_user: dict):
@@ -37,19 +38,22 @@ class Staff:
                 db.add(product)
                 db.commit()
                 db.refresh(product)
+                publish_product(db, product, op="insert")
                 
             else: 
                 product = Product(prod_name = func.lower(product_info.prod_name), user_id = current_user['id'])
                 db.add(product)
                 db.commit()
                 db.refresh(product)
+                publish_product(db, product, op="insert")
                 return product
             
             
             return ResponseModel(
                 code=200,
                 status="Success",
-                message="Product created successfully"
+                message="Product created successfully",
+                result={"prod_id": product.prod_id}
             )
             
     # ========== Get All Products with Pagination and Search ==========
@@ -185,6 +189,32 @@ class Staff:
             message=f"Found {total_count} products matching '{search_term}'"
         )
         
+    # ========== Autocomplete Product Names ==========
+    def autocomplete_products(self, db: Session, term: str, limit: int = 10):
+        """
+        Prefix (then fuzzy) product name suggestions from the in-memory catalog.
+        Until the catalog has loaded, falls back to a prefix query.
+        """
+        if catalog.loaded:
+            products = catalog.complete(term, limit)
+        else:
+            rows = db.query(Product).filter(Product.prod_name.ilike(f"{term.strip()}%")).order_by(Product.prod_name).limit(limit).all()
+            products = [
+                {
+                    "id": product.prod_id,
+                    "name": product.prod_name,
+                    "price": product.unit_price,
+                    "amount": product.amount,
+                }
+                for product in rows
+            ]
+
+        return ResponseModel(
+            code=200,
+            status="Success",
+            result=products
+        )
+        
     # ========== Update Existing Product ==========
     def update_product(
         self,
@@ -223,6 +253,7 @@ class Staff:
 
         db.commit()
         db.refresh(product)
+        publish_product(db, product)
 
         return ResponseModel(
             code=200,
@@ -253,6 +284,7 @@ class Staff:
         try:
             db.delete(product)
             db.commit()
+            publish_product(db, deleted_id=product_id)
             return ResponseModel(
                 code=200,
                 status="Success",
@@ -0,0 +1,54 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from database import get_db, get_read_db
+from response_model import ResponseModel, render_response
+from routes.oauth2.repository import get_current_user
+from routes.valuation.repository import Staff
+from routes.valuation.model import MetalPriceIn
+
+router = APIRouter(
+    tags=["Valuation"],
+)
+
+staff = Staff()
+
+""" Metal Prices """
+@router.get("/valuation/prices", response_model=ResponseModel)
+def get_prices(
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return staff.get_prices(db)
+
+@router.put("/valuation/prices", response_model=ResponseModel)
+def update_prices(
+    prices: List[MetalPriceIn],
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return staff.update_prices(prices, db)
+
+""" Revaluation """
+@router.post("/valuation/revalue", response_model=ResponseModel)
+def revalue(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return staff.revalue(db)
+
+@router.get("/valuation/at-risk", response_model=ResponseModel)
+def get_at_risk(
+    min_ltv: float = Query(0.8, ge=0, description="Minimum loan-to-value (amount due / collateral value)"),
+    sort: str = Query("ltv", description="ltv, amount_due or shortfall (all descending)"),
+    page: int = Query(1, ge=1, description="Page number"),
+    limit: int = Query(20, ge=1, le=200, description="Items per page"),
+    cus_id: Optional[int] = Query(None, description="Only this customer's pawns"),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    staff.is_staff(current_user)
+    return render_response(staff.get_at_risk(db, min_ltv, sort, page, limit, cus_id))
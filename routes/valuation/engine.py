@@ -0,0 +1,232 @@
+"""
+Collateral revaluation.
+
+revalue() prices every active pawn's collateral from the metal price table
+and stores value and loan-to-value in pawn_valuations, a snapshot the
+at-risk listing reads instead of recomputing per request. Detail lines are
+fetched as one row of column arrays; weight strings and product names are
+parsed once per distinct value and broadcast back with NumPy, and lines are
+summed per pawn with bincount. The amount owed comes from the interest
+engine (routes/pawn/interest.py) under the default rate schedule.
+
+A line is valued at grams x pawn_amount x price per gram when its weight and
+the metal / karat in the product name can be read and a price exists;
+otherwise at its appraisal at pawn time (pawn_unit_price x pawn_amount).
+Like pawn_unit_price, pawn_weight is per piece.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+import database
+import metrics
+from entities import MetalPrice, Pawn, PawnDetail, PawnValuation, Product
+from routes.pawn import interest
+
+VALUATION_ENABLED = os.getenv("VALUATION_ENABLED", "true").lower() == "true"
+REVALUATION_INTERVAL_MINUTES = float(os.getenv("REVALUATION_INTERVAL_MINUTES", "60"))
+# Local stand-in for a market price feed: [{"metal": "gold", "karat": 24, "price_per_gram": 80.5}, ...]
+METAL_PRICE_FILE = os.getenv("METAL_PRICE_FILE")
+
+""" Parsing """
+UNIT_GRAMS = {
+    "": 1.0, "g": 1.0, "gr": 1.0, "gram": 1.0, "grams": 1.0, "ក្រាម": 1.0,
+    "kg": 1000.0,
+    "chi": 3.75, "ជី": 3.75,
+    "damlung": 37.5, "តម្លឹង": 37.5,
+    "hun": 0.375, "ហ៊ុន": 0.375,
+}
+# "1,000" / "1,250.5" group thousands; any other comma is a decimal comma ("1,5")
+WEIGHT_PART = re.compile(r"(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:[.,]\d+)?)\s*([^\d\s.,]*)")
+THOUSANDS = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+KARAT = re.compile(r"(\d{1,2})\s*(?:k|kt|karat)\b", re.IGNORECASE)
+FINE_GOLD = re.compile(r"99\.?99|999\.?9")
+METAL_WORDS = {
+    "gold": ("gold", "មាស"),
+    "silver": ("silver", "ប្រាក់"),
+    "platinum": ("platinum", "ផ្លាទីន"),
+}
+
+def parse_grams(weight: str) -> float:
+    """'5g', '1.5kg', '1,000g', '2 chi 3 hun' -> grams; 0 when nothing can be read."""
+    grams = 0.0
+    for number, unit in WEIGHT_PART.findall(weight or ""):
+        factor = UNIT_GRAMS.get(unit.casefold())
+        if factor is None:
+            return 0.0
+        number = number.replace(",", "") if THOUSANDS.fullmatch(number) else number.replace(",", ".")
+        grams += float(number) * factor
+    return grams
+
+def parse_metal(name: str):
+    """(metal, karat) read from a product name; karat 0 when not stated, metal None when unknown."""
+    name = (name or "").casefold()
+    match = KARAT.search(name)
+    karat = int(match.group(1)) if match else (24 if FINE_GOLD.search(name) else 0)
+    for metal, words in METAL_WORDS.items():
+        if any(word in name for word in words):
+            return metal, karat
+    return ("gold", karat) if karat else (None, 0)
+
+""" Prices """
+def load_prices(db: Session) -> Dict[tuple, float]:
+    rows = db.connection().execute(select(MetalPrice.metal, MetalPrice.karat, MetalPrice.price_per_gram)).all()
+    return {(row.metal, row.karat): row.price_per_gram for row in rows}
+
+def price_per_gram(prices: Dict[tuple, float], metal: Optional[str], karat: int) -> float:
+    if metal is None:
+        return np.nan
+    return prices.get((metal, karat), prices.get((metal, 0), np.nan))
+
+def upsert_prices(db: Session, entries: List[dict]):
+    """Insert or update (metal, karat) prices; the caller commits."""
+    if not entries:
+        return
+    now = datetime.utcnow()
+    statement = insert(MetalPrice).values([
+        {"metal": entry["metal"].casefold(), "karat": entry.get("karat") or 0, "price_per_gram": entry["price_per_gram"], "updated_at": now}
+        for entry in entries
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[MetalPrice.metal, MetalPrice.karat],
+        set_={"price_per_gram": statement.excluded.price_per_gram, "updated_at": statement.excluded.updated_at},
+    ))
+
+_price_file_mtime = None
+
+def load_price_file(db: Session) -> bool:
+    """Upsert METAL_PRICE_FILE when it changed since the last call; True when prices were updated."""
+    global _price_file_mtime
+    if not METAL_PRICE_FILE or not os.path.exists(METAL_PRICE_FILE):
+        return False
+    mtime = os.path.getmtime(METAL_PRICE_FILE)
+    if mtime == _price_file_mtime:
+        return False
+    with open(METAL_PRICE_FILE, encoding="utf-8") as feed:
+        upsert_prices(db, json.load(feed))
+    db.commit()
+    _price_file_mtime = mtime
+    return True
+
+""" Revaluation """
+# Every detail line of an open pawn as one row of parallel arrays (same filter as interest.load_book)
+LINE_COLUMNS = select(
+    func.array_agg(PawnDetail.pawn_id),
+    func.array_agg(PawnDetail.prod_id),
+    func.array_agg(func.coalesce(PawnDetail.pawn_weight, "")),
+    func.array_agg(func.coalesce(PawnDetail.pawn_amount, 1)),
+    func.array_agg(func.coalesce(PawnDetail.pawn_unit_price, 0)),
+).select_from(PawnDetail).join(Pawn, Pawn.pawn_id == PawnDetail.pawn_id).where(Pawn.redeemed_at.is_(None))
+
+INSERT_VALUATIONS = text("""
+INSERT INTO pawn_valuations (pawn_id, cus_id, principal, amount_due, collateral_value, ltv, valued_at)
+SELECT pawn_id, NULLIF(cus_id, 0), principal, amount_due, collateral_value, NULLIF(ltv, 'NaN'::float8), :valued_at
+FROM unnest(
+    CAST(:pawn_ids AS integer[]), CAST(:cus_ids AS integer[]), CAST(:principal AS float8[]),
+    CAST(:amount_due AS float8[]), CAST(:collateral_value AS float8[]), CAST(:ltv AS float8[])
+) AS v(pawn_id, cus_id, principal, amount_due, collateral_value, ltv)
+""")
+
+_duration = metrics.gauge("pawn_revaluation_seconds", "Duration of the last collateral revaluation")
+
+def collateral_values(db: Session, pawn_ids: np.ndarray) -> np.ndarray:
+    """Collateral value per pawn, aligned with pawn_ids."""
+    line_pawn, line_prod, weights, amounts, unit_prices = (value or [] for value in db.connection().execute(LINE_COLUMNS).one())
+    if not len(pawn_ids) or not line_pawn:
+        return np.zeros(len(pawn_ids))
+    line_pawn = np.array(line_pawn, dtype=np.int64)
+    amounts = np.array(amounts, dtype=np.float64)
+    appraised = np.array(unit_prices, dtype=np.float64) * amounts
+
+    unique_weights, weight_index = np.unique(np.array(weights, dtype=str), return_inverse=True)
+    grams = np.array([parse_grams(weight) for weight in unique_weights.tolist()])[weight_index]
+
+    unique_prods, prod_index = np.unique(np.array(line_prod, dtype=np.int64), return_inverse=True)
+    names = dict(db.connection().execute(
+        select(Product.prod_id, Product.prod_name).where(Product.prod_id.in_(unique_prods.tolist()))
+    ).all())
+    prices = load_prices(db)
+    per_gram = np.array(
+        [price_per_gram(prices, *parse_metal(names.get(prod_id))) for prod_id in unique_prods.tolist()],
+        dtype=np.float64,
+    )[prod_index]
+
+    market = grams * amounts * per_gram
+    line_value = np.where(np.isnan(market) | (grams <= 0), appraised, market)
+
+    # Sum lines into their pawn's slot; lines of pawns not in pawn_ids are dropped
+    order = np.argsort(pawn_ids)
+    slot = order[np.searchsorted(pawn_ids, line_pawn, sorter=order).clip(0, len(pawn_ids) - 1)]
+    known = pawn_ids[slot] == line_pawn
+    return np.bincount(slot[known], weights=line_value[known], minlength=len(pawn_ids))
+
+def revalue(db: Session, as_of: Optional[date] = None) -> Optional[dict]:
+    """Rebuild pawn_valuations in one transaction; None when another revaluation is running."""
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": database.REVALUATION_LOCK_KEY}).scalar():
+        db.rollback()
+        return None
+    started = time.perf_counter()
+    as_of = as_of or date.today()
+
+    book = interest.load_book(db)
+    amount_due = interest.price_book(book, as_of, interest.get_schedule())["amount_due"]
+    value = collateral_values(db, book.pawn_id)
+    ltv = np.divide(amount_due, value, out=np.full(len(book), np.nan), where=value > 0)
+
+    valued_at = datetime.utcnow()
+    db.execute(text("DELETE FROM pawn_valuations"))
+    if len(book):
+        db.execute(INSERT_VALUATIONS, {
+            "pawn_ids": book.pawn_id.tolist(),
+            "cus_ids": book.cus_id.tolist(),
+            "principal": book.principal.tolist(),
+            "amount_due": amount_due.tolist(),
+            "collateral_value": np.round(value, 2).tolist(),
+            "ltv": np.round(ltv, 4).tolist(),
+            "valued_at": valued_at,
+        })
+    db.commit()
+    _duration.set(time.perf_counter() - started)
+
+    return {
+        "pawns": len(book),
+        "unvalued": int(np.isnan(ltv).sum()),
+        "amount_due": round(float(amount_due.sum()), 2),
+        "collateral_value": round(float(value.sum()), 2),
+        "valued_at": valued_at,
+    }
+
+def run_scheduled():
+    """Revalue unless another worker already did within the interval and prices haven't changed."""
+    with database.SessionLocal() as db:
+        prices_changed = load_price_file(db)
+        last_run = db.execute(select(func.max(PawnValuation.valued_at))).scalar()
+        db.commit()
+        if not prices_changed and last_run is not None and datetime.utcnow() - last_run < timedelta(minutes=REVALUATION_INTERVAL_MINUTES * 0.9):
+            return None
+        return revalue(db)
+
+async def revalue_forever(initial_delay: float = 30.0):
+    """Long-running task: pick up the price file and revalue every REVALUATION_INTERVAL_MINUTES."""
+    if not VALUATION_ENABLED:
+        return
+    await asyncio.sleep(initial_delay)
+    while not database.db_state.ready:
+        await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            summary = await asyncio.to_thread(run_scheduled)
+            if summary:
+                print(f"Revalued {summary['pawns']} pawn(s)")
+        except Exception as e:
+            print(f"Revaluation failed: {e}")
+        await asyncio.sleep(REVALUATION_INTERVAL_MINUTES * 60)
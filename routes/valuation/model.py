@@ -0,0 +1,6 @@
+from pydantic import BaseModel, Field
+
+class MetalPriceIn(BaseModel):
+    metal: str = Field(..., min_length=1, description="gold, silver, platinum, ...")
+    karat: int = Field(0, ge=0, le=24, description="0 = price used when the karat is unknown")
+    price_per_gram: float = Field(..., gt=0)
@@ -0,0 +1,124 @@
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from entities import Account, MetalPrice, PawnValuation
+from response_model import ResponseModel
+from routes.valuation import engine
+from routes.valuation.model import MetalPriceIn
+import statements
+
+AT_RISK_COLUMNS = (
+    PawnValuation.pawn_id,
+    PawnValuation.cus_id,
+    Account.cus_name,
+    Account.phone_number,
+    PawnValuation.principal,
+    PawnValuation.amount_due,
+    PawnValuation.collateral_value,
+    PawnValuation.ltv,
+)
+
+# Sort keys for the at-risk listing, all descending. Pawns with no valued collateral
+# have no LTV and are left out (the revaluation summary counts them as unvalued).
+AT_RISK_ORDER = {
+    "ltv": PawnValuation.ltv,
+    "amount_due": PawnValuation.amount_due,
+    "shortfall": PawnValuation.amount_due - PawnValuation.collateral_value,
+}
+
+class Staff:
+    def is_staff(self, current_user: dict):
+        if current_user['role'] != 'admin':
+            raise HTTPException(
+                status_code=403,
+                detail="Permission denied",
+            )
+
+    def get_prices(self, db: Session):
+        prices = statements.fetch_mappings(
+            db,
+            select(MetalPrice.metal, MetalPrice.karat, MetalPrice.price_per_gram, MetalPrice.updated_at)
+            .order_by(MetalPrice.metal, MetalPrice.karat.desc())
+        )
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message="Metal prices retrieved successfully",
+            result=prices
+        )
+
+    def update_prices(self, prices: List[MetalPriceIn], db: Session):
+        """Upsert prices, then revalue the book against them"""
+        engine.upsert_prices(db, [price.model_dump() for price in prices])
+        db.commit()
+        summary = engine.revalue(db)
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"{len(prices)} price(s) updated" + ("" if summary else "; a revaluation is already running"),
+            result=summary
+        )
+
+    def revalue(self, db: Session):
+        summary = engine.revalue(db)
+        if summary is None:
+            return ResponseModel(
+                code=409,
+                status="Error",
+                message="A revaluation is already running"
+            )
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"Revalued {summary['pawns']} pawn(s)",
+            result=summary
+        )
+
+    def get_at_risk(
+        self,
+        db: Session,
+        min_ltv: float = 0.8,
+        sort: str = "ltv",
+        page: int = 1,
+        limit: int = 20,
+        cus_id: Optional[int] = None,
+    ):
+        """Pawns from the latest revaluation snapshot whose LTV is at least min_ltv, riskiest first"""
+        if sort not in AT_RISK_ORDER:
+            raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(AT_RISK_ORDER)}")
+
+        query = (
+            select(*AT_RISK_COLUMNS)
+            .outerjoin(Account, PawnValuation.cus_id == Account.cus_id)
+            .where(PawnValuation.ltv >= min_ltv)
+        )
+        if cus_id:
+            query = query.where(PawnValuation.cus_id == cus_id)
+
+        total_count = statements.count_rows(db, query)
+        items = statements.fetch_mappings(
+            db,
+            query.order_by(AT_RISK_ORDER[sort].desc(), PawnValuation.pawn_id)
+            .offset((page - 1) * limit)
+            .limit(limit)
+        )
+        valued_at = db.connection().execute(select(func.max(PawnValuation.valued_at))).scalar()
+
+        return ResponseModel(
+            code=200,
+            status="Success",
+            message=f"{total_count} pawn(s) at or above {min_ltv:.0%} loan-to-value",
+            result={
+                "valued_at": valued_at,
+                "items": items,
+                "pagination": {
+                    "current_page": page,
+                    "total_pages": (total_count + limit - 1) // limit,
+                    "total_count": total_count,
+                    "limit": limit,
+                },
+            }
+        )
@@ -0,0 +1,246 @@
+"""
+Hot read queries built once at import time.
+
+Each statement is a module-level select() whose variable parts are bind
+parameters, so SQLAlchemy generates its cache key from an already-built
+construct and finds the compiled SQL in the engine's compiled cache instead
+of rebuilding a Query chain per request. Cache hits and misses are exported
+as db_compiled_cache_total (see database.instrument_statement_cache). With
+psycopg 3 the identical SQL text is also prepared server-side after
+DB_PREPARE_THRESHOLD executions on a connection.
+
+Read paths run these through fetch_rows/fetch_mappings: the statement goes
+straight to the session's Connection as Core, so projection rows come back
+as plain tuples without ORM result processing or identity-map work. Writes
+keep using the ORM session.
+
+Listings read the active tables only; the *_WITH_HISTORY forms add the
+archive partitions (see lifecycle.py) with the same columns.
+"""
+from sqlalchemy import and_, bindparam, func, select, union_all
+
+from entities import (
+    Account,
+    AccountArchive,
+    Order,
+    OrderArchive,
+    OrderDetail,
+    OrderDetailArchive,
+    Pawn,
+    PawnArchive,
+    PawnDetail,
+    PawnDetailArchive,
+    Product,
+)
+
+def fetch_rows(db, statement, params=None):
+    """All rows of a read-only select() as Core Row tuples (attribute and index access)."""
+    return db.connection().execute(statement, params or {}).all()
+
+def fetch_mappings(db, statement, params=None):
+    """All rows of a read-only select() as dicts keyed by column name, ready for the response."""
+    return [dict(row) for row in db.connection().execute(statement, params or {}).mappings()]
+
+def fetch_one(db, statement, params=None):
+    return db.connection().execute(statement, params or {}).first()
+
+def count_rows(db, statement, params=None) -> int:
+    """COUNT(*) over a select(), e.g. the unpaginated form of a listing."""
+    counted = select(func.count()).select_from(statement.order_by(None).subquery())
+    return db.connection().execute(counted, params or {}).scalar_one()
+
+PAWN_LINE_COLUMNS = (
+    Account.cus_id,
+    Account.cus_name,
+    Account.phone_number,
+    Account.address,
+    Pawn.pawn_id,
+    Pawn.pawn_deposit,
+    Pawn.pawn_date,
+    Pawn.pawn_expire_date,
+    Product.prod_id,
+    Product.prod_name,
+    PawnDetail.pawn_weight,
+    PawnDetail.pawn_amount,
+    PawnDetail.pawn_unit_price,
+)
+
+ORDER_LINE_COLUMNS = (
+    Order.order_id,
+    Order.order_deposit,
+    Order.order_date,
+    Product.prod_name,
+    Product.prod_id,
+    OrderDetail.order_weight,
+    OrderDetail.order_amount,
+    OrderDetail.product_sell_price,
+    OrderDetail.product_labor_cost,
+    OrderDetail.product_buy_price,
+)
+
+""" Pawns """
+# Every pawn line of every customer: /pawn listing and /pawn/print
+ALL_PAWN_LINES = (
+    select(*PAWN_LINE_COLUMNS)
+    .select_from(Account)
+    .join(Pawn, Account.cus_id == Pawn.cus_id)
+    .join(PawnDetail, Pawn.pawn_id == PawnDetail.pawn_id)
+    .join(Product, PawnDetail.prod_id == Product.prod_id)
+    .where(Account.role == "user")
+)
+
+# params: pawn_id
+PAWN_LINES_BY_PAWN = ALL_PAWN_LINES.where(Pawn.pawn_id == bindparam("pawn_id"))
+
+# params: cus_id
+CUSTOMER_PAWN_LINES = (
+    select(
+        Pawn.pawn_id,
+        Pawn.pawn_deposit,
+        Pawn.pawn_date,
+        Pawn.pawn_expire_date,
+        Product.prod_name,
+        Product.prod_id,
+        PawnDetail.pawn_weight,
+        PawnDetail.pawn_amount,
+        PawnDetail.pawn_unit_price,
+    )
+    .join(PawnDetail, Pawn.pawn_id == PawnDetail.pawn_id)
+    .join(Product, PawnDetail.prod_id == Product.prod_id)
+    .where(Pawn.cus_id == bindparam("cus_id"))
+)
+
+""" Orders """
+# params: cus_ids (list)
+ORDER_LINES_BY_CUSTOMERS = (
+    select(*ORDER_LINE_COLUMNS)
+    .select_from(OrderDetail)
+    .join(Order, OrderDetail.order_id == Order.order_id)
+    .join(Product, OrderDetail.prod_id == Product.prod_id)
+    .where(Order.cus_id.in_(bindparam("cus_ids", expanding=True)))
+)
+
+# params: cus_id
+CUSTOMER_ORDER_LINES = (
+    select(*ORDER_LINE_COLUMNS)
+    .select_from(Order)
+    .join(OrderDetail, Order.order_id == OrderDetail.order_id)
+    .join(Product, OrderDetail.prod_id == Product.prod_id)
+    .where(Order.cus_id == bindparam("cus_id"))
+)
+
+# Every order line of every customer: /order/print
+ALL_ORDER_PRINT_LINES = (
+    select(
+        Account.cus_id,
+        Account.cus_name,
+        Account.phone_number,
+        Account.address,
+        Order.order_id,
+        Order.order_deposit,
+        Order.order_date,
+        Product.prod_id,
+        Product.prod_name,
+        OrderDetail.order_weight,
+        OrderDetail.order_amount,
+        OrderDetail.product_sell_price,
+        OrderDetail.product_labor_cost,
+        OrderDetail.product_buy_price,
+    )
+    .select_from(Account)
+    .join(Order, Account.cus_id == Order.cus_id)
+    .join(OrderDetail, Order.order_id == OrderDetail.order_id)
+    .join(Product, OrderDetail.prod_id == Product.prod_id)
+    .where(Account.role == "user")
+)
+
+# params: order_id
+ORDER_PRINT_LINES_BY_ORDER = ALL_ORDER_PRINT_LINES.where(Order.order_id == bindparam("order_id"))
+
+""" Archive """
+# Archived rows keep their customer's id; the customer may still be active or
+# archived with them, and the product may have been deleted since.
+def _archived_customer(column):
+    return func.coalesce(getattr(Account, column), getattr(AccountArchive, column)).label(column)
+
+ARCHIVED_PAWN_LINES = (
+    select(
+        PawnArchive.cus_id,
+        _archived_customer("cus_name"),
+        _archived_customer("phone_number"),
+        _archived_customer("address"),
+        PawnArchive.pawn_id,
+        PawnArchive.pawn_deposit,
+        PawnArchive.pawn_date,
+        PawnArchive.pawn_expire_date,
+        PawnDetailArchive.prod_id,
+        Product.prod_name,
+        PawnDetailArchive.pawn_weight,
+        PawnDetailArchive.pawn_amount,
+        PawnDetailArchive.pawn_unit_price,
+    )
+    .select_from(PawnArchive)
+    # Joining on the partition key too pairs matching yearly partitions
+    .join(PawnDetailArchive, and_(PawnArchive.pawn_id == PawnDetailArchive.pawn_id, PawnArchive.pawn_date == PawnDetailArchive.pawn_date))
+    .outerjoin(Product, PawnDetailArchive.prod_id == Product.prod_id)
+    .outerjoin(Account, PawnArchive.cus_id == Account.cus_id)
+    .outerjoin(AccountArchive, PawnArchive.cus_id == AccountArchive.cus_id)
+)
+
+ARCHIVED_ORDER_PRINT_LINES = (
+    select(
+        OrderArchive.cus_id,
+        _archived_customer("cus_name"),
+        _archived_customer("phone_number"),
+        _archived_customer("address"),
+        OrderArchive.order_id,
+        OrderArchive.order_deposit,
+        OrderArchive.order_date,
+        OrderDetailArchive.prod_id,
+        Product.prod_name,
+        OrderDetailArchive.order_weight,
+        OrderDetailArchive.order_amount,
+        OrderDetailArchive.product_sell_price,
+        OrderDetailArchive.product_labor_cost,
+        OrderDetailArchive.product_buy_price,
+    )
+    .select_from(OrderArchive)
+    .join(OrderDetailArchive, and_(OrderArchive.order_id == OrderDetailArchive.order_id, OrderArchive.order_date == OrderDetailArchive.order_date))
+    .outerjoin(Product, OrderDetailArchive.prod_id == Product.prod_id)
+    .outerjoin(Account, OrderArchive.cus_id == Account.cus_id)
+    .outerjoin(AccountArchive, OrderArchive.cus_id == AccountArchive.cus_id)
+)
+
+ALL_PAWN_LINES_WITH_HISTORY = union_all(ALL_PAWN_LINES, ARCHIVED_PAWN_LINES)
+
+# params: pawn_id
+PAWN_LINES_BY_PAWN_WITH_HISTORY = union_all(
+    PAWN_LINES_BY_PAWN,
+    ARCHIVED_PAWN_LINES.where(PawnArchive.pawn_id == bindparam("pawn_id")),
+)
+
+ALL_ORDER_PRINT_LINES_WITH_HISTORY = union_all(ALL_ORDER_PRINT_LINES, ARCHIVED_ORDER_PRINT_LINES)
+
+# params: order_id
+ORDER_PRINT_LINES_BY_ORDER_WITH_HISTORY = union_all(
+    ORDER_PRINT_LINES_BY_ORDER,
+    ARCHIVED_ORDER_PRINT_LINES.where(OrderArchive.order_id == bindparam("order_id")),
+)
+
+""" Customers """
+CUSTOMER_COLUMNS = (Account.cus_id, Account.cus_name, Account.address, Account.phone_number)
+
+# Customers holding at least one pawn / order; listings add their search filters
+CUSTOMERS_WITH_PAWNS = (
+    select(*CUSTOMER_COLUMNS)
+    .join(Pawn, Account.cus_id == Pawn.cus_id)
+    .where(Account.role == "user")
+    .distinct()
+)
+
+CUSTOMERS_WITH_ORDERS = (
+    select(*CUSTOMER_COLUMNS)
+    .join(Order, Account.cus_id == Order.cus_id)
+    .where(Account.role == "user")
+    .distinct()
+)
@@ -0,0 +1,318 @@
+"""
+Synthetic data generator for pawn shop benchmark workloads.
+
+Streams deterministic, realistic rows straight into Postgres with COPY:
+
+    python synthetic_data.py --seed 42 --customers 200000 --pawns 1000000 --orders 500000
+
+The same seed and sizes always produce the same rows. New ids start after the
+current maximum of each table, so runs can be appended to an existing database.
+"""
+import argparse
+import random
+import time
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import text
+
+import entities
+from database import engine
+
+KHMER_FAMILY_NAMES = ["សុខ", "ចាន់", "គីម", "ហេង", "លី", "លឹម", "ជា", "មាស", "ពេជ្រ", "កែវ", "សេង", "វណ្ណ", "ផល", "ឈឹម", "ទេព"]
+KHMER_GIVEN_NAMES = ["ដារ៉ា", "សុភា", "វុទ្ធី", "ស្រីមុំ", "បុប្ផា", "រិទ្ធី", "ចាន់ណា", "សុខា", "ពិសី", "កុសល", "នារី", "វីរៈ", "ស្រីនាង", "សំណាង", "ធារី"]
+LATIN_FAMILY_NAMES = ["Sok", "Chan", "Kim", "Heng", "Ly", "Lim", "Chea", "Meas", "Pich", "Keo", "Seng", "Vann", "Phal", "Chhim", "Tep"]
+LATIN_GIVEN_NAMES = ["Dara", "Sophea", "Vuthy", "Srey Mom", "Bopha", "Rithy", "Channa", "Sokha", "Pisey", "Kosal", "Nary", "Virak", "Srey Neang", "Samnang", "Theary"]
+ADDRESSES = [
+    "ភ្នំពេញ", "កណ្ដាល", "តាកែវ", "កំពង់ចាម", "សៀមរាប", "បាត់ដំបង", "កំពត", "ព្រៃវែង",
+    "Phnom Penh", "Kandal", "Takeo", "Kampong Cham", "Siem Reap", "Battambang", "Kampot", "Prey Veng",
+]
+PHONE_PREFIXES = ["012", "017", "077", "092", "096", "010", "015", "016", "069", "070", "081", "085", "086", "087", "088", "089", "093", "098", "023"]
+
+PRODUCT_KINDS = ["ខ្សែក", "ចិញ្ចៀន", "ខ្សែដៃ", "ក្រវិល", "ប៉ោង", "necklace", "ring", "bracelet", "earring", "pendant", "anklet", "bangle"]
+PRODUCT_METALS = ["មាស", "gold", "white gold", "silver", "platinum"]
+PRODUCT_KARATS = ["24k", "22k", "18k", "14k", "10k", "99.99"]
+PRODUCT_STYLES = ["", "plain", "chain", "twist", "flower", "heart", "dragon", "leaf", "star", "pearl"]
+
+PAWN_TERMS_DAYS = [30, 30, 30, 60, 60, 90, 90, 180, 365]
+PHONE_STRIDE = 735871  # odd and not a multiple of 5, so it is coprime to 10**6
+COPY_CHUNK_ROWS = 50000
+
+def _table_rng(seed: int, table: str) -> random.Random:
+    """Each table gets an independent stream so sizes of one table never shift another."""
+    return random.Random(f"{seed}:{table}")
+
+def _zipf_cum_weights(n: int, skew: float):
+    return list(accumulate(1.0 / (rank + 1) ** skew for rank in range(n)))
+
+def _pick(rng: random.Random, cum_weights, total: float) -> int:
+    return bisect(cum_weights, rng.random() * total)
+
+def _fmt_ts(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+def customer_name(rng: random.Random) -> str:
+    if rng.random() < 0.6:
+        return f"{rng.choice(KHMER_FAMILY_NAMES)} {rng.choice(KHMER_GIVEN_NAMES)}"
+    return f"{rng.choice(LATIN_FAMILY_NAMES)} {rng.choice(LATIN_GIVEN_NAMES)}"
+
+def phone_number(index: int) -> str:
+    """Unique Cambodian-style phone number (e.g. "023 217 879") for a customer index."""
+    prefix = PHONE_PREFIXES[index % len(PHONE_PREFIXES)]
+    number = (index // len(PHONE_PREFIXES) * PHONE_STRIDE + 217879) % 1_000_000
+    return f"{prefix} {number // 1000:03d} {number % 1000:03d}"
+
+def product_names(rng: random.Random, count: int):
+    """Unique lower-case product names, the same way create_product stores them."""
+    names = []
+    seen = set()
+    attempt = 0
+    while len(names) < count:
+        parts = [rng.choice(PRODUCT_METALS), rng.choice(PRODUCT_KINDS), rng.choice(PRODUCT_KARATS), rng.choice(PRODUCT_STYLES)]
+        name = " ".join(part for part in parts if part).lower()
+        if name in seen:
+            attempt += 1
+            name = f"{name} #{attempt}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+class CopyStream:
+    """File-like adapter that feeds generated COPY lines to psycopg2 without materializing them."""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ""
+        self._offset = 0
+        self.rows = 0
+
+    def _fill(self) -> bool:
+        chunk = []
+        for line in self._lines:
+            chunk.append(line)
+            if len(chunk) >= COPY_CHUNK_ROWS:
+                break
+        if not chunk:
+            return False
+        self.rows += len(chunk)
+        self._buffer = self._buffer[self._offset:] + "".join(chunk)
+        self._offset = 0
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) - self._offset < size:
+            if not self._fill():
+                break
+        end = len(self._buffer) if size < 0 else self._offset + size
+        data = self._buffer[self._offset:end]
+        self._offset += len(data)
+        return data
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+class SyntheticDataGenerator:
+    def __init__(
+        self,
+        seed: int = 42,
+        customers: int = 10000,
+        products: int = 2000,
+        pawns: int = 50000,
+        orders: int = 25000,
+        max_lines: int = 4,
+        days: int = 730,
+        skew: float = 1.1,
+        start: datetime = datetime(2024, 1, 1),
+    ):
+        self.seed = seed
+        self.customers = customers
+        self.products = products
+        self.pawns = pawns
+        self.orders = orders
+        self.max_lines = max(1, min(max_lines, products))
+        self.days = days
+        self.skew = skew
+        self.start = start
+
+    # ========== Row Generators ==========
+    def account_lines(self, first_id: int):
+        rng = _table_rng(self.seed, "accounts")
+        for index in range(self.customers):
+            created = self.start + timedelta(seconds=rng.randrange(self.days * 86400))
+            created_at = _fmt_ts(created)
+            yield (
+                f"{first_id + index}\t{customer_name(rng)}\t{rng.choice(ADDRESSES)}\t"
+                f"{phone_number(first_id + index)}\t\\N\tuser\t{created_at}\t{created_at}\n"
+            )
+
+    def product_lines(self, first_id: int):
+        rng = _table_rng(self.seed, "products")
+        for index, name in enumerate(product_names(rng, self.products)):
+            created_at = _fmt_ts(self.start + timedelta(seconds=rng.randrange(86400 * 30)))
+            unit_price = round(rng.uniform(20, 2500), 2)
+            yield f"{first_id + index}\t{name}\t{unit_price}\t{rng.randint(0, 50)}\t\\N\t{created_at}\t{created_at}\n"
+
+    def _ticket_products(self, rng: random.Random, cum_weights, total: float):
+        """Distinct, popularity-skewed product offsets for one ticket (details are keyed by prod_id)."""
+        wanted = rng.randint(1, self.max_lines)
+        chosen = []
+        while len(chosen) < wanted:
+            offset = _pick(rng, cum_weights, total)
+            if offset not in chosen:
+                chosen.append(offset)
+        return chosen
+
+    def pawn_lines(self, first_id: int, first_cus_id: int, first_prod_id: int, details: list):
+        """Yield `pawns` rows and collect matching `pawn_details` rows into `details` chunks."""
+        rng = _table_rng(self.seed, "pawns")
+        customer_weights = _zipf_cum_weights(self.customers, 0.6)
+        customer_total = customer_weights[-1]
+        product_weights = _zipf_cum_weights(self.products, self.skew)
+        product_total = product_weights[-1]
+        for index in range(self.pawns):
+            pawn_id = first_id + index
+            cus_id = first_cus_id + _pick(rng, customer_weights, customer_total)
+            pawn_date = self.start + timedelta(seconds=rng.randrange(self.days * 86400))
+            expire_date = pawn_date + timedelta(days=rng.choice(PAWN_TERMS_DAYS))
+            deposit = round(rng.choice((0, 0, 0, 10, 20, 50, 100)) * rng.random(), 2)
+            created_at = _fmt_ts(pawn_date)
+            for offset in self._ticket_products(rng, product_weights, product_total):
+                weight = round(rng.uniform(0.5, 40), 2)
+                details.append(
+                    f"{pawn_id}\t{first_prod_id + offset}\t{weight}g\t{rng.randint(1, 3)}\t"
+                    f"{round(weight * rng.uniform(40, 75), 2)}\t{created_at}\n"
+                )
+            yield f"{pawn_id}\t{cus_id}\t{deposit}\t{created_at}\t{_fmt_ts(expire_date)}\n"
+
+    def order_lines(self, first_id: int, first_cus_id: int, first_prod_id: int, details: list):
+        """Yield `orders` rows and collect matching `order_details` rows into `details` chunks."""
+        rng = _table_rng(self.seed, "orders")
+        customer_weights = _zipf_cum_weights(self.customers, 0.6)
+        customer_total = customer_weights[-1]
+        product_weights = _zipf_cum_weights(self.products, self.skew)
+        product_total = product_weights[-1]
+        for index in range(self.orders):
+            order_id = first_id + index
+            cus_id = first_cus_id + _pick(rng, customer_weights, customer_total)
+            order_date = _fmt_ts(self.start + timedelta(seconds=rng.randrange(self.days * 86400)))
+            for offset in self._ticket_products(rng, product_weights, product_total):
+                weight = round(rng.uniform(0.5, 40), 2)
+                buy_price = round(weight * rng.uniform(40, 70), 2)
+                labor_cost = round(rng.uniform(5, 60), 2)
+                sell_price = round((buy_price + labor_cost) * rng.uniform(1.05, 1.3), 2)
+                details.append(
+                    f"{order_id}\t{first_prod_id + offset}\t{weight}g\t{rng.randint(1, 3)}\t"
+                    f"{sell_price}\t{labor_cost}\t{buy_price}\t{order_date}\t{order_date}\n"
+                )
+            yield f"{order_id}\t{cus_id}\t{round(rng.uniform(0, 200), 2)}\t{order_date}\n"
+
+    # ========== Loading ==========
+    def _copy(self, cursor, table: str, columns: str, lines) -> int:
+        stream = CopyStream(lines)
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", stream)
+        return stream.rows
+
+    def _copy_with_details(self, cursor, header_table, header_columns, header_lines, detail_table, detail_columns, details):
+        """COPY header rows, flushing the detail rows they produce in bounded batches."""
+        rows = detail_rows = 0
+        batch = []
+        for line in header_lines:
+            batch.append(line)
+            if len(batch) >= COPY_CHUNK_ROWS:
+                rows += self._copy(cursor, header_table, header_columns, batch)
+                detail_rows += self._copy(cursor, detail_table, detail_columns, details)
+                batch.clear()
+                details.clear()
+        if batch:
+            rows += self._copy(cursor, header_table, header_columns, batch)
+            detail_rows += self._copy(cursor, detail_table, detail_columns, details)
+            details.clear()
+        return rows, detail_rows
+
+    def load(self, db_engine) -> dict:
+        entities.Base.metadata.create_all(db_engine)
+        with db_engine.connect() as conn:
+            first_cus_id = conn.execute(text("SELECT COALESCE(MAX(cus_id), 0) + 1 FROM accounts")).scalar()
+            first_prod_id = conn.execute(text("SELECT COALESCE(MAX(prod_id), 0) + 1 FROM products")).scalar()
+            first_pawn_id = conn.execute(text("SELECT COALESCE(MAX(pawn_id), 0) + 1 FROM pawns")).scalar()
+            first_order_id = conn.execute(text("SELECT COALESCE(MAX(order_id), 0) + 1 FROM orders")).scalar()
+
+        counts = {}
+        raw = db_engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            counts["accounts"] = self._copy(
+                cursor, "accounts",
+                "cus_id, cus_name, address, phone_number, password, role, created_at, updated_at",
+                self.account_lines(first_cus_id),
+            )
+            counts["products"] = self._copy(
+                cursor, "products",
+                "prod_id, prod_name, unit_price, amount, user_id, created_at, updated_at",
+                self.product_lines(first_prod_id),
+            )
+            details = []
+            counts["pawns"], counts["pawn_details"] = self._copy_with_details(
+                cursor,
+                "pawns", "pawn_id, cus_id, pawn_deposit, pawn_date, pawn_expire_date",
+                self.pawn_lines(first_pawn_id, first_cus_id, first_prod_id, details),
+                "pawn_details", "pawn_id, prod_id, pawn_weight, pawn_amount, pawn_unit_price, created_at",
+                details,
+            )
+            counts["orders"], counts["order_details"] = self._copy_with_details(
+                cursor,
+                "orders", "order_id, cus_id, order_deposit, order_date",
+                self.order_lines(first_order_id, first_cus_id, first_prod_id, details),
+                "order_details",
+                "order_id, prod_id, order_weight, order_amount, product_sell_price, product_labor_cost, product_buy_price, order_date, created_at",
+                details,
+            )
+            # Explicit ids bypass the serial sequences, so move them past the new rows
+            for table, column in (("accounts", "cus_id"), ("products", "prod_id"), ("pawns", "pawn_id"), ("orders", "order_id")):
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), (SELECT MAX({column}) FROM {table}))"
+                )
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+        return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Load deterministic synthetic pawn shop data with COPY.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--pawns", type=int, default=50000)
+    parser.add_argument("--orders", type=int, default=25000)
+    parser.add_argument("--max-lines", type=int, default=4, help="Maximum product lines per ticket")
+    parser.add_argument("--days", type=int, default=730, help="Spread of pawn/order dates in days")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for product popularity")
+    args = parser.parse_args()
+
+    if engine is None:
+        raise SystemExit("Database engine is not available. Check DATABASE_URL.")
+
+    generator = SyntheticDataGenerator(
+        seed=args.seed,
+        customers=args.customers,
+        products=args.products,
+        pawns=args.pawns,
+        orders=args.orders,
+        max_lines=args.max_lines,
+        days=args.days,
+        skew=args.skew,
+    )
+    started = time.perf_counter()
+    counts = generator.load(engine)
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    for table, rows in counts.items():
+        print(f"{table}: {rows} rows")
+    print(f"Loaded {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9) * 60:,.0f} rows/min)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from routes.pawn.interest import PawnBook, RateSchedule, day_number, get_schedule, price_book
+
+AS_OF = date(2026, 3, 1)
+TODAY = day_number(AS_OF)
+
+def book(*pawns):
+    """pawns: (principal, days since pawned, days until expiry, balance due, interest paid)"""
+    principal, age, remaining, balance, paid = (np.array(column) for column in zip(*pawns))
+    return PawnBook(
+        pawn_id=np.arange(1, len(pawns) + 1),
+        cus_id=np.ones(len(pawns), dtype=np.int64),
+        principal=principal.astype(np.float64),
+        start_day=TODAY - age,
+        expire_day=TODAY + remaining,
+        balance_due=balance.astype(np.float64),
+        interest_paid=paid.astype(np.float64),
+    )
+
+BOOK = book(
+    (1000, 45, 15, 1000, 0),    # 1.5 months in, not yet due
+    (500, 10, -4, 500, 0),      # 4 days past expiry
+    (2000, 3, 27, 1200, 100),   # partly repaid, paid more interest than has accrued
+)
+
+def test_monthly_flat_with_grace_and_penalty():
+    schedule = RateSchedule(monthly_rate=0.03, grace_days=5, min_days=30, overdue_monthly_rate=0.06)
+    priced = price_book(BOOK, AS_OF, schedule)
+
+    # 45 - 5 grace = 40 days -> two started months; 10 - 5 = 5 -> one; 3 days -> the 30-day minimum
+    assert priced["charged_days"].tolist() == [60, 30, 30]
+    assert priced["overdue_days"].tolist() == [0, 4, 0]
+    # principal x 0.1% a day x charged days
+    assert priced["interest"].tolist() == pytest.approx([60, 15, 60])
+    # 500 x 0.2% a day x 4 overdue days
+    assert priced["penalty"].tolist() == pytest.approx([0, 4, 0])
+    # Interest paid (100) exceeds what accrued (60): nothing is charged, and never less than zero
+    assert priced["charges_due"].tolist() == pytest.approx([60, 19, 0])
+    assert priced["amount_due"].tolist() == pytest.approx([1060, 519, 1200])
+
+def test_daily_schedule_charges_elapsed_days():
+    priced = price_book(BOOK, AS_OF, get_schedule("daily"))
+
+    assert priced["charged_days"].tolist() == [45, 10, 3]
+    assert priced["interest"].tolist() == pytest.approx([45, 5, 6])
+    assert priced["penalty"].tolist() == pytest.approx([0, 0, 0])
+    assert priced["amount_due"].tolist() == pytest.approx([1045, 505, 1200])
+
+def test_built_in_schedules_differ_only_by_grace():
+    flat = price_book(BOOK, AS_OF, get_schedule("monthly_flat"))
+    grace = price_book(BOOK, AS_OF, get_schedule("monthly_flat_grace"))
+
+    # 45 days is two months without grace and, with 5 grace days, still two (40 days)
+    assert flat["charged_days"].tolist() == [60, 30, 30]
+    assert grace["charged_days"].tolist() == [60, 30, 30]
+    one_month_and_a_bit = book((1000, 33, 0, 1000, 0))
+    assert price_book(one_month_and_a_bit, AS_OF, get_schedule("monthly_flat"))["charged_days"].tolist() == [60]
+    assert price_book(one_month_and_a_bit, AS_OF, get_schedule("monthly_flat_grace"))["charged_days"].tolist() == [30]
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        RateSchedule(method="weekly")
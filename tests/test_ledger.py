@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from routes.pawn.ledger import apply_payments
+
+PAID_AT = datetime(2026, 1, 15)
+
+def header(balance_due=1000.0, interest_paid=0.0):
+    return {"cus_id": 7, "balance_due": balance_due, "interest_paid": interest_paid, "last_payment_at": None, "redeemed_at": None}
+
+def entry(kind, amount, pawn_id=1):
+    return {"pawn_id": pawn_id, "kind": kind, "amount": amount, "paid_at": PAID_AT}
+
+def test_principal_above_balance_is_rejected():
+    headers = {1: header(balance_due=500)}
+    batch = apply_payments(headers, [entry("principal", 600)])
+
+    assert batch.payments == []
+    assert batch.errors == ["#0: principal payment 600 exceeds the balance due 500 of pawn 1"]
+    assert headers[1]["balance_due"] == 500
+    assert "touched" not in headers[1]
+
+def test_redemption_below_balance_is_rejected():
+    batch = apply_payments({1: header(balance_due=500)}, [entry("redemption", 499.99)])
+
+    assert batch.payments == []
+    assert batch.errors == ["#0: redemption 499.99 doesn't cover the balance due 500 of pawn 1"]
+
+def test_redemption_overpayment_is_split_into_interest():
+    headers = {1: header(balance_due=500, interest_paid=20)}
+    batch = apply_payments(headers, [entry("redemption", 530)])
+
+    assert batch.errors == []
+    [payment] = batch.payments
+    assert (payment["principal_paid"], payment["interest_paid"], payment["balance_after"]) == (500, 30, 0)
+    assert headers[1]["balance_due"] == 0
+    assert headers[1]["interest_paid"] == 50
+    assert headers[1]["redeemed_at"] == PAID_AT
+
+def test_running_balance_across_one_batch():
+    headers = {1: header(balance_due=1000), 2: header(balance_due=300)}
+    batch = apply_payments(headers, [
+        entry("interest", 30),
+        entry("principal", 250.5),
+        entry("principal", 100, pawn_id=2),
+        entry("fee", 5),
+        entry("principal", 749.5),
+    ], posted_by=3)
+
+    assert batch.errors == []
+    assert [(payment["pawn_id"], payment["balance_after"]) for payment in batch.payments] == [
+        (1, 1000), (1, 749.5), (2, 200), (1, 749.5), (1, 0),
+    ]
+    assert all(payment["posted_by"] == 3 for payment in batch.payments)
+    assert headers[1]["interest_paid"] == 35
+    # Paying the principal off in full redeems the pawn
+    assert headers[1]["redeemed_at"] == PAID_AT
+    assert headers[2]["balance_due"] == 200 and headers[2]["redeemed_at"] is None
+
+def test_payment_after_redemption_in_the_same_batch_is_rejected():
+    batch = apply_payments({1: header(balance_due=100)}, [entry("redemption", 100), entry("interest", 10)])
+
+    assert len(batch.payments) == 1
+    assert batch.errors == ["#1: pawn 1 is already redeemed"]
@@ -0,0 +1,90 @@
+"""
+PATCH of customer fields together with product lines, against a real
+database (DATABASE_URL). Both steps commit before the version bump, which
+used to find the pawn/order expired and fail with a 500.
+"""
+import os
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("needs DATABASE_URL", allow_module_level=True)
+
+from sqlalchemy import delete, select
+
+import database
+import entities
+from entities import Account, Order, OrderDetail, Pawn, PawnDetail, Product
+from routes.order.model import PatchOrder
+from routes.order.repository import Staff as OrderStaff
+from routes.pawn.model import PatchPawn
+from routes.pawn.repository import Staff as PawnStaff
+from routes.user.model import BuyProducts, CreateOrder, CreatePawn, PawnProductDetail
+
+ADMIN = {"id": None, "role": "admin"}
+
+@pytest.fixture
+def db():
+    entities.Base.metadata.create_all(database.engine)
+    with database.SessionLocal() as session:
+        yield session
+
+@pytest.fixture
+def tag():
+    return uuid.uuid4().hex[:10]
+
+def _cleanup(db, cus_id, prod_names):
+    db.execute(delete(PawnDetail).where(PawnDetail.pawn_id.in_(select(Pawn.pawn_id).where(Pawn.cus_id == cus_id))))
+    db.execute(delete(OrderDetail).where(OrderDetail.order_id.in_(select(Order.order_id).where(Order.cus_id == cus_id))))
+    db.execute(delete(Pawn).where(Pawn.cus_id == cus_id))
+    db.execute(delete(Order).where(Order.cus_id == cus_id))
+    db.execute(delete(Account).where(Account.cus_id == cus_id))
+    db.execute(delete(Product).where(Product.prod_name.in_(prod_names)))
+    db.commit()
+
+def test_patch_pawn_customer_and_lines(db, tag):
+    staff = PawnStaff()
+    names = [f"ring-{tag}", f"chain-{tag}"]
+    created = staff.create_pawn(CreatePawn(
+        phone_number=f"p{tag}", cus_name="Before", address="A",
+        pawn_date=date.today(), pawn_expire_date=date.today() + timedelta(days=30), pawn_deposit=100,
+        pawn_product_detail=[PawnProductDetail(prod_name=names[0], pawn_weight="1g", pawn_amount=1, pawn_unit_price=100)],
+    ), db, ADMIN)
+    pawn_id, cus_id = created.result["pawn_id"], created.result["cus_id"]
+    try:
+        version = db.get(Pawn, pawn_id).version_id
+        updated = staff.update_pawn(pawn_id, PatchPawn(
+            cus_name="After",
+            pawn_product_detail=[PawnProductDetail(prod_name=names[1], pawn_weight="2g", pawn_amount=1, pawn_unit_price=50)],
+        ), db, ADMIN)
+
+        assert updated.code == 200, updated.message
+        assert updated.result["version"] == version + 1
+        assert updated.result["lines"] == {"inserted": 1, "updated": 0, "deleted": 1, "unchanged": 0}
+        assert db.get(Account, cus_id).cus_name == "After"
+    finally:
+        _cleanup(db, cus_id, names)
+
+def test_patch_order_customer_and_lines(db, tag):
+    staff = OrderStaff()
+    names = [f"ring-{tag}", f"chain-{tag}"]
+    created = staff.create_order(CreateOrder(
+        phone_number=f"o{tag}", cus_name="Before", address="A", order_deposit=10,
+        order_product_detail=[BuyProducts(prod_name=names[0], order_weight="1g", order_amount=1)],
+    ), db, ADMIN)
+    order_id, cus_id = created.result["order_id"], created.result["cus_id"]
+    try:
+        version = db.get(Order, order_id).version_id
+        updated = staff.update_order(order_id, PatchOrder(
+            address="B",
+            order_product_detail=[BuyProducts(prod_name=names[1], order_weight="2g", order_amount=2)],
+        ), db, ADMIN)
+
+        assert updated.code == 200, updated.message
+        assert updated.result["version"] == version + 1
+        assert updated.result["lines"] == {"inserted": 1, "updated": 0, "deleted": 1, "unchanged": 0}
+        assert db.get(Account, cus_id).address == "B"
+    finally:
+        _cleanup(db, cus_id, names)
@@ -0,0 +1,39 @@
+import pytest
+
+from routes.valuation.engine import parse_grams, parse_metal
+
+@pytest.mark.parametrize("weight, grams", [
+    ("5g", 5),
+    ("1.5kg", 1500),
+    ("2 chi 3 hun", 8.625),
+    ("2chi3hun", 8.625),
+    ("1 damlung", 37.5),
+    ("5 ជី", 18.75),
+    ("1 តម្លឹង 2 ហ៊ុន", 38.25),
+    ("10 ក្រាម", 10),
+    ("1,000g", 1000),
+    ("1,250.5 g", 1250.5),
+    ("1,5g", 1.5),
+    ("3", 3),
+    ("5 oz", 0),
+    ("2 chi 1 oz", 0),
+    ("", 0),
+    (None, 0),
+])
+def test_parse_grams(weight, grams):
+    assert parse_grams(weight) == pytest.approx(grams)
+
+@pytest.mark.parametrize("name, metal", [
+    ("Gold ring 18K", ("gold", 18)),
+    ("ខ្សែក មាស 24k", ("gold", 24)),
+    ("chain 99.99", ("gold", 24)),
+    ("bracelet 9999", ("gold", 24)),
+    ("silver bangle", ("silver", 0)),
+    ("ចិញ្ចៀន ប្រាក់", ("silver", 0)),
+    ("platinum band 14kt", ("platinum", 14)),
+    ("ring 14 karat", ("gold", 14)),
+    ("phone", (None, 0)),
+    (None, (None, 0)),
+])
+def test_parse_metal(name, metal):
+    assert parse_metal(name) == metal